@@ -0,0 +1,103 @@
+"""
+PII マスキング処理のベンチマーク
+
+AI Guardrails API のノートブックの mask_personal_information（検出ごとに文字列全体をスライスして作り直す実装）と
+genai_pii_masking.mask_personal_information（1 回の走査）を、テキストの大きさと検出数を変えて比較します。
+
+使い方:
+    python bench_pii_masking.py --sizes 10000,100000,1000000 --density 400
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from genai_pii_masking import mask_personal_information
+
+SAMPLES = [
+    ("PERSON", "Ethan Hunt"),
+    ("ADDRESS", "456 Oak Avenue, Los Angeles, CA 90210"),
+    ("EMAIL", "ethan.hunt.vtuber@streammail.net"),
+    ("TELEPHONE_NUMBER", "123-456-7890"),
+]
+FILLER = "Alright, time for this stealth mission. Let's see if this game's AI is smarter than real security systems! "
+
+
+def current_mask_personal_information(original_text, guardrails_result):
+    """
+    ノートブックの mask_personal_information（表示処理を除く）
+    """
+    masked_text = original_text
+    pii_results = guardrails_result.data.results.personally_identifiable_information
+    if pii_results:
+        sorted_pii = sorted(pii_results, key=lambda x: x.offset, reverse=True)
+        for pii_item in sorted_pii:
+            start_pos = pii_item.offset
+            end_pos = start_pos + pii_item.length
+            pii_type = pii_item.label
+            if pii_type == "PERSON":
+                mask = "### [PERSON] ###"
+            elif pii_type == "ADDRESS":
+                mask = "### [ADDRESS] ###"
+            elif pii_type == "EMAIL":
+                mask = "### [EMAIL] ###"
+            elif pii_type == "TELEPHONE_NUMBER":
+                mask = "### [PHONE] ###"
+            else:
+                mask = "### [PII] ###"
+            masked_text = masked_text[:start_pos] + mask + masked_text[end_pos:]
+    return masked_text
+
+
+def make_case(size, detections_per_100kb, seed=0):
+    """
+    約 size 文字のテキストと、apply_guardrails のレスポンスと同じ形の検出結果を作ります。
+    """
+    rng = random.Random(seed)
+    count = max(1, size * detections_per_100kb // 100000)
+    parts = []
+    items = []
+    length = 0
+    gap = max(1, size // count)
+    for _ in range(count):
+        filler = (FILLER * (gap // len(FILLER) + 1))[:gap]
+        parts.append(filler)
+        length += len(filler)
+        label, value = rng.choice(SAMPLES)
+        items.append(SimpleNamespace(offset=length, length=len(value), label=label, text=value, score=0.99))
+        parts.append(value)
+        length += len(value)
+    text = "".join(parts)
+    response = SimpleNamespace(data=SimpleNamespace(results=SimpleNamespace(personally_identifiable_information=items)))
+    return text, response
+
+
+def measure(function, repeat, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PII マスキング処理のベンチマーク")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--density", type=int, default=400, help="100 KB あたりの検出数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'chars':>9} {'detections':>10} {'current (ms)':>13} {'single pass (ms)':>17} {'speedup':>8}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        text, response = make_case(size, args.density)
+        assert current_mask_personal_information(text, response) == mask_personal_information(text, response)
+        current = measure(current_mask_personal_information, args.repeat, text, response)
+        single_pass = measure(mask_personal_information, args.repeat, text, response)
+        detections = len(response.data.results.personally_identifiable_information)
+        print(f"{len(text):>9} {detections:>10} {current * 1000:>13.2f} {single_pass * 1000:>17.2f} "
+              f"{current / single_pass:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+チャットのリクエストのシリアライズのマイクロベンチマーク（genai_request_template.py）
+
+documents の件数を変えて 1 KB〜1 MB のリクエストを作り、リクエストごとに message だけが変わる場合の
+ボディの作成時間を次の経路で比較します。
+
+- object model: サンプルと同じく CohereChatRequest / ChatDetails / OnDemandServingMode を作り、SDK と同じく
+  BaseClient.sanitize_for_serialization + json.dumps でシリアライズ（OCI SDK がインストールされている場合のみ）
+- dict + dumps_wire: ChatDetails と同じ構造の dict を作って GenAiHttpClient と同じ dumps_wire でシリアライズ
+- template: ChatTemplate.render（静的な部分はシリアライズ済み）
+- + sha256: 署名に使うボディの SHA-256（x-content-sha256）も求める場合
+
+各ケースを --repeats 回計測し、中央値と最小〜最大の幅（中央値に対する割合）を表示します。
+幅が重なるケースの差は計測の誤差の範囲です。
+
+使い方:
+    python bench_request_template.py --sizes 1000,10000,100000,1000000 --repeats 7
+"""
+import argparse
+import hashlib
+import json
+import statistics
+import time
+
+from genai_benchmark import DOCUMENT_SNIPPETS
+from genai_http_client import dumps_wire
+from genai_request_template import ChatTemplate
+
+SYSTEM_MESSAGE = "あなたはIT業界に精通した優秀なテクニカルライターです。"
+HISTORY = [("USER", "オラクルとはどんな会社ですか？"),
+           ("CHATBOT", "Oracleは、エンタープライズIT市場における最大手のベンダーの一つです。")]
+
+
+def documents_for_size(size):
+    """
+    リクエスト全体がおよそ size バイトになる件数の documents
+    """
+    documents = []
+    while len(dumps_wire(build_dict("x" * 60, documents))) < size:
+        snippet = DOCUMENT_SNIPPETS[len(documents) % len(DOCUMENT_SNIPPETS)]
+        documents.append({"title": f"{snippet['title']} ({len(documents)})", "snippet": snippet["snippet"],
+                          "website": snippet["website"]})
+    return documents
+
+
+def build_dict(message, documents, model_id="cohere.command-a-03-2025", compartment_id="ocid1.compartment.oc1..bench"):
+    chat_history = [{"role": "SYSTEM", "message": SYSTEM_MESSAGE}]
+    chat_history += [{"role": role, "message": text} for role, text in HISTORY]
+    return {
+        "compartmentId": compartment_id,
+        "servingMode": {"servingType": "ON_DEMAND", "modelId": model_id},
+        "chatRequest": {
+            "apiFormat": "COHERE", "message": message, "maxTokens": 1000, "isStream": False, "temperature": 0.75,
+            "topP": 0.7, "topK": 0, "frequencyPenalty": 1.0, "isEcho": True, "chatHistory": chat_history,
+            "documents": documents,
+        },
+    }
+
+
+def build_models(models, message, documents, model_id="cohere.command-a-03-2025",
+                 compartment_id="ocid1.compartment.oc1..bench"):
+    """
+    oci_genai_cohere_chat_example.py と同じ手順で ChatDetails を作ります。
+    """
+    chat_request = models.CohereChatRequest()
+    chat_request.message = message
+    chat_request.max_tokens = 1000
+    chat_request.is_stream = False
+    chat_request.temperature = 0.75
+    chat_request.top_p = 0.7
+    chat_request.top_k = 0
+    chat_request.frequency_penalty = 1.0
+    chat_request.is_echo = True
+    chat_request.chat_history = [models.CohereSystemMessage(role="SYSTEM", message=SYSTEM_MESSAGE)] + [
+        models.CohereUserMessage(role=role, message=text) if role == "USER"
+        else models.CohereChatBotMessage(role=role, message=text) for role, text in HISTORY]
+    chat_request.documents = documents
+    chat_detail = models.ChatDetails()
+    chat_detail.serving_mode = models.OnDemandServingMode(model_id=model_id)
+    chat_detail.compartment_id = compartment_id
+    chat_detail.chat_request = chat_request
+    return chat_detail
+
+
+def measure(function, min_time):
+    """
+    1 回あたりの平均時間（秒）。min_time 秒以上になるまで繰り返します。
+    """
+    count = 0
+    start = time.perf_counter()
+    while True:
+        function(count)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / count
+
+
+def measure_repeats(function, min_time, repeats):
+    """
+    measure を repeats 回繰り返し、(中央値, 最小値, 最大値) を返します。
+    """
+    samples = [measure(function, min_time) for _ in range(repeats)]
+    return statistics.median(samples), min(samples), max(samples)
+
+
+def load_models():
+    try:
+        from genai_client_factory import inference_models
+        return inference_models()
+    except Exception:
+        return None
+
+
+def sdk_serializer():
+    """
+    SDK がリクエストのボディを作るときと同じ処理（BaseClient.call_api の sanitize_for_serialization の後に json.dumps）
+    をする関数。BaseClient の作成には認証情報が必要なため、シリアライズで使う型の対応表だけを
+    BaseClient.__init__ と同じように設定したインスタンスを使います。
+    """
+    from oci.base_client import BaseClient, merge_type_mappings
+    from oci.generative_ai_inference.models import generative_ai_inference_type_mapping
+
+    base_client = BaseClient.__new__(BaseClient)
+    base_client.complex_type_mappings = generative_ai_inference_type_mapping
+    base_client.type_mappings = merge_type_mappings(BaseClient.primitive_type_map, generative_ai_inference_type_mapping)
+    return lambda model: json.dumps(base_client.sanitize_for_serialization(model)).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャットのリクエストのシリアライズの比較（テンプレートとオブジェクトモデル）")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--min-time", type=float, default=0.2, help="1 回の計測時間（秒）")
+    parser.add_argument("--repeats", type=int, default=5, help="ケースごとの計測の回数")
+    args = parser.parse_args()
+
+    models = load_models()
+    if models is None:
+        print("OCI SDK is not installed: skipping the object model case")
+    else:
+        serialize = sdk_serializer()
+    print(f"{'size':>9} {'docs':>5} {'case':<28} {'us/request':>11} {'spread':>14} {'MB/s':>8} {'vs dict':>8}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        documents = documents_for_size(size)
+        template = ChatTemplate(build_dict("", documents))
+        body_size = len(template.render("オラクルのリレーショナルデータベースについて教えてください。（0）"))
+
+        def message(index):
+            return f"オラクルのリレーショナルデータベースについて教えてください。（{index}）"
+
+        cases = []
+        if models is not None:
+            cases.append(("object model", lambda i: serialize(build_models(models, message(i), documents))))
+            cases.append(("object model + sha256",
+                          lambda i: hashlib.sha256(serialize(build_models(models, message(i), documents))).digest()))
+        cases += [
+            ("dict + dumps_wire", lambda i: dumps_wire(build_dict(message(i), documents))),
+            ("dict + dumps_wire + sha256", lambda i: hashlib.sha256(dumps_wire(build_dict(message(i), documents)))
+             .digest()),
+            ("template", lambda i: template.render(message(i))),
+            ("template + sha256", lambda i: template.render_with_digest(message(i))),
+        ]
+        assert template.details(message(1)) == build_dict(message(1), documents)
+        if models is not None:
+            assert json.loads(serialize(build_models(models, message(1), documents))) == build_dict(message(1), documents)
+        results = {label: measure_repeats(function, args.min_time, args.repeats) for label, function in cases}
+        baseline = results["dict + dumps_wire"][0]
+        for label, (seconds, fastest, slowest) in results.items():
+            spread = f"-{(seconds - fastest) / seconds:.0%}/+{(slowest - seconds) / seconds:.0%}"
+            print(f"{body_size:>9} {len(documents):>5} {label:<28} {seconds * 1e6:>11.1f} {spread:>14} "
+                  f"{body_size / seconds / 1e6:>8.1f} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+ローカルの検索インデックス（genai_retrieval.py）のベンチマーク
+
+決定的なスタブの埋め込みで合成したドキュメントのインデックスを構築し、次の値を計測します。
+
+- インデックスの構築時間（埋め込みとファイルへの書き込み）とファイルサイズ
+- 検索の遅延（message の埋め込み、コサイン類似度の計算と上位 k 件の選択、ドキュメントの読み込み）のパーセンタイル
+- インデックスを開く前後と検索後の RSS（最大 RSS を含む）
+- 自分自身のスニペットで検索したときに上位 1 件が自分自身になる割合（正しく検索できているかの確認）
+- 1 リクエストで送る documents のバイト数（上位 k 件と、サンプルのように固定の 3 件を送る場合）
+
+使い方:
+    python bench_retrieval.py --documents 100000 --queries 1000 --k 3
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from genai_async_engine import percentile
+from genai_benchmark import DOCUMENT_SNIPPETS
+from genai_retrieval import Retriever, StubEmbedder, VectorIndex, synthetic_documents
+
+
+def rss_mb():
+    """
+    現在の RSS（MB）。/proc がない環境では最大 RSS を返します。
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return max_rss_mb()
+
+
+def max_rss_mb():
+    # Linux は KB、macOS はバイト単位
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value / (1024 * 1024) if os.uname().sysname == "Darwin" else value / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカルの検索インデックスの構築時間・検索の遅延・RSS の計測")
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--index-dir", help="インデックスを書き出すディレクトリ（省略時は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    path = args.index_dir or tempfile.mkdtemp(prefix="genai_retrieval_")
+    embedder = StubEmbedder(args.dimensions)
+    try:
+        rss_start = rss_mb()
+        start = time.perf_counter()
+        VectorIndex.build(path, synthetic_documents(args.documents), embedder, count=args.documents).close()
+        build_time = time.perf_counter() - start
+        file_mb = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+        print(f"documents: {args.documents}, dimensions: {args.dimensions}, k: {args.k}")
+        print(f"build: {build_time:.2f} sec ({args.documents / build_time:.0f} docs/sec), index files {file_mb:.1f} MB")
+
+        rss_before = rss_mb()
+        index = VectorIndex(path)
+        retriever = Retriever(index, embedder, k=args.k)
+        rng = random.Random(1)
+        embed_times, search_times, total_times = [], [], []
+        hits = 0
+        document_bytes = 0
+        for _ in range(args.queries):
+            target = rng.randrange(args.documents)
+            message = index.document(target)["snippet"]
+            start = time.perf_counter()
+            query = embedder.embed([message], input_type="SEARCH_QUERY")[0]
+            embedded = time.perf_counter()
+            results = index.search(query, args.k)
+            searched = time.perf_counter()
+            documents = [index.document(row) for row, _ in results]
+            end = time.perf_counter()
+            embed_times.append(embedded - start)
+            search_times.append(searched - embedded)
+            total_times.append(end - start)
+            hits += results[0][0] == target
+            document_bytes += len(json.dumps(documents, ensure_ascii=False).encode("utf-8"))
+        rss_after = rss_mb()
+        sample = "AI ベクトル検索のパフォーマンス・チューニング"
+        sample_titles = [document["title"] for document in retriever.select(sample)]
+        index.close()
+
+        for label, values in (("embed", embed_times), ("search", search_times), ("total", total_times)):
+            values.sort()
+            print(f"query {label:<6}: p50 {percentile(values, 50) * 1000:7.3f} ms  "
+                  f"p95 {percentile(values, 95) * 1000:7.3f} ms  p99 {percentile(values, 99) * 1000:7.3f} ms")
+        print(f"recall@1 (self query): {hits / args.queries:.3f}")
+        print(f"RSS: start {rss_start:.1f} MB, before open {rss_before:.1f} MB, after queries {rss_after:.1f} MB, "
+              f"max {max_rss_mb():.1f} MB")
+        fixed = len(json.dumps(DOCUMENT_SNIPPETS, ensure_ascii=False).encode("utf-8"))
+        print(f"documents per request: top-{args.k} {document_bytes / args.queries:.0f} bytes "
+              f"(always sending the 3 fixed snippets: {fixed} bytes)")
+        print(f"sample: {sample} -> {sample_titles}")
+    finally:
+        if args.index_dir is None:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
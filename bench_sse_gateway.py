@@ -0,0 +1,227 @@
+"""
+SSE ゲートウェイ（genai_sse_gateway.py）の負荷試験
+
+モックサーバーとゲートウェイをそれぞれ別プロセスで起動し、同時ストリーム数を段階的に増やしながら次の値を計測します。
+
+- 最終イベント（finishReason）まで受信できたストリーム数と失敗数
+- クライアントから見た最初のイベントまでの時間（TTFT）とイベント間隔の最大値のパーセンタイル
+- ゲートウェイのプロセスの CPU 時間と RSS（ストリームあたりのメモリ）
+- 1 コアあたりの同時ストリーム数（ゲートウェイの CPU 1 秒あたりに中継したイベント数 × トークンの間隔。
+  ゲートウェイが 1 コアを使い切ったときに、上流のトークンの速度を落とさずに同時に中継できるストリーム数の目安）
+
+最後に、途中で切断するクライアントと受信が遅いクライアントの処理（上流のストリームを閉じること）を確認します。
+
+使い方:
+    python bench_sse_gateway.py --streams 100,250,500,1000 --token-delay 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from dataclasses import dataclass
+
+from genai_async_engine import percentile
+from genai_benchmark import start_mock_server
+from genai_sse_gateway import AsyncUpstream, SseGateway, raise_open_file_limit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class StreamSample:
+    """
+    クライアント 1 接続分の計測結果
+    """
+    ttft: float = None
+    duration: float = 0.0
+    max_gap: float = 0.0
+    events: int = 0
+    finished: bool = False
+    error: str = None
+
+
+def start_gateway(endpoint, args):
+    """
+    ゲートウェイを別プロセスで起動し、(プロセス, エンドポイント) を返します。
+    """
+    command = [sys.executable, os.path.join(HERE, "genai_sse_gateway.py"), "--port", "0", "--upstream", endpoint,
+               "--buffer-events", str(args.buffer_events)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise RuntimeError("ゲートウェイの起動に失敗しました")
+    return process, line.rsplit(" ", 1)[-1].strip()
+
+
+def gateway_stats(endpoint):
+    with urllib.request.urlopen(endpoint + "/stats", timeout=10) as response:
+        return json.load(response)
+
+
+def process_rss_mb(pid):
+    """
+    プロセスの RSS（MB）。/proc がない環境では None。
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def sse_client(host, port, message, delay=0.0, close_after=None, pause=None):
+    """
+    POST /chat を送り、最終イベントまで（close_after 件のイベントを受け取ったら切断して）受信します。
+    pause を指定すると最初のイベントの後は pause 秒受信を止めます（受信が遅いクライアント）。
+    """
+    await asyncio.sleep(delay)
+    sample = StreamSample()
+    start = time.perf_counter()
+    try:
+        if pause is None:
+            reader, writer = await asyncio.open_connection(host, port)
+        else:
+            # 受信バッファを小さくして、受信を止めたときにゲートウェイ側がすぐに溢れるようにする
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.setblocking(False)
+            await asyncio.get_running_loop().sock_connect(sock, (host, port))
+            reader, writer = await asyncio.open_connection(sock=sock)
+    except OSError as e:
+        sample.error = type(e).__name__
+        return sample
+    try:
+        body = json.dumps({"message": message}, ensure_ascii=False).encode("utf-8")
+        writer.write(b"POST /chat HTTP/1.1\r\nhost: gateway\r\ncontent-type: application/json\r\n"
+                     b"content-length: %d\r\n\r\n" % len(body) + body)
+        head = await reader.readuntil(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/1.1 200"):
+            sample.error = head.split(b"\r\n", 1)[0].decode("latin-1")
+            return sample
+        buffer = b""
+        last = None
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            now = time.perf_counter()
+            buffer += chunk
+            *blocks, buffer = buffer.split(b"\n\n")
+            for block in blocks:
+                sample.events += 1
+                if b'"finishReason"' in block:
+                    sample.finished = True
+                elif block.startswith(b"event: error"):
+                    sample.error = block.decode("utf-8", "replace")
+            if blocks:
+                if sample.ttft is None:
+                    sample.ttft = now - start
+                elif now - last > sample.max_gap:
+                    sample.max_gap = now - last
+                last = now
+            if close_after is not None and sample.events >= close_after:
+                break
+            if pause is not None and sample.events:
+                # 受信を止めて、ゲートウェイの送信バッファとキューが溢れるのを待つ
+                writer.transport.pause_reading()
+                await asyncio.sleep(pause)
+                break
+    except (OSError, asyncio.IncompleteReadError) as e:
+        sample.error = type(e).__name__
+    finally:
+        sample.duration = time.perf_counter() - start
+        writer.transport.abort()
+    return sample
+
+
+async def run_level(host, port, streams, ramp):
+    tasks = [sse_client(host, port, f"Oracle Database の機能 {index} について教えてください。",
+                        delay=ramp * index / streams) for index in range(streams)]
+    return await asyncio.gather(*tasks)
+
+
+def report_level(streams, samples, before, after, wall, rss, token_delay):
+    finished = [sample for sample in samples if sample.finished]
+    ttfts = sorted(sample.ttft for sample in finished)
+    gaps = sorted(sample.max_gap for sample in finished)
+    cpu = after["cpu_seconds"] - before["cpu_seconds"]
+    events = after["events"] - before["events"]
+    events_per_cpu = events / cpu if cpu else 0.0
+    print(f"{streams:>7} {len(finished):>6} {len(samples) - len(finished):>6} {after['peak_streams']:>6} "
+          f"{percentile(ttfts, 50) * 1000:>8.1f} {percentile(ttfts, 99) * 1000:>8.1f} "
+          f"{percentile(gaps, 99) * 1000:>8.1f} {cpu / wall:>6.1%} {events_per_cpu:>10.0f} "
+          f"{events_per_cpu * token_delay:>12.0f} {rss if rss is not None else float('nan'):>7.1f}")
+
+
+async def check_cancellation(args):
+    """
+    途中で切断したクライアントと受信が遅いクライアントについて、上流のストリームが閉じられることを確認します。
+    （受信が遅いクライアントの確認には長い応答が必要なため、モックサーバーとゲートウェイを同じプロセスで起動します）
+    """
+    from genai_mock_server import MockGenAiServer
+
+    with MockGenAiServer(response_text="Oracle Database " * 20000, token_chars=400, token_delay=0.02) as server:
+        gateway = SseGateway(AsyncUpstream(server.endpoint), "ocid1.compartment.oc1..mock", buffer_events=8,
+                             write_buffer=16 * 1024, socket_buffer=16 * 1024, slow_consumer_timeout=1.0)
+        await gateway.start()
+        host, port = gateway.server.sockets[0].getsockname()[:2]
+        # モックサーバーのスレッドと同じプロセスで動かすため、2 種類のクライアントは順に試す
+        await asyncio.gather(*[sse_client(host, port, "disconnect", close_after=3) for _ in range(args.disconnects)])
+        await asyncio.gather(*[sse_client(host, port, "slow", pause=5.0) for _ in range(args.slow_clients)])
+        start = time.perf_counter()
+        while gateway.stats.active_streams and time.perf_counter() - start < 10:
+            await asyncio.sleep(0.05)
+        stats = gateway.stats
+        print(f"\ndisconnects: {stats.client_disconnects}/{args.disconnects} cancelled, "
+              f"slow consumers: {stats.slow_consumers}/{args.slow_clients} evicted, "
+              f"upstream streams still open: {stats.active_streams}")
+        await gateway.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE ゲートウェイの同時ストリーム数の負荷試験")
+    parser.add_argument("--streams", default="100,250,500,1000")
+    parser.add_argument("--ramp", type=float, default=1.0, help="ストリームを開き終えるまでの時間（秒）")
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--buffer-events", type=int, default=64)
+    parser.add_argument("--disconnects", type=int, default=20)
+    parser.add_argument("--slow-clients", type=int, default=5)
+    args = parser.parse_args()
+    # start_mock_server が参照するその他の設定
+    args.guardrails_delay, args.jitter, args.error_rate, args.seed, args.trace = 0.0, 0.0, 0.0, 0, None
+
+    raise_open_file_limit()
+    mock, upstream = start_mock_server(args)
+    gateway, endpoint = start_gateway(upstream, args)
+    host, port = endpoint[len("http://"):].rsplit(":", 1)
+    try:
+        print(f"mock upstream: first token {args.first_token_delay * 1000:.0f} ms, "
+              f"token every {args.token_delay * 1000:.0f} ms; {os.cpu_count()} CPU(s) shared by all processes")
+        print(f"{'streams':>7} {'ok':>6} {'failed':>6} {'peak':>6} {'ttft p50':>8} {'ttft p99':>8} {'gap p99':>8} "
+              f"{'gw cpu':>6} {'events/cpu':>10} {'streams/core':>12} {'rss MB':>7}")
+        for streams in (int(value) for value in args.streams.split(",")):
+            before = gateway_stats(endpoint)
+            start = time.perf_counter()
+            samples = asyncio.run(run_level(host, int(port), streams, args.ramp))
+            wall = time.perf_counter() - start
+            after = gateway_stats(endpoint)
+            report_level(streams, samples, before, after, wall, process_rss_mb(gateway.pid), args.token_delay)
+        asyncio.run(check_cancellation(args))
+    finally:
+        for process in (gateway, mock):
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
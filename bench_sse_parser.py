@@ -0,0 +1,139 @@
+"""
+ストリーミング応答のデコード処理のマイクロベンチマーク
+
+記録済みの SSE イベント（fixtures/cohere_chat_stream.sse）を使い、サンプルの
+json.loads + dict 検査によるループと genai_sse_parser.CohereStreamDecoder を比較します。
+トークンイベントを繰り返して 4000 トークン程度の長い生成を模擬します。
+
+使い方:
+    python bench_sse_parser.py --tokens 4000 --repeat 50
+"""
+import argparse
+import json
+import os
+import time
+
+from genai_sse_parser import CohereStreamDecoder
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "cohere_chat_stream.sse")
+
+
+class Event:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+
+def load_fixture(tokens):
+    """
+    記録済みのイベントを読み込み、トークンイベントを tokens 個まで繰り返した (SSE バイト列, イベントのリスト) を返します。
+    """
+    with open(FIXTURE, encoding="utf-8") as f:
+        blocks = [block[len("data: "):] for block in f.read().split("\n\n") if block]
+    token_events, final_event = blocks[:-1], blocks[-1]
+    data = [token_events[i % len(token_events)] for i in range(tokens)] + [final_event]
+    raw = "".join(f"data: {item}\n\n" for item in data).encode("utf-8")
+    return raw, [Event(item) for item in data]
+
+
+def current_loop(events):
+    """
+    oci_genai_cohere_chat_streaming_example.py のループ（表示処理を除く）
+    """
+    chat_history = []
+    chatbot_message = ""
+    citations = []
+    finish_reason = ""
+    prompt = ""
+    fragments = []
+    for event in events:
+        res = json.loads(event.data)
+        if 'finishReason' in res.keys():
+            finish_reason = res['finishReason']
+            if 'chatHistory' in res:
+                chat_history = res['chatHistory']
+            if 'text' in res:
+                chatbot_message = res['text']
+            if 'citations' in res:
+                citations = res['citations']
+            if 'prompt' in res:
+                prompt = res['prompt']
+            break
+        if 'text' in res:
+            fragments.append(res['text'])
+    return "".join(fragments), chatbot_message, finish_reason, chat_history, citations, prompt
+
+
+def split_events(raw, chunk_size=16384):
+    """
+    SSE のバイト列を行単位で読み、イベントに組み立てます（SDK の SSE クライアントと同様の処理）。
+    """
+    buffer = b""
+    data_lines = []
+    for i in range(0, len(raw), chunk_size):
+        buffer += raw[i:i + chunk_size]
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if not line:
+                if data_lines:
+                    yield Event(b"\n".join(data_lines).decode("utf-8"))
+                    data_lines = []
+            elif line.startswith(b"data:"):
+                data_lines.append(line[5:].lstrip(b" "))
+
+
+def current_loop_raw(raw):
+    return current_loop(split_events(raw))
+
+
+def decoder_events(events):
+    decoder = CohereStreamDecoder()
+    fragments = list(decoder.iter_events(events))
+    return "".join(fragments), decoder.result
+
+
+def decoder_bytes(raw, chunk_size=16384):
+    decoder = CohereStreamDecoder()
+    chunks = (raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size))
+    fragments = list(decoder.iter_bytes(chunks))
+    return "".join(fragments), decoder.result
+
+
+def measure(function, repeat, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE デコード処理のマイクロベンチマーク")
+    parser.add_argument("--tokens", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    raw, events = load_fixture(args.tokens)
+    expected = current_loop(events)
+    assert current_loop_raw(raw) == expected
+    for text, result in (decoder_events(events), decoder_bytes(raw)):
+        assert text == expected[0] and result.text == expected[1] and result.finish_reason == expected[2]
+        assert result.chat_history == expected[3] and result.citations == expected[4] and result.prompt == expected[5]
+
+    baseline = measure(current_loop, args.repeat, events)
+    print(f"tokens: {args.tokens}, stream bytes: {len(raw)}")
+    print(f"{'method':<40} {'best (ms)':>10} {'us/token':>9} {'speedup':>8}")
+    for name, seconds in (("json.loads loop (current)", baseline),
+                          ("CohereStreamDecoder.iter_events", measure(decoder_events, args.repeat, events))):
+        print(f"{name:<40} {seconds * 1000:>10.2f} {seconds / args.tokens * 1e6:>9.2f} {baseline / seconds:>7.1f}x")
+    baseline = measure(current_loop_raw, args.repeat, raw)
+    for name, seconds in (("SSE split + json.loads loop (raw)", baseline),
+                          ("CohereStreamDecoder.iter_bytes (raw)", measure(decoder_bytes, args.repeat, raw))):
+        print(f"{name:<40} {seconds * 1000:>10.2f} {seconds / args.tokens * 1e6:>9.2f} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
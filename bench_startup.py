@@ -0,0 +1,84 @@
+"""
+起動時間（コールドスタート）のベンチマーク
+
+サンプルと同じ import oci と genai_client_factory の遅延読み込みを、それぞれ新しい Python プロセスで
+python -X importtime を付けて実行し、プロセスの実行時間と import の累積時間、時間のかかったモジュールの上位を表示します。
+
+使い方:
+    python bench_startup.py --repeat 5 --top 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = {
+    "samples (import oci)": "import oci\nimport oci.generative_ai_inference",
+    "factory (import only)": "import genai_client_factory",
+    "factory (minimal SDK)": "import genai_client_factory\ngenai_client_factory.load_inference_module()",
+    "factory (full SDK)": "import genai_client_factory\ngenai_client_factory.load_inference_module(minimal=False)",
+}
+
+
+def parse_importtime(stderr):
+    """
+    -X importtime の出力から (モジュール名, 自身の時間 us, 累積時間 us) のリストを返します。
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # 区切りの空白の後、入れ子の深さに応じて 2 文字ずつインデントされる
+        rows.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def run_once(code):
+    """
+    新しいプロセスで code を実行し、(実行時間 秒, import の合計時間 秒, import time の行) を返します。
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE,
+                               capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()
+        raise RuntimeError(error[-1] if error else f"exit status {completed.returncode}")
+    rows = parse_importtime(completed.stderr)
+    # トップレベルの import（インデントなし）の累積時間の合計
+    total = sum(cumulative for name, _, cumulative in rows if not name.startswith(" ")) / 1e6
+    return elapsed, total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import oci と遅延読み込みの起動時間の比較")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="時間のかかったモジュールを表示する件数")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<24} {'wall ms':>9} {'import ms':>10}")
+    slowest = {}
+    for label, code in SCENARIOS.items():
+        try:
+            runs = [run_once(code) for _ in range(args.repeat)]
+        except RuntimeError as error:
+            print(f"{label:<24} skipped: {error}")
+            continue
+        wall = statistics.median(run[0] for run in runs) * 1000
+        imports = statistics.median(run[1] for run in runs) * 1000
+        slowest[label] = sorted(runs[-1][2], key=lambda row: row[1], reverse=True)[:args.top]
+        print(f"{label:<24} {wall:>9.1f} {imports:>10.1f}")
+
+    for label, rows in slowest.items():
+        print(f"\n{label}: slowest modules (self ms / cumulative ms)")
+        for name, self_us, cumulative_us in rows:
+            print(f"  {self_us / 1000:>8.2f} {cumulative_us / 1000:>9.2f}  {name.strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+asyncio ベースの並行チャット実行エンジン
+
+多数の ChatDetails / ApplyGuardrailsDetails を、同時実行数の上限を設けて 1 つの推論クライアント
+（Keep-Alive の接続プールを共有）で並行に実行し、完了した順に結果と遅延を返します。
+クライアントには OCI SDK の GenerativeAiInferenceClient と genai_http_client.GenAiHttpClient のどちらも使えます。
+
+使い方（ローカルのモックサーバーに対して同時実行数ごとのスループットを計測）:
+    python genai_async_engine.py --requests 64 --concurrency 1,4,16 --stream
+"""
+import argparse
+import asyncio
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+
+def job_kind(details):
+    """
+    リクエストの詳細から呼び出すメソッド名（"chat" / "apply_guardrails"）を判定します。
+    """
+    if isinstance(details, (bytes, bytearray)):
+        # ChatTemplate.render などで作った JSON のボディ
+        return "chat" if b'"chatRequest"' in details else "apply_guardrails"
+    if isinstance(details, dict):
+        return "chat" if "chatRequest" in details or "chat_request" in details else "apply_guardrails"
+    return "chat" if hasattr(details, "chat_request") else "apply_guardrails"
+
+
+def configure_connection_pool(client, pool_size):
+    """
+    クライアントの HTTP 接続プールを同時実行数に合わせた大きさにします。
+
+    OCI SDK のクライアントは requests.Session を内部に持ち、既定のプールは 10 接続です。
+    それを超える同時実行ではリクエストごとに接続が作り直されるため、アダプターを差し替えます。
+    """
+    if hasattr(client, "pool"):
+        client.pool.resize(pool_size)
+        return
+    session = getattr(getattr(client, "base_client", None), "session", None)
+    if session is not None:
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+
+def percentile(sorted_values, q):
+    """
+    ソート済みの値のパーセンタイル（最近傍法）。
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values) / 100) - 1))
+    return sorted_values[index]
+
+
+@dataclass
+class JobResult:
+    """
+    1 リクエストの実行結果
+
+    Attributes:
+        index (int): 投入順の番号
+        kind (str): "chat" / "apply_guardrails"
+        response: クライアントが返したレスポンス（エラー時は None）
+        events (list): ストリーミングの場合に受信したイベントの data 文字列
+        error (Exception): 発生した例外
+        latency (float): リクエスト開始から応答（ストリーミングは最終イベント）までの秒数
+        ttft (float): ストリーミングの場合の最初のイベントまでの秒数
+    """
+    index: int
+    kind: str
+    response: object = None
+    events: list = None
+    error: Exception = None
+    latency: float = 0.0
+    ttft: float = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+@dataclass
+class EngineStats:
+    """
+    実行全体の集計
+    """
+    latencies: list = field(default_factory=list)
+    ttfts: list = field(default_factory=list)
+    errors: int = 0
+    wall_time: float = 0.0
+
+    def add(self, result):
+        if result.ok:
+            self.latencies.append(result.latency)
+            if result.ttft is not None:
+                self.ttfts.append(result.ttft)
+        else:
+            self.errors += 1
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        ttfts = sorted(self.ttfts)
+        completed = len(latencies)
+        return {
+            "completed": completed,
+            "errors": self.errors,
+            "wall_time": self.wall_time,
+            "throughput": completed / self.wall_time if self.wall_time else 0.0,
+            "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+        }
+
+
+class AsyncChatEngine:
+    """
+    同時実行数の上限付きでリクエストを並行実行するエンジン
+
+    SDK の呼び出しはブロッキングなので、同時実行数と同じ数のワーカースレッドで実行し、
+    イベントループ側では投入中のリクエストを max_concurrency 件までに制限します。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        max_concurrency (int): 同時に実行するリクエスト数の上限
+    """
+
+    def __init__(self, client, max_concurrency=8):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.stats = EngineStats()
+        configure_connection_pool(client, max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="genai-engine")
+
+    def execute(self, index, details):
+        """
+        1 リクエストをワーカースレッド上で実行します（ストリーミング応答は最後まで読み切ります）。
+        """
+        kind = job_kind(details)
+        result = JobResult(index=index, kind=kind)
+        start = time.perf_counter()
+        try:
+            if kind == "chat":
+                response = self.client.chat(details)
+            else:
+                response = self.client.apply_guardrails(apply_guardrails_details=details)
+            if callable(getattr(response.data, "events", None)):
+                result.events = []
+                for event in response.data.events():
+                    if result.ttft is None:
+                        result.ttft = time.perf_counter() - start
+                    result.events.append(event.data)
+            result.response = response
+        except Exception as error:
+            result.error = error
+        result.latency = time.perf_counter() - start
+        return result
+
+    async def as_completed(self, jobs):
+        """
+        jobs を順に投入し、完了した順に JobResult を返す非同期イテレーター。
+        jobs は遅延評価されるため、巨大なジェネレーターも投入中の件数分しかメモリに載りません。
+        """
+        loop = asyncio.get_running_loop()
+        pending = set()
+        start = time.perf_counter()
+        try:
+            for index, details in enumerate(jobs):
+                if len(pending) >= self.max_concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        self.stats.add(result)
+                        yield result
+                pending.add(loop.run_in_executor(self._executor, self.execute, index, details))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    self.stats.add(result)
+                    yield result
+        finally:
+            self.stats.wall_time += time.perf_counter() - start
+
+    async def run(self, jobs):
+        """
+        すべてのジョブを実行し、投入順に並べた JobResult のリストを返します。
+        """
+        results = [result async for result in self.as_completed(jobs)]
+        results.sort(key=lambda result: result.index)
+        return results
+
+    def run_sync(self, jobs):
+        return asyncio.run(self.run(jobs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def build_chat_details(message, model_id="cohere.command-a-03-2025", compartment_id="ocid1.compartment.oc1..mock",
+                       is_stream=False, max_tokens=500):
+    """
+    ChatDetails と同じ構造の dict を作ります（OCI SDK がなくてもモックサーバーに送れます）。
+    """
+    return {
+        "compartmentId": compartment_id,
+        "servingMode": {"servingType": "ON_DEMAND", "modelId": model_id},
+        "chatRequest": {"apiFormat": "COHERE", "message": message, "maxTokens": max_tokens,
+                        "isStream": is_stream, "temperature": 0.75, "frequencyPenalty": 1.0},
+    }
+
+
+def main():
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+
+    parser = argparse.ArgumentParser(description="モックサーバーに対する並行チャット実行のスループット計測")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+
+    with MockGenAiServer(first_token_delay=args.first_token_delay, token_delay=args.token_delay) as server:
+        print(f"{'concurrency':>11} {'req/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'errors':>6}")
+        for concurrency in (int(value) for value in args.concurrency.split(",")):
+            client = GenAiHttpClient(server.endpoint)
+            jobs = (build_chat_details(f"質問 {i}", is_stream=args.stream) for i in range(args.requests))
+            with AsyncChatEngine(client, max_concurrency=concurrency) as engine:
+                engine.run_sync(jobs)
+                summary = engine.stats.summary()
+            client.close()
+            print(f"{concurrency:>11} {summary['throughput']:>8.1f} {summary['latency_p50']:>7.3f} "
+                  f"{summary['latency_p95']:>7.3f} {summary['latency_p99']:>7.3f} {summary['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
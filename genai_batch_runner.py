@@ -0,0 +1,439 @@
+"""
+大きな JSONL ファイルの chat / apply_guardrails を実行する再開可能なバッチジョブ
+
+サンプルは 1 つの chat_request.message や INPUT_TEXT を実行して表示するだけなので、大量の評価をするには
+ループで包む必要があり、途中で止まるとそれまでの進捗が失われます。BatchJob は次のように処理します。
+
+- 入力の JSONL を 1 行ずつ読み（ファイル全体をメモリに読み込まない）、同時実行数の上限付きで並行に呼び出す
+- 結果を入力と同じ順に出力の JSONL に追記する（結果待ちの行数も上限付き）
+- チェックポイントのファイル（入力・出力のオフセット）を定期的に原子的に書き換え、中断したジョブは続きから再開する
+  （再開時は出力をチェックポイントの位置まで切り詰めるため、同じ行の結果が重複して書かれることはありません）
+- 進捗・rows/sec・残り時間（入力のバイト数から推定）を定期的に表示する
+
+入力の 1 行は chat なら {"id": ..., "message": ..., "documents": [...] など}、apply_guardrails なら
+{"id": ..., "text": ...}（または ChatDetails / ApplyGuardrailsDetails と同じ構造の dict）です。
+呼び出しに失敗した行は error を含む結果を書き、ジョブは続行します（再試行が必要なら ResilientClient で包んでください）。
+
+使い方:
+    python genai_batch_runner.py prompts.jsonl results.jsonl --mode chat --concurrency 16
+    python genai_batch_runner.py texts.jsonl pii.jsonl --mode guardrails --endpoint http://127.0.0.1:8080
+    python genai_batch_runner.py --demo   # ローカルのモックサーバーで中断と再開を含めて実行
+
+    job = BatchJob(generative_ai_inference_client, compartment_id, "prompts.jsonl", "results.jsonl")
+    progress = job.run()   # 中断した場合は同じ引数で再び run() すると続きから実行します
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from genai_async_engine import build_chat_details
+from genai_guardrails_pipeline import PII_TYPES
+from genai_http_client import WireObject, to_wire
+from genai_sse_gateway import CHAT_REQUEST_FIELDS
+
+DEFAULT_GUARDRAIL_CONFIGS = {
+    "contentModerationConfig": {"categories": ["OVERALL", "BLOCKLIST"]},
+    "promptInjectionConfig": {},
+    "personallyIdentifiableInformationConfig": {"types": PII_TYPES},
+}
+
+
+@dataclass
+class Checkpoint:
+    """
+    中断したジョブを再開するための位置
+
+    Attributes:
+        input_offset (int): 結果を書き終えた行の直後の入力のオフセット（バイト）
+        output_offset (int): 書き終えた結果の直後の出力のオフセット（バイト）
+        rows (int): 結果を書き終えた行数
+        errors (int): そのうち呼び出しに失敗した行数
+        completed (bool): 入力の最後まで処理したかどうか
+    """
+    input_offset: int = 0
+    output_offset: int = 0
+    rows: int = 0
+    errors: int = 0
+    completed: bool = False
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path, sync=False):
+        """
+        一時ファイルに書いてから置き換えるため、書き込みの途中で止まっても前のチェックポイントが残ります。
+        """
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+
+@dataclass
+class BatchProgress:
+    """
+    ジョブの進捗
+
+    Attributes:
+        rows (int): 結果を書き終えた行数（再開前の分を含む）
+        errors (int): 呼び出しに失敗した行数（再開前の分を含む）
+        resumed_rows (int): 再開前に処理済みだった行数
+        input_offset (int): 処理済みの入力のバイト数
+        input_size (int): 入力のバイト数
+    """
+    rows: int = 0
+    errors: int = 0
+    resumed_rows: int = 0
+    input_offset: int = 0
+    resumed_offset: int = 0
+    input_size: int = 0
+    start: float = field(default_factory=time.perf_counter)
+    end: float = None
+
+    def summary(self):
+        elapsed = (self.end or time.perf_counter()) - self.start
+        rows = self.rows - self.resumed_rows
+        processed = self.input_offset - self.resumed_offset
+        remaining = self.input_size - self.input_offset
+        return {
+            "rows": self.rows,
+            "errors": self.errors,
+            "resumed_rows": self.resumed_rows,
+            "elapsed": elapsed,
+            "rows_per_sec": rows / elapsed if elapsed else 0.0,
+            "fraction": self.input_offset / self.input_size if self.input_size else 1.0,
+            # 行の長さがそろっていない入力でも使えるように、行数ではなく入力のバイト数から推定する
+            "eta": remaining * elapsed / processed if processed else None,
+        }
+
+    def format(self):
+        summary = self.summary()
+        eta = "-" if summary["eta"] is None else f"{summary['eta']:.0f}s"
+        return (f"{summary['rows']} rows ({summary['fraction']:.1%}), {summary['rows_per_sec']:.1f} rows/sec, "
+                f"ETA {eta}, errors {summary['errors']}")
+
+
+def print_progress(progress):
+    print(progress.format(), file=sys.stderr, flush=True)
+
+
+class BatchJob:
+    """
+    JSONL の入力を chat / apply_guardrails で処理し、結果を JSONL に書く再開可能なジョブ
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient（ResilientClient などで包んだものも可）
+        compartment_id (str): OCI コンパートメントID
+        input_path (str): 入力の JSONL
+        output_path (str): 出力の JSONL
+        mode (str): "chat" または "guardrails"
+        model_id (str): chat のモデル
+        max_tokens (int): chat の maxTokens（行で指定しなかった場合）
+        guardrail_configs (dict): apply_guardrails の guardrailConfigs（行で指定しなかった場合）
+        language_code (str): apply_guardrails の入力テキストの言語コード
+        max_concurrency (int): 同時に実行する呼び出しの数
+        max_pending (int): 結果待ちにできる行数の上限（出力は入力の順に書くため、遅い行があるとここで待ちます）
+        checkpoint_path (str): チェックポイントのファイル（省略時は output_path + ".checkpoint"）
+        checkpoint_every (int): チェックポイントを書き換える間隔（行数）
+        progress (callable): 進捗（BatchProgress）を受け取る関数（None なら表示しない）
+        progress_interval (float): 進捗を報告する間隔（秒）
+        overwrite (bool): チェックポイントのない既存の出力を上書きするかどうか
+        sync (bool): チェックポイントを書く前に出力を os.fsync するかどうか
+    """
+
+    def __init__(self, client, compartment_id, input_path, output_path, mode="chat",
+                 model_id="cohere.command-a-03-2025", max_tokens=500, guardrail_configs=None, language_code="en",
+                 max_concurrency=8, max_pending=None, checkpoint_path=None, checkpoint_every=100,
+                 progress=print_progress, progress_interval=1.0, overwrite=False, sync=False):
+        if mode not in ("chat", "guardrails"):
+            raise ValueError(f"mode は chat か guardrails です: {mode}")
+        self.client = client
+        self.compartment_id = compartment_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.mode = mode
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+        self.guardrail_configs = guardrail_configs or DEFAULT_GUARDRAIL_CONFIGS
+        self.language_code = language_code
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending or max_concurrency * 4
+        self.checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+        self.checkpoint_every = checkpoint_every
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.overwrite = overwrite
+        self.sync = sync
+
+    def build_details(self, row):
+        """
+        入力の 1 行から ChatDetails / ApplyGuardrailsDetails と同じ構造の dict を作ります。
+        """
+        if self.mode == "chat":
+            if "chatRequest" in row:
+                details = {key: value for key, value in row.items() if key != "id"}
+                details.setdefault("compartmentId", self.compartment_id)
+                details.setdefault("servingMode", {"servingType": "ON_DEMAND", "modelId": self.model_id})
+            else:
+                details = build_chat_details(row["message"], self.model_id, self.compartment_id,
+                                             max_tokens=self.max_tokens)
+                details["chatRequest"].update((key, row[key]) for key in CHAT_REQUEST_FIELDS if key in row)
+            details["chatRequest"]["isStream"] = False
+            return details
+        if "input" in row:
+            details = {key: value for key, value in row.items() if key != "id"}
+            details.setdefault("compartmentId", self.compartment_id)
+            details.setdefault("guardrailConfigs", self.guardrail_configs)
+            return details
+        return {
+            "input": {"type": "TEXT", "content": row["text"], "languageCode": row.get("languageCode",
+                                                                                    self.language_code)},
+            "guardrailConfigs": row.get("guardrailConfigs", self.guardrail_configs),
+            "compartmentId": self.compartment_id,
+        }
+
+    def execute(self, line, row):
+        """
+        1 行を実行して出力の 1 行（dict）を返します。失敗した場合は error を含む dict を返します（例外は投げません）。
+        """
+        result = {"line": line}
+        if isinstance(row, dict) and "id" in row:
+            result["id"] = row["id"]
+        start = time.perf_counter()
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("each line must be a JSON object")
+            details = self.build_details(row)
+            if self.mode == "chat":
+                response = self.client.chat(details)
+            else:
+                response = self.client.apply_guardrails(apply_guardrails_details=details)
+            data = response.data.to_dict() if isinstance(response.data, WireObject) else to_wire(response.data)
+            if self.mode == "chat":
+                chat_response = data["chatResponse"]
+                result["text"] = chat_response.get("text")
+                result["finishReason"] = chat_response.get("finishReason")
+                if chat_response.get("citations"):
+                    result["citations"] = chat_response["citations"]
+            else:
+                result["results"] = data["results"]
+            result["opcRequestId"] = response.request_id
+        except Exception as e:
+            result["error"] = {"status": getattr(e, "status", None), "code": getattr(e, "code", type(e).__name__),
+                               "message": str(e)}
+        result["latency"] = round(time.perf_counter() - start, 6)
+        return result
+
+    def run(self, max_rows=None):
+        """
+        ジョブを実行します（チェックポイントがあれば続きから）。max_rows を指定するとその行数を書いた時点で止めます。
+
+        KeyboardInterrupt などで中断した場合は、書き終えた結果までをチェックポイントに残して例外をそのまま送出します。
+        まだ始まっていない呼び出しは取り消しますが、実行中の呼び出しは止められないため、そのワーカーのスレッドは
+        呼び出しが終わるまで残ります（インタープリタは終了時にそれらを待ちます。結果は捨て、再開時にもう一度実行します）。
+
+        Returns:
+            BatchProgress
+        """
+        checkpoint = Checkpoint.load(self.checkpoint_path)
+        if checkpoint is None:
+            if os.path.exists(self.output_path) and not self.overwrite:
+                raise FileExistsError(f"{self.output_path} はチェックポイントのない既存のファイルです（上書きする場合は "
+                                      f"overwrite=True）")
+            checkpoint = Checkpoint()
+            output = open(self.output_path, "wb")
+        else:
+            output = open(self.output_path, "r+b")
+            # 最後のチェックポイントより後に書かれた結果は、再開後にもう一度書くので捨てる
+            output.truncate(checkpoint.output_offset)
+            output.seek(checkpoint.output_offset)
+        progress = BatchProgress(rows=checkpoint.rows, errors=checkpoint.errors, resumed_rows=checkpoint.rows,
+                                 input_offset=checkpoint.input_offset, resumed_offset=checkpoint.input_offset,
+                                 input_size=os.path.getsize(self.input_path))
+        if checkpoint.completed:
+            output.close()
+            progress.end = progress.start
+            return progress
+
+        pending = collections.deque()
+        written = 0
+        # pending のうち呼び出しを投入した行の数（空行の分は含めない）
+        queued = 0
+        last_report = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="batch")
+
+        def write(entry):
+            nonlocal written, queued, last_report
+            end_offset, future = entry
+            if future is not None:
+                queued -= 1
+                result = future.result()
+                data = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+                output.write(data)
+                checkpoint.output_offset += len(data)
+                checkpoint.rows += 1
+                checkpoint.errors += "error" in result
+                written += 1
+            checkpoint.input_offset = end_offset
+            progress.rows, progress.errors, progress.input_offset = checkpoint.rows, checkpoint.errors, end_offset
+            if future is not None and checkpoint.rows % self.checkpoint_every == 0:
+                self.save_checkpoint(checkpoint, output)
+            now = time.perf_counter()
+            if self.progress is not None and now - last_report >= self.progress_interval:
+                last_report = now
+                self.progress(progress)
+
+        try:
+            with open(self.input_path, "rb") as source:
+                source.seek(checkpoint.input_offset)
+                line = checkpoint.rows
+                for raw in iter(source.readline, b""):
+                    if max_rows is not None and written + queued >= max_rows:
+                        break
+                    end_offset = source.tell()
+                    if not raw.strip():
+                        pending.append((end_offset, None))
+                    else:
+                        try:
+                            row = json.loads(raw)
+                        except ValueError as e:
+                            row = e
+                        pending.append((end_offset, executor.submit(self.execute_row, line, row)))
+                        queued += 1
+                        line += 1
+                    while pending and (len(pending) >= self.max_pending or pending[0][1] is None
+                                       or pending[0][1].done()):
+                        write(pending.popleft())
+                else:
+                    while pending:
+                        write(pending.popleft())
+                    checkpoint.completed = True
+                while pending:
+                    write(pending.popleft())
+        finally:
+            # 中断（KeyboardInterrupt など）した場合も、書き終えた結果までをチェックポイントに残す
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.save_checkpoint(checkpoint, output)
+            output.close()
+            progress.end = time.perf_counter()
+            if self.progress is not None:
+                self.progress(progress)
+        return progress
+
+    def execute_row(self, line, row):
+        if isinstance(row, Exception):
+            return {"line": line, "error": {"status": None, "code": "InvalidJson", "message": str(row)}}
+        return self.execute(line, row)
+
+    def save_checkpoint(self, checkpoint, output):
+        # 出力を先にディスクへ書き出し、チェックポイントが書かれていない結果を指すことがないようにする
+        output.flush()
+        if self.sync:
+            os.fsync(output.fileno())
+        checkpoint.save(self.checkpoint_path, self.sync)
+
+
+def run_demo(args):
+    """
+    モックサーバーに対して、途中で中断したジョブを再開し、出力が入力の各行をちょうど 1 回ずつ含むことを確認します。
+    """
+    import tempfile
+
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+
+    directory = tempfile.mkdtemp(prefix="genai_batch_")
+    input_path = os.path.join(directory, "input.jsonl")
+    output_path = os.path.join(directory, "output.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        for index in range(args.rows):
+            if args.mode == "chat":
+                row = {"id": f"q-{index}", "message": f"Oracle Database の機能 {index} について教えてください。"}
+            else:
+                row = {"id": f"t-{index}", "text": f"Contact {index}: Ethan Hunt, ethan{index}@example.com, 123-456-7890"}
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            if index % 100 == 99:
+                f.write("\n")   # 空行は読み飛ばす
+
+    with MockGenAiServer(first_token_delay=0.02, guardrails_delay=0.02, error_rate=args.error_rate, seed=0) as server:
+        client = GenAiHttpClient(server.endpoint, pool_maxsize=args.concurrency)
+        job = BatchJob(client, "ocid1.compartment.oc1..mock", input_path, output_path, mode=args.mode,
+                       max_concurrency=args.concurrency, checkpoint_every=args.checkpoint_every)
+        print(f"input: {args.rows} rows, {os.path.getsize(input_path)} bytes in {input_path}")
+        print("first run (stopped after half of the rows):", file=sys.stderr)
+        job.run(max_rows=args.rows // 2)
+        # チェックポイントの後に書かれた結果の途中でプロセスが止まった状態を再現する
+        with open(output_path, "ab") as f:
+            f.write(b'{"line":')
+        print("resumed run:", file=sys.stderr)
+        summary = job.run().summary()
+        client.close()
+
+    with open(output_path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f]
+    lines = [result["line"] for result in results]
+    assert lines == list(range(args.rows)), "出力の行が入力と一致しません"
+    assert len({result["id"] for result in results}) == args.rows
+    print(f"output: {len(results)} rows, each input row exactly once and in order "
+          f"(resumed from row {summary['resumed_rows']}), errors {summary['errors']}, "
+          f"{summary['rows_per_sec']:.1f} rows/sec after resume")
+    print(f"server requests: {server.request_count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONL の chat / apply_guardrails を実行する再開可能なバッチジョブ")
+    parser.add_argument("input", nargs="?", help="入力の JSONL")
+    parser.add_argument("output", nargs="?", help="出力の JSONL（チェックポイントは output.checkpoint）")
+    parser.add_argument("--mode", choices=("chat", "guardrails"), default="chat")
+    parser.add_argument("--endpoint", help="署名の不要なエンドポイント（省略時は OCI SDK のクライアント）")
+    parser.add_argument("--profile", default="DEFAULT", help="OCI SDK の設定ファイルのプロファイル")
+    parser.add_argument("--region")
+    parser.add_argument("--compartment-id", default=os.getenv("OCI_COMPARTMENT_ID"))
+    parser.add_argument("--model-id", default=os.getenv("OCI_GENAI_MODEL_ID") or "cohere.command-a-03-2025")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--checkpoint-every", type=int, default=100)
+    parser.add_argument("--overwrite", action="store_true", help="チェックポイントのない既存の出力を上書きする")
+    parser.add_argument("--sync", action="store_true", help="チェックポイントの前に出力を fsync する")
+    parser.add_argument("--demo", action="store_true", help="ローカルのモックサーバーで中断と再開を含めて実行")
+    parser.add_argument("--rows", type=int, default=1000, help="--demo の入力の行数")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="--demo のモックサーバーのエラーの割合")
+    args = parser.parse_args()
+
+    if args.demo:
+        run_demo(args)
+        return
+    if not args.input or not args.output:
+        parser.error("input と output を指定してください")
+    if args.endpoint:
+        from genai_http_client import GenAiHttpClient
+        client = GenAiHttpClient(args.endpoint, pool_maxsize=args.concurrency)
+    else:
+        from genai_client_factory import get_client, load_environment
+        load_environment()
+        client = get_client(args.profile, args.region)
+    job = BatchJob(client, args.compartment_id, args.input, args.output, mode=args.mode, model_id=args.model_id,
+                   max_concurrency=args.concurrency, checkpoint_every=args.checkpoint_every,
+                   overwrite=args.overwrite, sync=args.sync)
+    try:
+        job.run()
+    except KeyboardInterrupt:
+        # 実行中の呼び出しのスレッドは止められないため、終了はそれらの呼び出しが終わるまで待つ
+        print(f"interrupted; waiting for in-flight requests to finish before exiting (their results are discarded). "
+              f"Run the same command again to resume from {job.checkpoint_path}", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
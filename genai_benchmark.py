@@ -0,0 +1,225 @@
+"""
+OCI Generative AI クライアントコードのオフラインベンチマーク
+
+ローカルのモックサーバー（genai_mock_server.py）を別プロセスで起動し、記録済みの Cohere の応答を
+指定したトークン間隔・ゆらぎ・エラー率で再生させながら、次の条件を総当たりで計測します。
+
+- 同時実行数（--concurrency）
+- ペイロードの大きさ（documents の件数 --documents、chat_history の件数 --history）
+- 実行モード（chat: 非ストリーミング、stream: ストリーミング、guardrails: applyGuardrails）
+
+スループット、レイテンシと TTFT のパーセンタイル、1 リクエストあたりのクライアント側 CPU 時間を JSON ファイルに書き出します。
+--compare に以前の結果ファイルを指定すると、コミット間の差分を表示します。
+
+使い方:
+    python genai_benchmark.py --concurrency 1,8,32 --documents 0,3,30 --modes chat,stream -o bench_results.json
+    python genai_benchmark.py -o after.json --compare before.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from genai_async_engine import AsyncChatEngine
+from genai_http_client import GenAiHttpClient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TRACE = os.path.join(HERE, "fixtures", "cohere_chat_stream.sse")
+
+# oci_genai_cohere_chat_example.py の documents（件数を増やす場合は繰り返して使用）
+DOCUMENT_SNIPPETS = [
+    {
+        "title": "Oracle",
+        "snippet": "オラクルのデータベース・サービスおよび製品は、世界をリードするコンバージド・マルチモデル・データベース管理システムであるOracle Databaseをはじめ、インメモリ、NoSQLMySQLデータベースなど、お客様に最適なコストとパフォーマンスを提供しています。",
+        "website": "https://www.oracle.com/jp/database/",
+    },
+    {
+        "title": "Oracle Database",
+        "snippet": "Oracle Database（オラクル データベース）とは、米国オラクル (Oracle) が開発・販売している、関係データベース管理システム ( 英語: Relational database management system、略称：RDBMS ) のことである。",
+        "website": "https://ja.wikipedia.org/wiki/Oracle_Database",
+    },
+    {
+        "title": "Oracle Database 23ai",
+        "snippet": "Oracle Database 23aiでは、新しい世代のAIモデルを活用してベクトルを生成・格納できる強力な新技術、AI ベクトル検索を導入しました。",
+        "website": "https://blogs.oracle.com/oracle4engineer/post/ja-oracle-23ai-now-generally-available",
+    },
+]
+GUARDRAILS_TEXT = ("Hey there, my amazing viewers! I'm Ethan Hunt. You can mail fan art to 456 Oak Avenue, "
+                   "Los Angeles, CA 90210, call 123-456-7890 or email ethan.hunt.vtuber@streammail.net. ")
+
+
+def build_payload(mode, index, documents, history, model_id="cohere.command-a-03-2025",
+                  compartment_id="ocid1.compartment.oc1..benchmark"):
+    """
+    計測用のリクエスト（ChatDetails / ApplyGuardrailsDetails と同じ構造の dict）を作ります。
+    """
+    if mode == "guardrails":
+        return {
+            "input": {"type": "TEXT", "content": GUARDRAILS_TEXT * max(1, documents), "languageCode": "en"},
+            "guardrailConfigs": {"personallyIdentifiableInformationConfig": {
+                "types": ["PERSON", "ADDRESS", "EMAIL", "TELEPHONE_NUMBER"]}},
+            "compartmentId": compartment_id,
+        }
+    chat_history = [{"role": "SYSTEM", "message": "あなたはIT業界に精通した優秀なテクニカルライターです。"}]
+    for turn in range(history):
+        chat_history.append({"role": "USER", "message": f"オラクルとはどんな会社ですか？（{turn}）"})
+        chat_history.append({"role": "CHATBOT", "message": "Oracleは、エンタープライズIT市場における最大手のベンダーの一つです。"})
+    return {
+        "compartmentId": compartment_id,
+        "servingMode": {"servingType": "ON_DEMAND", "modelId": model_id},
+        "chatRequest": {
+            "apiFormat": "COHERE",
+            "message": f"オラクルのリレーショナルデータベースについて教えてください。（{index}）",
+            "maxTokens": 1000,
+            "isStream": mode == "stream",
+            "temperature": 0.75,
+            "topP": 0.7,
+            "topK": 0,
+            "frequencyPenalty": 1.0,
+            "chatHistory": chat_history,
+            "documents": [DOCUMENT_SNIPPETS[i % len(DOCUMENT_SNIPPETS)] for i in range(documents)],
+        },
+    }
+
+
+def start_mock_server(args):
+    """
+    モックサーバーを別プロセスで起動し、(プロセス, エンドポイント) を返します。
+    クライアント側の CPU 時間にサーバーの処理が混ざらないように別プロセスにしています。
+    """
+    command = [sys.executable, os.path.join(HERE, "genai_mock_server.py"), "--port", "0",
+               "--first-token-delay", str(args.first_token_delay), "--token-delay", str(args.token_delay),
+               "--guardrails-delay", str(args.guardrails_delay), "--jitter", str(args.jitter),
+               "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+    if args.trace:
+        command += ["--trace", args.trace]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise RuntimeError("モックサーバーの起動に失敗しました")
+    return process, line.rsplit(" ", 1)[-1].strip()
+
+
+def run_case(endpoint, mode, concurrency, documents, history, requests):
+    client = GenAiHttpClient(endpoint)
+    jobs = (build_payload(mode, i, documents, history) for i in range(requests))
+    cpu_start = time.process_time()
+    with AsyncChatEngine(client, max_concurrency=concurrency) as engine:
+        engine.run_sync(jobs)
+        summary = engine.stats.summary()
+    cpu_time = time.process_time() - cpu_start
+    client.close()
+    payload_bytes = len(json.dumps(build_payload(mode, 0, documents, history), ensure_ascii=False).encode("utf-8"))
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "documents": documents,
+        "history": history,
+        "requests": requests,
+        "payload_bytes": payload_bytes,
+        "completed": summary["completed"],
+        "errors": summary["errors"],
+        "throughput": round(summary["throughput"], 3),
+        "latency_p50_ms": round(summary["latency_p50"] * 1000, 3),
+        "latency_p95_ms": round(summary["latency_p95"] * 1000, 3),
+        "latency_p99_ms": round(summary["latency_p99"] * 1000, 3),
+        "ttft_p50_ms": round(summary["ttft_p50"] * 1000, 3),
+        "ttft_p95_ms": round(summary["ttft_p95"] * 1000, 3),
+        "cpu_ms_per_request": round(cpu_time / requests * 1000, 4),
+    }
+
+
+def case_key(result):
+    return (result["mode"], result["concurrency"], result["documents"], result["history"])
+
+
+def compare(results, baseline_path):
+    """
+    以前の結果ファイルと比較して、スループット・p95・CPU 時間の変化率を表示します。
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {case_key(result): result for result in json.load(f)["results"]}
+    print(f"\ncompared with {baseline_path}")
+    print(f"{'mode':<10} {'conc':>4} {'docs':>4} {'hist':>4} {'req/s':>9} {'p95':>9} {'cpu/req':>9}")
+    for result in results:
+        before = baseline.get(case_key(result))
+        if before is None:
+            continue
+        changes = []
+        for metric in ("throughput", "latency_p95_ms", "cpu_ms_per_request"):
+            changes.append(f"{(result[metric] / before[metric] - 1) * 100:+8.1f}%" if before[metric] else f"{'n/a':>9}")
+        print(f"{result['mode']:<10} {result['concurrency']:>4} {result['documents']:>4} {result['history']:>4} "
+              + " ".join(changes))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モックサーバーを使ったオフラインベンチマーク")
+    parser.add_argument("--modes", default="chat,stream,guardrails")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--documents", type=int_list, default=[3])
+    parser.add_argument("--history", type=int_list, default=[1])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--trace", default=DEFAULT_TRACE, help="モックサーバーが再生する SSE 応答（空文字列で無効）")
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.001)
+    parser.add_argument("--guardrails-delay", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--compare", help="比較対象の以前の結果ファイル")
+    args = parser.parse_args()
+
+    process, endpoint = start_mock_server(args)
+    results = []
+    try:
+        print(f"{'mode':<10} {'conc':>4} {'docs':>4} {'hist':>4} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'ttft p50':>9} {'cpu ms/req':>10} {'errors':>6}")
+        for mode, concurrency, documents, history in itertools.product(
+                args.modes.split(","), args.concurrency, args.documents, args.history):
+            result = run_case(endpoint, mode, concurrency, documents, history, args.requests)
+            results.append(result)
+            print(f"{mode:<10} {concurrency:>4} {documents:>4} {history:>4} {result['throughput']:>9.1f} "
+                  f"{result['latency_p50_ms']:>9.2f} {result['latency_p95_ms']:>9.2f} {result['ttft_p50_ms']:>9.2f} "
+                  f"{result['cpu_ms_per_request']:>10.3f} {result['errors']:>6}")
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
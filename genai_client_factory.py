@@ -0,0 +1,180 @@
+"""
+推論クライアントの共有ファクトリ
+
+各サンプルは import oci（SDK 全体の読み込み）、load_dotenv(find_dotenv())、oci.config.from_file(...) を実行し、
+モジュールの読み込み時に GenerativeAiInferenceClient を生成しています。CLI として実行すると、
+リクエストを送る前の起動処理が実行時間の大半を占めます。このモジュールは次のようにして起動を速くします。
+
+- SDK は最初にクライアントが必要になったときに読み込み、既定では oci.generative_ai_inference と
+  その依存モジュールだけを読み込みます（oci/__init__.py が行う全サービスの読み込みを省略）
+- 構成ファイルの内容と署名オブジェクト（秘密鍵の読み込み）をプロファイルごとにキャッシュ
+- (プロファイル, リージョン, エンドポイント) ごとにプロセス内で 1 つのクライアントを共有
+
+使い方:
+    from genai_client_factory import get_client, inference_models, serving_mode
+    generative_ai_inference_client = get_client(profile="DEFAULT", region="us-chicago-1")
+    models = inference_models()
+    chat_detail = models.ChatDetails(serving_mode=serving_mode(model_id=model_id), ...)
+
+    # 専用 AI クラスタ（DedicatedServingMode）のエンドポイントを使う場合
+    client = get_client(region="us-chicago-1", service_endpoint=endpoint)
+    chat_detail.serving_mode = serving_mode(endpoint_id=endpoint_ocid)
+"""
+import functools
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+
+DEFAULT_CONFIG_FILE = "~/.oci/config"
+DEFAULT_TIMEOUT = (10, 240)
+
+# oci.generative_ai_inference が依存する SDK の共通モジュール（oci/__init__.py を実行せずに読み込むもの）
+_SDK_CORE_MODULES = ("exceptions", "util", "config", "signer", "auth", "retry", "circuit_breaker", "regions",
+                     "base_client", "response")
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _drop_sdk_modules():
+    for name in [name for name in sys.modules if name == "oci" or name.startswith("oci.")]:
+        del sys.modules[name]
+
+
+@functools.lru_cache(maxsize=None)
+def load_inference_module(minimal=True):
+    """
+    oci.generative_ai_inference を読み込んで返します。
+
+    minimal=True の場合、oci パッケージの __init__.py を実行せずに空のパッケージとして登録し、
+    生成AI推論サービスと共通モジュールだけを読み込みます。失敗した場合は通常どおり SDK 全体を読み込みます。
+    同じプロセスで他のサービス（oci.core など）も使う場合は minimal=False にしてください。
+    """
+    if minimal and "oci" not in sys.modules:
+        spec = importlib.util.find_spec("oci")
+        if spec is None:
+            raise ImportError("OCI SDK がインストールされていません（pip install oci）")
+        package = importlib.util.module_from_spec(spec)
+        sys.modules["oci"] = package
+        try:
+            for name in _SDK_CORE_MODULES:
+                setattr(package, name, importlib.import_module(f"oci.{name}"))
+            return importlib.import_module("oci.generative_ai_inference")
+        except Exception:
+            _drop_sdk_modules()
+    return importlib.import_module("oci.generative_ai_inference")
+
+
+def inference_models():
+    """
+    oci.generative_ai_inference.models（ChatDetails, CohereChatRequest, ApplyGuardrailsDetails など）
+    """
+    return load_inference_module().models
+
+
+@functools.lru_cache(maxsize=None)
+def load_environment():
+    """
+    .env ファイルを 1 度だけ読み込みます。
+    """
+    from dotenv import load_dotenv, find_dotenv
+    return load_dotenv(find_dotenv())
+
+
+@functools.lru_cache(maxsize=None)
+def _load_config(file_location, profile):
+    load_inference_module()
+    import oci.config
+    return oci.config.from_file(file_location=file_location, profile_name=profile)
+
+
+def load_config(profile="DEFAULT", region=None, file_location=DEFAULT_CONFIG_FILE):
+    """
+    構成ファイルのプロファイルを読み込みます（ファイルの解析はプロファイルごとに 1 度だけ）。
+    region を指定した場合はリージョンを上書きしたコピーを返します。
+    """
+    config = dict(_load_config(os.path.expanduser(file_location), profile))
+    if region is not None:
+        config["region"] = region
+    return config
+
+
+@functools.lru_cache(maxsize=None)
+def get_signer(profile="DEFAULT", file_location=DEFAULT_CONFIG_FILE):
+    """
+    API キーによる署名オブジェクトをプロファイルごとに 1 度だけ生成します（秘密鍵の読み込みと解析を共有）。
+    API キー以外の認証（セッショントークンなど）のプロファイルでは None を返し、SDK の既定の処理に任せます。
+    """
+    config = load_config(profile, file_location=file_location)
+    if "security_token_file" in config or "key_file" not in config and "key_content" not in config:
+        return None
+    import oci.signer
+    return oci.signer.Signer(
+        tenancy=config["tenancy"],
+        user=config["user"],
+        fingerprint=config["fingerprint"],
+        private_key_file_location=config.get("key_file"),
+        pass_phrase=config.get("pass_phrase"),
+        private_key_content=config.get("key_content"),
+    )
+
+
+def get_client(profile="DEFAULT", region=None, service_endpoint=None, file_location=DEFAULT_CONFIG_FILE,
+               timeout=DEFAULT_TIMEOUT, retry_strategy=None):
+    """
+    (プロファイル, リージョン, エンドポイント) ごとにプロセスで共有する GenerativeAiInferenceClient を返します。
+
+    Args:
+        profile (str): 構成ファイルのプロファイル名
+        region (str): リージョン（例: us-chicago-1。省略時はプロファイルの設定）
+        service_endpoint (str): サービスエンドポイント（カスタム・モデル、もしくは、ホスティング専用AIクラスタを使用する際に指定）
+        file_location (str): 構成ファイルのパス
+        timeout (tuple): (接続タイムアウト, 読み取りタイムアウト) 秒
+        retry_strategy: リトライ戦略（省略時はサンプルと同じ NoneRetryStrategy）
+
+    Returns:
+        GenerativeAiInferenceClient
+    """
+    key = (profile, region, service_endpoint, os.path.expanduser(file_location))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            inference = load_inference_module()
+            import oci.retry
+            config = load_config(profile, region, file_location)
+            kwargs = {"retry_strategy": retry_strategy or oci.retry.NoneRetryStrategy(), "timeout": timeout}
+            if service_endpoint is not None:
+                kwargs["service_endpoint"] = service_endpoint
+            signer = get_signer(profile, file_location)
+            if signer is not None:
+                kwargs["signer"] = signer
+            client = _clients[key] = inference.GenerativeAiInferenceClient(config=config, **kwargs)
+    return client
+
+
+def serving_mode(model_id=None, endpoint_id=None):
+    """
+    モデルのサービングモードを返します。
+
+    - model_id を指定: OnDemandServingMode（カスタム・モデル、ホスティング専用AIクラスタを使用しない場合）
+    - endpoint_id を指定: DedicatedServingMode（カスタム・モデル、もしくは、ホスティング専用AIクラスタのエンドポイントを使用する場合）
+    """
+    models = inference_models()
+    if endpoint_id is not None:
+        return models.DedicatedServingMode(endpoint_id=endpoint_id)
+    return models.OnDemandServingMode(model_id=model_id)
+
+
+def clear_cache():
+    """
+    キャッシュしたクライアント・構成・署名オブジェクトを破棄します（構成ファイルを更新した場合など）。
+    """
+    with _lock:
+        _clients.clear()
+    _load_config.cache_clear()
+    get_signer.cache_clear()
@@ -0,0 +1,437 @@
+"""
+embed_text のバッチ処理パイプラインと永続化したベクトルキャッシュ
+
+大量のテキスト（ドキュメントのスニペットなど）を埋め込みに変換するときに、次のようにして呼び出し回数と処理時間を減らします。
+
+- テキストをモデル・inputType・truncate と合わせた SHA-256 のハッシュ（内容のキー）で重複排除
+- キャッシュにないテキストだけを上限の件数（1 回の呼び出しで 96 件）まで詰めたバッチにまとめ、複数のバッチを並行に embed_text
+- 埋め込みは追記のみの float32 のベクトルファイルに書き込み、メモリマップで読み出す
+- 内容のキー → 行番号と、ID → 内容のキーの索引もファイルに追記するため、再実行時は新しいテキストと変更されたテキストだけを埋め込む
+
+ファイルは追記のみで、変更前のテキストのベクトルも残ります（同じテキストに戻した場合は再利用されます）。
+NumPy が必要です（pip install numpy）。
+
+使い方:
+    store = VectorStore("embedding_cache")
+    pipeline = EmbeddingPipeline(generative_ai_inference_client, compartment_id, store, max_concurrency=4)
+    stats = pipeline.run((doc["id"], doc) for doc in documents)   # (ID, テキストまたはドキュメント) のイテラブル
+    print(stats.summary())                                        # texts_per_sec / cache_hit_ratio など
+    vector = pipeline.vector("doc-1")
+    index = VectorIndex.build("docs_index", documents, pipeline)  # embed() を持つので埋め込みとしても使えます
+
+    python genai_embedding_pipeline.py --texts 20000   # ローカルのモックサーバーで計測
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from genai_retrieval import DEFAULT_EMBED_MODEL_ID, EMBED_BATCH_SIZE, TextEmbedder, document_text, synthetic_documents
+
+KEY_SIZE = hashlib.sha256().digest_size
+
+
+def content_key(text, model_id, input_type, truncate):
+    """
+    テキストの内容のキー（SHA-256 のダイジェスト）。モデルや inputType が違えば埋め込みも違うためキーに含めます。
+    """
+    header = f"{model_id}\0{input_type}\0{truncate}\0".encode("utf-8")
+    return hashlib.sha256(header + text.encode("utf-8")).digest()
+
+
+def last_line_end(path, block_size=65536):
+    """
+    ファイルの最後の改行の直後の位置（改行がなければ 0）を、末尾から読んで求めます。
+    """
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            index = f.read(size).rfind(b"\n")
+            if index >= 0:
+                return position + index + 1
+    return 0
+
+
+class VectorStore:
+    """
+    追記のみのベクトルファイルと索引による埋め込みの永続キャッシュ
+
+    ファイル:
+        {path}/meta.json   次元数
+        {path}/vectors.f32   float32 のベクトル（1 行 dimensions 個）を追記
+        {path}/keys.bin   各行の内容のキー（32 バイト）を追記
+        {path}/ids.jsonl   ID → 内容のキーの対応を追記（同じ ID は後の行が優先）
+
+    ベクトルを書いてからキーを書くため、書き込みの途中で止まった場合も開き直したときに
+    キーのない末尾のベクトルを切り詰めて、整合した状態に戻します。
+
+    Args:
+        path (str): キャッシュのディレクトリ
+        sync (bool): 追記のたびに os.fsync するかどうか
+    """
+
+    def __init__(self, path, sync=False):
+        self.path = path
+        self.sync = sync
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._ids_path = os.path.join(path, "ids.jsonl")
+        self.dimensions = None
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                self.dimensions = json.load(f)["dimensions"]
+        self.rows = self._recover()
+        self.keys = {}
+        with open(self._keys_path, "rb") as f:
+            data = f.read(self.rows * KEY_SIZE)
+        for row in range(self.rows):
+            self.keys[data[row * KEY_SIZE:(row + 1) * KEY_SIZE]] = row
+        self.ids = {}
+        with open(self._ids_path, "rb") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.ids[entry["id"]] = bytes.fromhex(entry["key"])
+        self._vectors_file = open(self._vectors_path, "ab")
+        self._keys_file = open(self._keys_path, "ab")
+        self._ids_file = open(self._ids_path, "ab")
+        self._mapped = None
+
+    def _recover(self):
+        for file_path in (self._vectors_path, self._keys_path, self._ids_path):
+            open(file_path, "ab").close()
+        # 書き込みの途中で止まった ids.jsonl の末尾の行を削除する（残すと次の追記がその行に続いて読めなくなる）
+        os.truncate(self._ids_path, last_line_end(self._ids_path))
+        if self.dimensions is None:
+            return 0
+        row_bytes = self.dimensions * 4
+        rows = min(os.path.getsize(self._keys_path) // KEY_SIZE, os.path.getsize(self._vectors_path) // row_bytes)
+        os.truncate(self._vectors_path, rows * row_bytes)
+        os.truncate(self._keys_path, rows * KEY_SIZE)
+        return rows
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def append(self, keys, vectors):
+        """
+        内容のキーと埋め込み（len(keys) × 次元数）を追記します。既にあるキーは無視します。
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+                with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"dimensions": self.dimensions}, f)
+            elif vectors.shape[1] != self.dimensions:
+                raise ValueError(f"次元数が一致しません（{vectors.shape[1]} != {self.dimensions}）")
+            new = [index for index, key in enumerate(keys) if key not in self.keys]
+            if not new:
+                return
+            if len(new) < len(keys):
+                vectors = vectors[new]
+                keys = [keys[index] for index in new]
+            self._vectors_file.write(vectors.tobytes())
+            self._flush(self._vectors_file)
+            self._keys_file.write(b"".join(keys))
+            self._flush(self._keys_file)
+            for key in keys:
+                self.keys[key] = self.rows
+                self.rows += 1
+
+    def assign(self, pairs):
+        """
+        (ID, 内容のキー) の対応を記録します。対応が変わった ID だけを追記します。
+        """
+        lines = []
+        with self._lock:
+            for item_id, key in pairs:
+                if self.ids.get(item_id) != key:
+                    self.ids[item_id] = key
+                    lines.append(json.dumps({"id": item_id, "key": key.hex()}, ensure_ascii=False).encode("utf-8"))
+            if lines:
+                self._ids_file.write(b"\n".join(lines) + b"\n")
+                self._flush(self._ids_file)
+
+    def _flush(self, f):
+        f.flush()
+        if self.sync:
+            os.fsync(f.fileno())
+
+    @property
+    def vectors(self):
+        """
+        ベクトルファイル全体をメモリマップした読み取り専用の行列（追記されていれば開き直します）
+        """
+        with self._lock:
+            if self._mapped is None or self._mapped.shape[0] != self.rows:
+                if not self.rows:
+                    return np.zeros((0, self.dimensions or 0), dtype=np.float32)
+                self._mapped = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                         shape=(self.rows, self.dimensions))
+            return self._mapped
+
+    def lookup(self, keys):
+        """
+        内容のキーの埋め込みを行列で返します（キャッシュにないキーがあれば KeyError）。
+        """
+        rows = [self.keys[key] for key in keys]
+        return np.array(self.vectors[rows])
+
+    def vector(self, item_id):
+        """
+        ID に対応する埋め込み。ID が未登録か、まだ埋め込まれていなければ None。
+        """
+        row = self.keys.get(self.ids.get(item_id))
+        return None if row is None else np.array(self.vectors[row])
+
+    def close(self):
+        for f in (self._vectors_file, self._keys_file, self._ids_file):
+            f.close()
+        self._mapped = None
+
+
+@dataclass
+class EmbeddingStats:
+    """
+    パイプラインの実行結果の集計
+
+    Attributes:
+        texts (int): 入力したテキストの件数
+        cache_hits (int): 永続キャッシュにあったテキストの件数
+        duplicates (int): 同じ実行の中で同じ内容が既に入力されていたテキストの件数
+        embedded (int): embed_text で埋め込んだテキストの件数
+        batches (int): embed_text の呼び出し回数
+        errors (int): 失敗した呼び出しの回数（そのバッチのテキストは次回の実行で再び埋め込みます）
+        failed_texts (int): 失敗した呼び出しに含まれていたテキストの件数
+    """
+    texts: int = 0
+    cache_hits: int = 0
+    duplicates: int = 0
+    embedded: int = 0
+    batches: int = 0
+    errors: int = 0
+    failed_texts: int = 0
+    start: float = field(default_factory=time.perf_counter)
+    end: float = None
+
+    def summary(self):
+        elapsed = (self.end or time.perf_counter()) - self.start
+        return {
+            "texts": self.texts,
+            "cache_hits": self.cache_hits,
+            "duplicates": self.duplicates,
+            "embedded": self.embedded,
+            "batches": self.batches,
+            "errors": self.errors,
+            "failed_texts": self.failed_texts,
+            "elapsed": elapsed,
+            "texts_per_sec": self.texts / elapsed if elapsed else 0.0,
+            "embedded_per_sec": self.embedded / elapsed if elapsed else 0.0,
+            "cache_hit_ratio": self.cache_hits / self.texts if self.texts else 0.0,
+            "dedup_ratio": self.duplicates / self.texts if self.texts else 0.0,
+        }
+
+
+class EmbeddingPipeline:
+    """
+    重複排除・バッチ化・並行呼び出し・永続キャッシュを行う埋め込みのパイプライン
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        compartment_id (str): OCI コンパートメントID
+        store (VectorStore): 埋め込みの永続キャッシュ
+        model_id (str): 埋め込みモデル
+        input_type (str): run() で使う inputType（SEARCH_DOCUMENT | SEARCH_QUERY | CLASSIFICATION | CLUSTERING）
+        truncate (str): 入力がモデルの上限を超えた場合の切り詰め（NONE | START | END）
+        batch_size (int): 1 回の embed_text の件数（上限は 96 件）
+        max_concurrency (int): 並行して呼び出す embed_text の数
+    """
+
+    def __init__(self, client, compartment_id, store, model_id=DEFAULT_EMBED_MODEL_ID,
+                 input_type="SEARCH_DOCUMENT", truncate="END", batch_size=EMBED_BATCH_SIZE, max_concurrency=4):
+        if not 1 <= batch_size <= EMBED_BATCH_SIZE:
+            raise ValueError(f"batch_size は 1〜{EMBED_BATCH_SIZE} で指定してください")
+        self.embedder = TextEmbedder(client, compartment_id, model_id, truncate)
+        self.store = store
+        self.input_type = input_type
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.stats = EmbeddingStats()
+
+    def key(self, text, input_type=None):
+        embedder = self.embedder
+        return content_key(text, embedder.model_id, input_type or self.input_type, embedder.truncate)
+
+    def run(self, items, input_type=None):
+        """
+        (ID, テキストまたはドキュメント) のイテラブルを埋め込み、永続キャッシュに保存します。
+        呼び出し中のバッチが max_concurrency を超えないように入力の読み込みを調整するため、巨大な入力も一定のメモリで処理できます。
+
+        Returns:
+            EmbeddingStats
+        """
+        input_type = input_type or self.input_type
+        stats = self.stats = EmbeddingStats()
+        store = self.store
+        pending = set()
+        assignments = []
+        batch_keys, batch_texts = [], []
+        futures = {}
+        first_row = len(store)
+
+        def collect(return_when):
+            done, _ = wait(futures, return_when=return_when)
+            for future in done:
+                keys = futures.pop(future)
+                stats.batches += 1
+                try:
+                    store.append(keys, future.result())
+                    stats.embedded += len(keys)
+                except Exception:
+                    stats.errors += 1
+                    stats.failed_texts += len(keys)
+                pending.difference_update(keys)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as executor:
+            for item_id, text in items:
+                text = document_text(text)
+                key = self.key(text, input_type)
+                stats.texts += 1
+                if item_id is not None:
+                    assignments.append((item_id, key))
+                row = store.keys.get(key)
+                if row is not None and row < first_row:
+                    stats.cache_hits += 1
+                    continue
+                if row is not None or key in pending:
+                    # この実行の中で既に入力された内容（埋め込み済みまたは呼び出し中）
+                    stats.duplicates += 1
+                    continue
+                pending.add(key)
+                batch_keys.append(key)
+                batch_texts.append(text)
+                if len(batch_keys) == self.batch_size:
+                    if len(futures) >= self.max_concurrency:
+                        collect(FIRST_COMPLETED)
+                    futures[executor.submit(self.embedder.embed, batch_texts, input_type)] = batch_keys
+                    batch_keys, batch_texts = [], []
+                    store.assign(assignments)
+                    assignments = []
+            if batch_keys:
+                futures[executor.submit(self.embedder.embed, batch_texts, input_type)] = batch_keys
+            if futures:
+                collect(ALL_COMPLETED)
+        store.assign(assignments)
+        stats.end = time.perf_counter()
+        return stats
+
+    def embed(self, texts, input_type="SEARCH_DOCUMENT"):
+        """
+        テキストの埋め込みを入力順の行列で返します（StubEmbedder / TextEmbedder と同じインターフェース）。
+        キャッシュにないテキストだけを embed_text で埋め込みます。
+        """
+        texts = [document_text(text) for text in texts]
+        stats = self.run(((None, text) for text in texts), input_type)
+        if stats.errors:
+            raise RuntimeError(f"{stats.errors} 回の embed_text の呼び出しに失敗しました")
+        return self.store.lookup([self.key(text, input_type) for text in texts])
+
+    def vector(self, item_id):
+        return self.store.vector(item_id)
+
+
+def main():
+    import random
+    import shutil
+    import tempfile
+
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer, mock_embedding
+
+    parser = argparse.ArgumentParser(description="モックサーバーに対する埋め込みパイプラインのスループットとキャッシュヒット率の計測")
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="同じ内容のテキストの割合")
+    parser.add_argument("--change-rate", type=float, default=0.05, help="再実行の前に変更・追加するテキストの割合")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--baseline-texts", type=int, default=200, help="1 件ずつ埋め込む比較対象の件数")
+    parser.add_argument("--embed-delay", type=float, default=0.05)
+    parser.add_argument("--cache-dir", help="キャッシュのディレクトリ（省略時は一時ディレクトリ）")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    unique = [document_text(document) for document in
+              synthetic_documents(int(args.texts * (1 - args.duplicate_rate)))]
+    texts = unique + [rng.choice(unique) for _ in range(args.texts - len(unique))]
+    rng.shuffle(texts)
+    items = [(f"doc-{index}", text) for index, text in enumerate(texts)]
+    changed = list(items)
+    for index in rng.sample(range(len(items)), int(len(items) * args.change_rate)):
+        changed[index] = (changed[index][0], changed[index][1] + "（改訂）")
+    changed += [(f"doc-new-{index}", f"新しいドキュメント {index} の本文です。")
+                for index in range(int(len(items) * args.change_rate))]
+
+    path = args.cache_dir or tempfile.mkdtemp(prefix="genai_embedding_")
+    with MockGenAiServer(embed_delay=args.embed_delay) as server:
+        client = GenAiHttpClient(server.endpoint, pool_maxsize=args.concurrency)
+        print(f"{'run':<28} {'texts':>6} {'embedded':>8} {'calls':>6} {'hit ratio':>9} {'dedup':>6} "
+              f"{'texts/sec':>10} {'sec':>6}")
+
+        def report(label, pipeline, run_items):
+            before = server.embed_input_count
+            summary = pipeline.run(run_items).summary()
+            assert server.embed_input_count - before == summary["embedded"]
+            print(f"{label:<28} {summary['texts']:>6} {summary['embedded']:>8} {summary['batches']:>6} "
+                  f"{summary['cache_hit_ratio']:>9.1%} {summary['dedup_ratio']:>6.1%} "
+                  f"{summary['texts_per_sec']:>10.0f} {summary['elapsed']:>6.2f}")
+
+        baseline_path = tempfile.mkdtemp(prefix="genai_embedding_baseline_")
+        try:
+            store = VectorStore(baseline_path)
+            report("one text per call", EmbeddingPipeline(client, "ocid1.compartment.oc1..mock", store,
+                                                          batch_size=1, max_concurrency=1),
+                   items[:args.baseline_texts])
+            store.close()
+        finally:
+            shutil.rmtree(baseline_path, ignore_errors=True)
+
+        try:
+            store = VectorStore(path)
+            pipeline = EmbeddingPipeline(client, "ocid1.compartment.oc1..mock", store, batch_size=args.batch_size,
+                                         max_concurrency=args.concurrency)
+            report(f"cold (batch {args.batch_size} x {args.concurrency})", pipeline, items)
+            store.close()
+            # 開き直して、ファイルから復元したキャッシュで再実行する
+            store = VectorStore(path)
+            pipeline.store = store
+            report("re-run, unchanged", pipeline, items)
+            report(f"re-run, {args.change_rate:.0%} changed + new", pipeline, changed)
+            item_id, text = changed[-1]
+            expected = np.asarray(mock_embedding(text, server.embed_dimensions), dtype=np.float32)
+            assert np.allclose(pipeline.vector(item_id), expected, atol=1e-6)
+            files = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+            print(f"\ncache: {len(store)} vectors, {len(store.ids)} ids, {files:.1f} MB in {path}")
+            store.close()
+        finally:
+            if args.cache_dir is None:
+                shutil.rmtree(path, ignore_errors=True)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+大量のテキストに対する AI Guardrails API の PII 検出・マスキングのパイプライン
+
+長いテキストを文の境界でサイズ上限付きのチャンクに分割し（境界をまたぐ個人識別情報を見逃さないよう前のチャンクと重複させます）、
+ワーカープールで並行に apply_guardrails を呼び出し、各チャンクの offset / length をテキスト全体での位置に戻してから
+マスクしたテキストを入力順に返します。
+
+使い方:
+    pipeline = GuardrailsPipeline(generative_ai_inference_client, compartment_id, max_workers=16)
+    for result in pipeline.scrub(transcripts):     # (document_id, text) のイテラブル
+        print(result.document_id, result.masked_text)
+    print(pipeline.stats.summary())
+
+    python genai_guardrails_pipeline.py --documents 200   # ローカルのモックサーバーで計測
+"""
+import argparse
+import collections
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from genai_pii_masking import mask_spans, resolve_spans
+
+PII_TYPES = ["PERSON", "ADDRESS", "EMAIL", "TELEPHONE_NUMBER"]
+
+_SENTENCE_END = re.compile(r"[.!?。！？\n]+[\"')\]」』）]*\s*")
+
+
+def sentence_boundaries(text):
+    """
+    文の終わりの位置（次の文の開始位置）のリスト
+    """
+    return [match.end() for match in _SENTENCE_END.finditer(text)]
+
+
+def split_chunks(text, max_chars=4000, overlap=200):
+    """
+    テキストを文の境界で max_chars 文字以下のチャンクに分割し、(開始位置, 終了位置) のリストを返します。
+
+    次のチャンクは前のチャンクの終わりから overlap 文字ほど手前の文の境界から始めます（その範囲に境界がなければ
+    ちょうど overlap 文字手前から）。1 文が max_chars を超える場合は文字数で分割します。
+
+    Args:
+        text (str): 分割するテキスト
+        max_chars (int): 1 チャンクの最大文字数
+        overlap (int): 隣り合うチャンクの重複の目安（文字数）
+
+    Returns:
+        list: (開始位置, 終了位置) のリスト
+    """
+    if overlap >= max_chars:
+        raise ValueError("overlap は max_chars より小さくしてください")
+    length = len(text)
+    if length <= max_chars:
+        return [(0, length)]
+    boundaries = sentence_boundaries(text)
+    chunks = []
+    start = 0
+    index = 0
+    while True:
+        limit = start + max_chars
+        if limit >= length:
+            chunks.append((start, length))
+            return chunks
+        # limit 以下で最も後ろの文の境界を探す
+        while index < len(boundaries) and boundaries[index] <= limit:
+            index += 1
+        end = boundaries[index - 1] if index and boundaries[index - 1] > start + overlap else limit
+        chunks.append((start, end))
+        next_start = end - overlap
+        for boundary in reversed(boundaries[:index]):
+            if boundary <= next_start:
+                if start < boundary and boundary >= end - 2 * overlap:
+                    next_start = boundary
+                break
+        # 次のチャンクは必ず前に進める（近くに文の境界が続く場合に同じチャンクを繰り返さない）
+        start = max(next_start, start + 1)
+
+
+@dataclass
+class Detection:
+    """
+    テキスト全体での位置に変換した検出結果
+    """
+    offset: int
+    length: int
+    label: str
+    score: float
+    text: str
+
+    @property
+    def end(self):
+        return self.offset + self.length
+
+
+def merge_detections(detections):
+    """
+    重複したチャンクで二重に検出された（あるいはチャンクの端で一部だけ検出された）同じラベルのスパンを統合します。
+    """
+    merged = []
+    for detection in sorted(detections, key=lambda item: (item.offset, -item.length)):
+        previous = merged[-1] if merged else None
+        if previous is not None and previous.label == detection.label and detection.offset <= previous.end:
+            if detection.end > previous.end:
+                previous.text = previous.text[:detection.offset - previous.offset] + detection.text
+                previous.length = detection.end - previous.offset
+            previous.score = max(previous.score, detection.score)
+            continue
+        merged.append(detection)
+    return merged
+
+
+@dataclass
+class ScrubResult:
+    document_id: object
+    masked_text: str
+    detections: list
+
+
+@dataclass
+class PipelineStats:
+    documents: int = 0
+    chars: int = 0
+    bytes: int = 0
+    chunks: int = 0
+    detections: int = 0
+    errors: int = 0
+    start: float = field(default_factory=time.perf_counter)
+    end: float = None
+
+    def summary(self):
+        elapsed = (self.end or time.perf_counter()) - self.start
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "detections": self.detections,
+            "errors": self.errors,
+            "elapsed": elapsed,
+            "documents_per_sec": self.documents / elapsed if elapsed else 0.0,
+            "bytes_per_sec": self.bytes / elapsed if elapsed else 0.0,
+        }
+
+
+def pii_item_to_detection(item, base):
+    """
+    apply_guardrails の結果の 1 件（SDK モデルまたは WireObject）をテキスト全体での位置に変換します。
+    """
+    return Detection(offset=base + item.offset, length=item.length, label=item.label, score=item.score,
+                     text=item.text)
+
+
+class GuardrailsPipeline:
+    """
+    チャンク分割・並行呼び出し・位置の再マッピング・マスキングを行うパイプライン
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        compartment_id (str): OCI コンパートメントID
+        pii_types (list): 検出する PII のタイプ
+        max_workers (int): 並行して呼び出す apply_guardrails の数
+        max_chars (int): 1 チャンクの最大文字数
+        overlap (int): 隣り合うチャンクの重複（文字数）
+        language_code (str): 入力テキストの言語コード
+        max_pending (int): 結果待ちにできるチャンク数の上限（メモリ使用量の上限になります）
+    """
+
+    def __init__(self, client, compartment_id, pii_types=PII_TYPES, max_workers=8, max_chars=4000, overlap=200,
+                 language_code="en", max_pending=None):
+        self.client = client
+        self.compartment_id = compartment_id
+        self.pii_types = list(pii_types)
+        self.max_workers = max_workers
+        self.max_chars = max_chars
+        self.overlap = overlap
+        self.language_code = language_code
+        self.max_pending = max_pending or max_workers * 4
+        self.stats = PipelineStats()
+        self._stats_lock = threading.Lock()
+
+    def build_details(self, content):
+        """
+        ApplyGuardrailsDetails と同じ構造の dict（OCI SDK のクライアントにもそのまま渡せます）
+        """
+        return {
+            "input": {"type": "TEXT", "content": content, "languageCode": self.language_code},
+            "guardrailConfigs": {"personallyIdentifiableInformationConfig": {"types": self.pii_types}},
+            "compartmentId": self.compartment_id,
+        }
+
+    def detect_chunk(self, text, start, end):
+        response = self.client.apply_guardrails(apply_guardrails_details=self.build_details(text[start:end]))
+        items = response.data.results.personally_identifiable_information or []
+        return [pii_item_to_detection(item, start) for item in items]
+
+    def scrub(self, documents):
+        """
+        (document_id, text) のイテラブルを受け取り、マスク済みの ScrubResult を入力順に返すジェネレーター。
+        結果待ちのチャンクが max_pending を超えないように投入を調整するため、巨大な入力も一定のメモリで処理できます。
+        """
+        pending = collections.deque()
+        in_flight = 0
+        self.stats = PipelineStats()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="guardrails") as executor:
+            for document_id, text in documents:
+                futures = [executor.submit(self.detect_chunk, text, start, end)
+                           for start, end in split_chunks(text, self.max_chars, self.overlap)]
+                pending.append((document_id, text, futures))
+                in_flight += len(futures)
+                while pending and (in_flight > self.max_pending or all(f.done() for f in pending[0][2])):
+                    result, chunk_count = self._finish(*pending.popleft())
+                    in_flight -= chunk_count
+                    yield result
+            while pending:
+                yield self._finish(*pending.popleft())[0]
+        self.stats.end = time.perf_counter()
+
+    def _finish(self, document_id, text, futures):
+        detections = []
+        errors = 0
+        for future in futures:
+            try:
+                detections.extend(future.result())
+            except Exception:
+                errors += 1
+        detections = merge_detections(detections)
+        with self._stats_lock:
+            stats = self.stats
+            stats.documents += 1
+            stats.chars += len(text)
+            stats.bytes += len(text.encode("utf-8"))
+            stats.chunks += len(futures)
+            stats.detections += len(detections)
+            stats.errors += errors
+        if errors:
+            # 一部のチャンクの検出に失敗したテキストはマスク漏れの恐れがあるため出力しない
+            return ScrubResult(document_id, None, detections), len(futures)
+        return ScrubResult(document_id, mask_spans(text, resolve_spans(detections)), detections), len(futures)
+
+
+def synthetic_transcript(index, paragraphs=40):
+    """
+    計測用の文字起こし風テキスト（PII を含む）
+    """
+    lines = []
+    for paragraph in range(paragraphs):
+        lines.append(f"Stream {index}-{paragraph}: Welcome back to my channel! I'm Ethan Hunt, streaming live. "
+                     "Today we're playing some intense stealth games, perfect for my particular skill set. ")
+        if paragraph % 5 == 0:
+            lines.append("Send fan mail to 456 Oak Avenue, Los Angeles, CA 90210 or email "
+                         f"ethan.hunt.vtuber{paragraph}@streammail.net. My manager is at 123-456-7890. ")
+    return "".join(lines)
+
+
+def main():
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+
+    parser = argparse.ArgumentParser(description="モックサーバーに対する PII マスキングパイプラインのスループット計測")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=40)
+    parser.add_argument("--workers", default="1,8,32")
+    parser.add_argument("--max-chars", type=int, default=2000)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--guardrails-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with MockGenAiServer(guardrails_delay=args.guardrails_delay) as server:
+        print(f"{'workers':>7} {'docs/s':>8} {'MB/s':>7} {'chunks':>7} {'detections':>10} {'errors':>6}")
+        for workers in (int(value) for value in args.workers.split(",")):
+            client = GenAiHttpClient(server.endpoint, pool_maxsize=workers)
+            pipeline = GuardrailsPipeline(client, "ocid1.compartment.oc1..mock", max_workers=workers,
+                                          max_chars=args.max_chars, overlap=args.overlap)
+            documents = ((i, synthetic_transcript(i, args.paragraphs)) for i in range(args.documents))
+            for _ in pipeline.scrub(documents):
+                pass
+            summary = pipeline.stats.summary()
+            client.close()
+            print(f"{workers:>7} {summary['documents_per_sec']:>8.1f} {summary['bytes_per_sec'] / 1e6:>7.2f} "
+                  f"{summary['chunks']:>7} {summary['detections']:>10} {summary['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+OCI Generative AI 推論 REST API を標準ライブラリだけで呼び出す軽量 HTTP クライアント
+
+GenerativeAiInferenceClient と同じメソッド名・引数（chat / apply_guardrails / embed_text）と同じ形のレスポンス
+（response.data.chat_response.text、response.data.events() など）を返すため、サンプルのコードを
+変更せずにローカルのモックサーバー（genai_mock_server.py）へ向けて実行・計測できます。
+リクエストへの署名は行いません。OCI のエンドポイントへ直接アクセスする場合は OCI SDK のクライアントを使用してください。
+"""
+import datetime
+import functools
+import http.client
+import json
+import queue
+import socket
+import threading
+import urllib.parse
+import uuid
+
+API_VERSION = "20231130"
+CHAT_PATH = f"/{API_VERSION}/actions/chat"
+APPLY_GUARDRAILS_PATH = f"/{API_VERSION}/actions/applyGuardrails"
+EMBED_TEXT_PATH = f"/{API_VERSION}/actions/embedText"
+
+
+class GenAiServiceError(Exception):
+    """
+    サービスがエラーを返したときの例外。oci.exceptions.ServiceError と同じ属性を持ちます。
+    """
+
+    def __init__(self, status, code, message, headers=None, opc_request_id=None):
+        super().__init__(f"{status} {code}: {message}")
+        self.status = status
+        self.code = code
+        self.message = message
+        self.headers = headers or {}
+        self.request_id = opc_request_id
+
+
+def to_wire(obj):
+    """
+    SDK のモデルオブジェクト・dict・list を REST API の JSON 表現（camelCase のキー）に変換します。
+
+    Args:
+        obj: ChatDetails などの SDK モデル、それと同じ構造の dict、または JSON のボディのバイト列（ChatTemplate.render の結果など）
+
+    Returns:
+        json.dumps でそのままシリアライズできるオブジェクト
+    """
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, (bytes, bytearray)):
+        return json.loads(obj)
+    if isinstance(obj, dict):
+        return {key: to_wire(value) for key, value in obj.items() if value is not None}
+    if isinstance(obj, (list, tuple)):
+        return [to_wire(value) for value in obj]
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    attribute_map = getattr(obj, "attribute_map", None)
+    if attribute_map is not None:
+        wire = {}
+        for name in obj.swagger_types:
+            value = getattr(obj, name)
+            if value is not None:
+                wire[attribute_map[name]] = to_wire(value)
+        return wire
+    raise TypeError(f"シリアライズできないオブジェクトです: {type(obj).__name__}")
+
+
+def dumps_wire(obj):
+    """
+    to_wire の結果を UTF-8 の JSON バイト列にします（ボディのバイト列はそのまま返します）。
+    """
+    if isinstance(obj, (bytes, bytearray)):
+        return bytes(obj)
+    return json.dumps(to_wire(obj), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def _camel(name):
+    head, *tail = name.split("_")
+    return head + "".join(part[:1].upper() + part[1:] for part in tail)
+
+
+def _wrap(value):
+    if isinstance(value, dict):
+        return WireObject(value)
+    if isinstance(value, list):
+        return [_wrap(item) for item in value]
+    return value
+
+
+class WireObject:
+    """
+    REST API の JSON を SDK のモデルと同じ snake_case の属性名で参照できるようにするラッパー
+    （存在しない属性は SDK と同じく None を返します）。
+    """
+    __slots__ = ("_values",)
+
+    def __init__(self, values):
+        self._values = values
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        values = self._values
+        if name in values:
+            return _wrap(values[name])
+        return _wrap(values.get(_camel(name)))
+
+    def to_dict(self):
+        return self._values
+
+    def __eq__(self, other):
+        return isinstance(other, WireObject) and self._values == other._values
+
+    def __repr__(self):
+        return json.dumps(self._values, ensure_ascii=False, indent=2)
+
+
+class HttpResponse:
+    """
+    oci.response.Response と同じ属性（status, headers, data, request_id）を持つレスポンス
+    """
+
+    def __init__(self, status, headers, data, request_id=None):
+        self.status = status
+        self.headers = headers
+        self.data = data
+        self.request_id = request_id
+
+
+class SseEvent:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class SseStream:
+    """
+    ストリーミング応答（text/event-stream）。SDK と同じく events() で SseEvent を順に返します。
+    raw() で受信したバイト列をそのまま取り出すこともできます。
+    """
+
+    def __init__(self, response, connection, pool):
+        self._response = response
+        self._connection = connection
+        self._pool = pool
+        self._closed = False
+
+    def raw(self, chunk_size=16384):
+        """
+        受信したバイト列を到着した単位で返します（最後まで読むと接続はプールに戻ります）。
+        """
+        try:
+            while True:
+                chunk = self._response.read1(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        except BaseException:
+            self.close()
+            raise
+        self._release()
+
+    def events(self):
+        buffer = b""
+        data_lines = []
+        for chunk in self.raw():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line = line.rstrip(b"\r")
+                if not line:
+                    if data_lines:
+                        yield SseEvent(b"\n".join(data_lines).decode("utf-8"))
+                        data_lines = []
+                elif line.startswith(b"data:"):
+                    data_lines.append(line[5:].lstrip(b" "))
+        if data_lines:
+            yield SseEvent(b"\n".join(data_lines).decode("utf-8"))
+
+    def _release(self):
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._connection)
+
+    def close(self):
+        """
+        ストリームを途中で打ち切ります。読み残しがある接続は再利用せずに閉じます。
+        """
+        if not self._closed:
+            self._closed = True
+            self._pool.discard(self._connection)
+
+
+class ConnectionPool:
+    """
+    1 つのエンドポイントに対する Keep-Alive 接続のプール（スレッドセーフ）
+
+    Args:
+        endpoint (str): http(s)://host:port 形式のエンドポイント
+        maxsize (int): プールに保持するアイドル接続の最大数
+        timeout (tuple): (接続タイムアウト, 読み取りタイムアウト) 秒
+    """
+
+    def __init__(self, endpoint, maxsize=10, timeout=(10, 240)):
+        url = urllib.parse.urlsplit(endpoint)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port
+        self.base_path = url.path.rstrip("/")
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+
+    def acquire(self):
+        """
+        アイドル接続を取り出します。なければ新しく接続します。
+
+        Returns:
+            tuple: (接続, 再利用した接続かどうか)
+        """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(self.host, self.port, timeout=self.timeout[0])
+        connection.connect()
+        connection.sock.settimeout(self.timeout[1])
+        # ヘッダーとボディが別々に送信されるため、Nagle アルゴリズムと遅延 ACK による待ちを避ける
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.created += 1
+        return connection, False
+
+    def release(self, connection):
+        if self._idle.qsize() < self.maxsize:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+    def discard(self, connection):
+        connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class GenAiHttpClient:
+    """
+    GenerativeAiInferenceClient 互換の軽量クライアント
+
+    Args:
+        service_endpoint (str): サービスエンドポイント（例: モックサーバーの http://127.0.0.1:8080）
+        pool_maxsize (int): Keep-Alive 接続プールの大きさ（同時実行数に合わせます）
+        timeout (tuple): (接続タイムアウト, 読み取りタイムアウト) 秒
+    """
+
+    def __init__(self, service_endpoint, pool_maxsize=10, timeout=(10, 240)):
+        self.service_endpoint = service_endpoint
+        self.pool = ConnectionPool(service_endpoint, maxsize=pool_maxsize, timeout=timeout)
+
+    def chat(self, chat_details, **kwargs):
+        body = dumps_wire(chat_details)
+        return self.call_api(CHAT_PATH, body, opc_request_id=kwargs.get("opc_request_id"))
+
+    def apply_guardrails(self, apply_guardrails_details, **kwargs):
+        body = dumps_wire(apply_guardrails_details)
+        return self.call_api(APPLY_GUARDRAILS_PATH, body, opc_request_id=kwargs.get("opc_request_id"))
+
+    def embed_text(self, embed_text_details, **kwargs):
+        body = dumps_wire(embed_text_details)
+        return self.call_api(EMBED_TEXT_PATH, body, opc_request_id=kwargs.get("opc_request_id"))
+
+    def call_api(self, path, body, opc_request_id=None):
+        """
+        JSON ボディを POST し、text/event-stream なら SseStream、それ以外は WireObject を data に持つレスポンスを返します。
+        """
+        opc_request_id = opc_request_id or uuid.uuid4().hex.upper()
+        headers = {
+            "content-type": "application/json",
+            "accept": "application/json",
+            "opc-request-id": opc_request_id,
+        }
+        for attempt in range(2):
+            connection, reused = self.pool.acquire()
+            try:
+                connection.request("POST", self.pool.base_path + path, body=body, headers=headers)
+                response = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # サーバー側で閉じられた Keep-Alive 接続を再利用した場合は 1 度だけ新しい接続でやり直す
+                self.pool.discard(connection)
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                self.pool.discard(connection)
+                raise
+        response_headers = {key.lower(): value for key, value in response.getheaders()}
+        request_id = response_headers.get("opc-request-id", opc_request_id)
+        if response.status >= 400:
+            payload = response.read()
+            self._finish(connection, response)
+            try:
+                error = json.loads(payload)
+            except ValueError:
+                error = {}
+            raise GenAiServiceError(response.status, error.get("code", "Unknown"),
+                                    error.get("message", payload.decode("utf-8", "replace")),
+                                    response_headers, request_id)
+        if response_headers.get("content-type", "").startswith("text/event-stream"):
+            return HttpResponse(response.status, response_headers, SseStream(response, connection, self.pool), request_id)
+        payload = response.read()
+        self._finish(connection, response)
+        return HttpResponse(response.status, response_headers, WireObject(json.loads(payload)), request_id)
+
+    def _finish(self, connection, response):
+        if response.will_close:
+            self.pool.discard(connection)
+        else:
+            self.pool.release(connection)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,368 @@
+"""
+推論リクエストの遅延計測とメトリクスのエクスポート
+
+time to first token（TTFT）、トークン間の遅延、tokens/sec、リクエスト / レスポンスのバイト数を
+操作（chat / apply_guardrails）・model_id・リージョンごとに固定メモリのヒストグラム（HDR 方式）へ記録し、
+Prometheus のテキスト形式と JSON Lines で出力します。
+
+使い方（呼び出し側のコードは変更不要）:
+    registry = MetricsRegistry()
+    with instrument(generative_ai_inference_client, registry, region="us-chicago-1"):
+        chat_response = generative_ai_inference_client.chat(chat_detail)
+        ...
+    print(registry.to_prometheus())
+"""
+import contextlib
+import json
+import math
+import threading
+import time
+from array import array
+
+from genai_http_client import to_wire
+
+# 1 つの 2 のべき乗の区間を 64 分割する（相対誤差は約 1.6%）
+_SUB_BUCKET_BITS = 7
+_SUB_BUCKET_COUNT = 1 << _SUB_BUCKET_BITS
+_SUB_BUCKET_HALF = _SUB_BUCKET_COUNT >> 1
+
+
+def _bucket_index(value):
+    if value < _SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - _SUB_BUCKET_BITS
+    return _SUB_BUCKET_COUNT + (shift - 1) * _SUB_BUCKET_HALF + ((value >> shift) - _SUB_BUCKET_HALF)
+
+
+def _bucket_value(index):
+    """
+    バケットの代表値（区間の中央値）
+    """
+    if index < _SUB_BUCKET_COUNT:
+        return index
+    shift = (index - _SUB_BUCKET_COUNT) // _SUB_BUCKET_HALF + 1
+    mantissa = (index - _SUB_BUCKET_COUNT) % _SUB_BUCKET_HALF + _SUB_BUCKET_HALF
+    return (mantissa << shift) + ((1 << shift) >> 1)
+
+
+class HdrHistogram:
+    """
+    HDR 方式（対数・線形の 2 段階のバケット）の固定メモリのヒストグラム
+
+    値は scale 倍して整数に丸めてから記録します（秒を scale=1e6 でマイクロ秒として記録するなど）。
+    highest を超える値は最大のバケットに記録します。
+
+    Args:
+        scale (float): 記録時に掛ける倍率
+        highest (int): 記録する整数値の上限（バケット数はこれで決まり、以後増えません）
+    """
+
+    def __init__(self, scale=1.0, highest=1 << 40):
+        self.scale = scale
+        self.highest = highest
+        self.counts = array("Q", bytes(8 * (_bucket_index(highest) + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        scaled = min(self.highest, max(0, int(value * self.scale + 0.5)))
+        self.counts[_bucket_index(scaled)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """
+        q パーセンタイルの値（元の単位）
+        """
+        if not self.count:
+            return 0.0
+        # genai_async_engine.percentile と同じ最近傍法（順位は q * count / 100 の切り上げ）
+        rank = min(self.count, max(1, math.ceil(q * self.count / 100)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count:
+                seen += bucket_count
+                if seen >= rank:
+                    value = _bucket_value(index) / self.scale
+                    return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other):
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                self.counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min or 0.0,
+            "max": self.max or 0.0,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+# メトリクス名 → (説明, 記録時の倍率)
+METRICS = {
+    "genai_request_latency_seconds": ("リクエスト開始から応答完了までの時間", 1e6),
+    "genai_time_to_first_token_seconds": ("リクエスト開始から最初のイベントまでの時間", 1e6),
+    "genai_inter_token_latency_seconds": ("ストリーミングのイベント間の時間", 1e6),
+    "genai_tokens_per_second": ("最初のイベント以降の生成速度（tokens/sec）", 1e3),
+    "genai_request_payload_bytes": ("リクエストボディのバイト数", 1.0),
+    "genai_response_bytes": ("レスポンスボディのバイト数", 1.0),
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class MetricsRegistry:
+    """
+    (メトリクス名, 操作, model_id, リージョン) ごとのヒストグラムとリクエスト数のカウンター（スレッドセーフ）
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, operation, model_id, region):
+        labels = (operation, model_id or "", region or "")
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = HdrHistogram(scale=METRICS[name][1])
+            histogram.record(value)
+
+    def count_request(self, operation, model_id, region, status):
+        key = (operation, model_id or "", region or "", str(status))
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def histogram(self, name, operation, model_id, region):
+        return self._histograms.get((name, (operation, model_id or "", region or "")))
+
+    def to_prometheus(self):
+        """
+        Prometheus のテキスト形式（histogram は summary として quantile を出力）
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            requests = sorted(self._requests.items())
+        current = None
+        for (name, (operation, model_id, region)), histogram in histograms:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {METRICS[name][0]}")
+                lines.append(f"# TYPE {name} summary")
+            labels = f'operation="{operation}",model_id="{model_id}",region="{region}"'
+            for quantile in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} {histogram.percentile(quantile * 100):.6g}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total:.6g}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        if requests:
+            lines.append("# HELP genai_requests_total 完了したリクエスト数")
+            lines.append("# TYPE genai_requests_total counter")
+            for (operation, model_id, region, status), count in requests:
+                lines.append(f'genai_requests_total{{operation="{operation}",model_id="{model_id}",'
+                             f'region="{region}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self, timestamp=None):
+        """
+        系列ごとに 1 行の JSON（count, sum, min, max, mean, p50, p95, p99）
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        lines = []
+        for (name, (operation, model_id, region)), histogram in histograms:
+            record = {"timestamp": timestamp, "metric": name, "operation": operation,
+                      "model_id": model_id, "region": region}
+            record.update(histogram.snapshot())
+            lines.append(json.dumps(record, ensure_ascii=False))
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def write_json_lines(self, path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_json_lines())
+
+
+class TimedStream:
+    """
+    ストリーミング応答の events() / raw() をそのまま返しつつ、TTFT・イベント間の時間・tokens/sec・受信バイト数を記録します。
+    最終イベント（finishReason を含むイベント）を受け取った時点、またはストリームの終わりで記録を確定します。
+    """
+
+    def __init__(self, stream, observation):
+        self._stream = stream
+        self._observation = observation
+
+    def events(self):
+        observation = self._observation
+        for event in self._stream.events():
+            data = event.data
+            final = '"finishReason"' in data
+            observation.on_event(len(data.encode("utf-8")), not final)
+            if final:
+                observation.finish()
+            yield event
+        observation.finish()
+
+    def raw(self):
+        observation = self._observation
+        for chunk in self._stream.raw():
+            observation.on_event(len(chunk), chunk.count(b"\n\n"))
+            if b'"finishReason"' in chunk:
+                observation.finish()
+            yield chunk
+        observation.finish()
+
+    def close(self):
+        self._stream.close()
+
+
+class Observation:
+    """
+    1 リクエスト分の計測値。finish() で MetricsRegistry に書き込みます（2 回目以降の finish() は無視します）。
+    """
+
+    def __init__(self, registry, operation, model_id, region, payload_bytes):
+        self.registry = registry
+        self.labels = (operation, model_id, region)
+        self.payload_bytes = payload_bytes
+        self.start = time.perf_counter()
+        self.first_event = None
+        self.last_event = None
+        # tokens/sec の計算の起点（None の場合は最初のイベント。非ストリーミングではリクエストの開始）
+        self.generation_start = None
+        self.tokens = 0
+        self.response_bytes = 0
+        self.status = None
+        self._finished = False
+
+    def on_event(self, size, tokens=1):
+        now = time.perf_counter()
+        if self.first_event is None:
+            self.first_event = now
+        elif tokens:
+            self.registry.observe("genai_inter_token_latency_seconds", now - self.last_event, *self.labels)
+        self.last_event = now
+        self.tokens += tokens
+        self.response_bytes += size
+
+    def finish(self, status=200):
+        if self._finished:
+            return
+        self._finished = True
+        end = time.perf_counter()
+        registry, labels = self.registry, self.labels
+        registry.observe("genai_request_latency_seconds", end - self.start, *labels)
+        registry.observe("genai_request_payload_bytes", self.payload_bytes, *labels)
+        registry.observe("genai_response_bytes", self.response_bytes, *labels)
+        if self.first_event is not None:
+            registry.observe("genai_time_to_first_token_seconds", self.first_event - self.start, *labels)
+            generation_start = self.first_event if self.generation_start is None else self.generation_start
+            if self.tokens and end > generation_start:
+                registry.observe("genai_tokens_per_second", self.tokens / (end - generation_start), *labels)
+        registry.count_request(*labels, self.status or status)
+
+
+def _response_size(response):
+    length = (response.headers or {}).get("content-length")
+    if length is not None:
+        return int(length)
+    data = response.data
+    return len(json.dumps(data.to_dict() if hasattr(data, "to_dict") else to_wire(data), ensure_ascii=False).encode("utf-8"))
+
+
+def instrumented_call(registry, method, operation, details, region, *args, **kwargs):
+    """
+    method(details, ...) を呼び出して計測します。ストリーミング応答の場合は data を TimedStream で包みます。
+    """
+    wire = to_wire(details)
+    serving_mode = wire.get("servingMode") or {}
+    model_id = serving_mode.get("modelId") or serving_mode.get("endpointId")
+    if isinstance(details, (bytes, bytearray)):
+        payload_bytes = len(details)
+    else:
+        payload_bytes = len(json.dumps(wire, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    observation = Observation(registry, operation, model_id, region, payload_bytes)
+    try:
+        response = method(details, *args, **kwargs)
+    except Exception as error:
+        observation.status = getattr(error, "status", None) or type(error).__name__
+        observation.finish()
+        raise
+    if callable(getattr(response.data, "events", None)):
+        response.data = TimedStream(response.data, observation)
+        return response
+    observation.on_event(_response_size(response), 0)
+    usage = getattr(getattr(response.data, "chat_response", None), "usage", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if completion_tokens:
+        # 非ストリーミングでは応答全体が一度に届くため、TTFT は応答までの時間のままにし、tokens/sec は全体の時間で求める
+        observation.tokens = completion_tokens
+        observation.generation_start = observation.start
+    observation.finish(response.status)
+    return response
+
+
+class instrument(contextlib.ContextDecorator):
+    """
+    クライアントの chat() / apply_guardrails() を計測付きのメソッドに一時的に差し替えるコンテキストマネージャー
+    （デコレーターとしても使えます）。with ブロックを抜けると元のメソッドに戻ります。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        registry (MetricsRegistry): 記録先
+        region (str): ラベルに使うリージョン（省略時は client の設定から取得）
+    """
+
+    def __init__(self, client, registry, region=None):
+        self.client = client
+        self.registry = registry
+        self.region = region or (getattr(getattr(client, "base_client", None), "config", None) or {}).get("region")
+        self._originals = {}
+
+    def __enter__(self):
+        for operation in ("chat", "apply_guardrails"):
+            original = getattr(self.client, operation, None)
+            if original is None or operation in self._originals:
+                continue
+            self._originals[operation] = original
+
+            def wrapper(*args, _original=original, _operation=operation, **kwargs):
+                if args:
+                    details, args = args[0], args[1:]
+                else:
+                    details = kwargs.pop("chat_details" if _operation == "chat" else "apply_guardrails_details")
+                return instrumented_call(self.registry, _original, _operation, details, self.region, *args, **kwargs)
+
+            setattr(self.client, operation, wrapper)
+        return self.registry
+
+    def __exit__(self, *exc_info):
+        for operation in self._originals:
+            # インスタンス属性を消してクラスのメソッドに戻す
+            delattr(self.client, operation)
+        self._originals.clear()
+        return False
@@ -0,0 +1,397 @@
+"""
+OCI Generative AI 推論 API のローカルモックサーバー
+
+chat（非ストリーミング / server-sent events によるストリーミング）、applyGuardrails と embedText のルートを実装し、
+OCI のテナンシーやネットワークなしで、このリポジトリのクライアントコードのスループットや遅延を計測できるようにします。
+
+記録済みの Cohere のストリーミング応答（fixtures/cohere_chat_stream.sse など）を再生したり、
+トークンの間隔のゆらぎ（jitter）やエラー応答の割合、一部のリクエストだけが極端に遅くなる遅延スパイクを指定したりできます。
+
+使い方:
+    python genai_mock_server.py --port 8080 --token-delay 0.01
+    python genai_mock_server.py --trace fixtures/cohere_chat_stream.sse --jitter 0.5 --error-rate 0.01
+    python genai_mock_server.py --error-rate 0.05 --error-status 429 --retry-after 0.5 --spike-rate 0.02 --spike-delay 2
+"""
+import argparse
+import json
+import math
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from genai_http_client import API_VERSION
+
+DEFAULT_RESPONSE_TEXT = (
+    "Oracle Database は、米国オラクルが開発・販売しているリレーショナルデータベース管理システムです。"
+    "世界初の商用 RDBMS であり、メインフレームからパーソナルコンピュータまで幅広いプラットフォームをサポートしています。"
+    "最新版の Oracle Database 23ai では AI ベクトル検索が導入され、SQL でベクトルの類似性検索とビジネス・データの検索を組み合わせることができます。"
+)
+
+# モックの PII 検出で使用するパターン（AI Guardrails API が返す 4 種類のラベル）
+PII_PATTERNS = {
+    "EMAIL": re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    "TELEPHONE_NUMBER": re.compile(r"\b\d{2,4}-\d{2,4}-\d{3,4}\b"),
+    "ADDRESS": re.compile(r"\b\d+ [A-Z][a-z]+ (?:Avenue|Street|Road|Boulevard)(?:, [A-Z][a-z]+(?: [A-Z][a-z]+)*)*(?:, [A-Z]{2} \d{5})?"),
+}
+DEFAULT_PERSON_NAMES = ("Ethan Hunt",)
+# embedText の 1 回の呼び出しで受け付ける入力の上限
+MAX_EMBED_INPUTS = 96
+_FEATURE_PATTERN = re.compile(r"[0-9a-z]+|[^\W_]")
+
+
+def split_tokens(text, token_chars=3):
+    """
+    応答テキストをストリーミングのトークン（text デルタ）に分割します。
+    """
+    return [text[i:i + token_chars] for i in range(0, len(text), token_chars)]
+
+
+def load_trace(path):
+    """
+    記録済みの SSE 応答（"data: {...}" を空行で区切ったファイル）を読み込み、
+    (トークンイベントの data のリスト, 最終イベントの dict) を返します。
+    """
+    with open(path, encoding="utf-8") as f:
+        blocks = [block for block in f.read().split("\n\n") if block.startswith("data:")]
+    data = [block[5:].lstrip(" ").encode("utf-8") for block in blocks]
+    return data[:-1], json.loads(data[-1])
+
+
+def detect_pii(text, types, person_names=DEFAULT_PERSON_NAMES):
+    """
+    正規表現と既知の人名リストによる簡易的な PII 検出（AI Guardrails API の応答形式で返します）。
+    """
+    results = []
+    for label, pattern in PII_PATTERNS.items():
+        if label in types:
+            for match in pattern.finditer(text):
+                results.append((match.start(), match.group(), label))
+    if "PERSON" in types:
+        for name in person_names:
+            for match in re.finditer(re.escape(name), text):
+                results.append((match.start(), match.group(), "PERSON"))
+    results.sort()
+    return [{"length": len(value), "offset": offset, "text": value, "label": label, "score": 0.9876}
+            for offset, value, label in results]
+
+
+def hashed_features(text, dimensions):
+    """
+    テキストの特徴量（英数字の単語とそれ以外の 1 文字、および隣り合う 2 つの並び）を CRC32 で dimensions 次元に割り当て、
+    (次元, 符号) を順に返します（genai_retrieval.StubEmbedder と共通）。
+    """
+    tokens = _FEATURE_PATTERN.findall(text.lower())
+    for feature in tokens + [a + b for a, b in zip(tokens, tokens[1:])]:
+        hashed = zlib.crc32(feature.encode("utf-8"))
+        yield hashed % dimensions, 1.0 if hashed & 0x80000000 else -1.0
+
+
+def mock_embedding(text, dimensions):
+    """
+    テキストから決定的な埋め込み（hashed_features の特徴量ハッシュを L2 正規化したもの）を作ります。
+    """
+    vector = [0.0] * dimensions
+    for column, sign in hashed_features(text, dimensions):
+        vector[column] += sign
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [round(value / norm, 6) for value in vector]
+
+
+class MockGenAiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockGenAi/1.0"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.record_request(self.path, length)
+        route = self.server.routes.get(self.path)
+        if route is None:
+            self.send_json(404, {"code": "NotAuthorizedOrNotFound", "message": f"Unknown path {self.path}"})
+            return
+        route(self, body)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("opc-request-id", self.headers.get("opc-request-id") or uuid.uuid4().hex.upper())
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_event_stream(self):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.send_header("opc-request-id", self.headers.get("opc-request-id") or uuid.uuid4().hex.upper())
+        self.end_headers()
+
+    def send_event(self, payload):
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        data = b"data: " + payload + b"\n\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def end_event_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def handle_chat(handler, body):
+    server = handler.server
+    if server.maybe_fail(handler):
+        return
+    chat_request = body.get("chatRequest", {})
+    if server.trace is not None:
+        tokens, final = server.trace
+    else:
+        message = chat_request.get("message", "")
+        text = server.response_text
+        tokens = split_tokens(text, server.token_chars)
+        chat_history = list(chat_request.get("chatHistory", [])) + [
+            {"role": "USER", "message": message},
+            {"role": "CHATBOT", "message": text},
+        ]
+        final = {"apiFormat": "COHERE", "text": text, "chatHistory": chat_history, "finishReason": "COMPLETE"}
+        if chat_request.get("documents"):
+            final["citations"] = [{"start": 0, "end": 15, "text": text[:15], "documentIds": ["doc_0"]}]
+        if chat_request.get("isEcho"):
+            final["prompt"] = message
+    time.sleep(server.first_token_delay + server.next_spike_delay())
+    if not chat_request.get("isStream"):
+        time.sleep(sum(server.next_token_delay() for _ in tokens))
+        handler.send_json(200, {"modelId": body.get("servingMode", {}).get("modelId"), "modelVersion": "1.0",
+                                "chatResponse": final})
+        return
+    handler.start_event_stream()
+    try:
+        for token in tokens:
+            handler.send_event(token if isinstance(token, bytes) else {"apiFormat": "COHERE", "text": token})
+            delay = server.next_token_delay()
+            if delay:
+                time.sleep(delay)
+        handler.send_event(final)
+        handler.end_event_stream()
+    except (BrokenPipeError, ConnectionResetError):
+        handler.close_connection = True
+
+
+def handle_apply_guardrails(handler, body):
+    server = handler.server
+    if server.maybe_fail(handler):
+        return
+    content = body.get("input", {}).get("content", "")
+    configs = body.get("guardrailConfigs", {})
+    results = {}
+    if "contentModerationConfig" in configs:
+        results["contentModeration"] = {"categories": [{"name": "OVERALL", "score": 0.0}]}
+    if "promptInjectionConfig" in configs:
+        results["promptInjection"] = {"score": 0.0}
+    pii_config = configs.get("personallyIdentifiableInformationConfig")
+    if pii_config is not None:
+        results["personallyIdentifiableInformation"] = detect_pii(content, pii_config.get("types", []),
+                                                                  server.person_names)
+    time.sleep(server.guardrails_delay + server.next_spike_delay())
+    handler.send_json(200, {"results": results})
+
+
+def handle_embed_text(handler, body):
+    server = handler.server
+    if server.maybe_fail(handler):
+        return
+    inputs = body.get("inputs", [])
+    if not inputs or len(inputs) > MAX_EMBED_INPUTS:
+        handler.send_json(400, {"code": "InvalidParameter",
+                                "message": f"inputs must contain 1 to {MAX_EMBED_INPUTS} items"})
+        return
+    server.record_embed_inputs(len(inputs))
+    embeddings = [mock_embedding(text, server.embed_dimensions) for text in inputs]
+    time.sleep(server.embed_delay + server.next_spike_delay())
+    handler.send_json(200, {"id": uuid.uuid4().hex, "embeddings": embeddings,
+                            "modelId": body.get("servingMode", {}).get("modelId"), "modelVersion": "3.0"})
+
+
+class MockGenAiServer(ThreadingHTTPServer):
+    """
+    モックサーバー本体。with 文で使うとバックグラウンドのスレッドで起動・停止します。
+
+    Args:
+        host (str): 待ち受けアドレス
+        port (int): 待ち受けポート（0 の場合は空いているポートを使用）
+        response_text (str): chat が返す応答テキスト
+        token_chars (int): ストリーミング時に 1 イベントで返す文字数
+        first_token_delay (float): 最初のトークンまでの遅延（秒）
+        token_delay (float): トークン間の遅延（秒）
+        guardrails_delay (float): applyGuardrails の処理時間（秒）
+        embed_delay (float): embedText の 1 回の呼び出しの処理時間（秒）
+        embed_dimensions (int): embedText が返す埋め込みの次元数
+        person_names (tuple): PERSON として検出する人名
+        trace (str): 再生する記録済みの SSE 応答のファイル（指定した場合は response_text より優先）
+        jitter (float): トークン間の遅延のゆらぎ（token_delay に対する割合。0.5 なら ±50%）
+        error_rate (float): エラー応答を返す割合（0〜1）
+        error_status (int): エラー応答の HTTP ステータス
+        retry_after (float): 429 のエラー応答に付ける Retry-After ヘッダーの秒数（None の場合は付けない）
+        spike_rate (float): 遅延スパイクを起こすリクエストの割合（0〜1）
+        spike_delay (float): 遅延スパイクで最初のトークン（applyGuardrails と embedText は応答）の前に追加する遅延（秒）
+        seed (int): jitter・エラー・遅延スパイクの乱数のシード
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host="127.0.0.1", port=0, response_text=DEFAULT_RESPONSE_TEXT, token_chars=3,
+                 first_token_delay=0.0, token_delay=0.0, guardrails_delay=0.0, embed_delay=0.0, embed_dimensions=256,
+                 person_names=DEFAULT_PERSON_NAMES, trace=None, jitter=0.0, error_rate=0.0, error_status=500,
+                 retry_after=None, spike_rate=0.0, spike_delay=0.0, seed=None):
+        super().__init__((host, port), MockGenAiRequestHandler)
+        self.response_text = response_text
+        self.token_chars = token_chars
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.guardrails_delay = guardrails_delay
+        self.embed_delay = embed_delay
+        self.embed_dimensions = embed_dimensions
+        self.person_names = person_names
+        self.trace = load_trace(trace) if trace else None
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.spike_rate = spike_rate
+        self.spike_delay = spike_delay
+        self.spike_count = 0
+        self.random = random.Random(seed)
+        self.error_count = 0
+        self.routes = {
+            f"/{API_VERSION}/actions/chat": handle_chat,
+            f"/{API_VERSION}/actions/applyGuardrails": handle_apply_guardrails,
+            f"/{API_VERSION}/actions/embedText": handle_embed_text,
+        }
+        self.request_count = 0
+        self.embed_input_count = 0
+        self.request_bytes = 0
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record_request(self, path, length):
+        with self._stats_lock:
+            self.request_count += 1
+            self.request_bytes += length
+
+    def record_embed_inputs(self, count):
+        with self._stats_lock:
+            self.embed_input_count += count
+
+    def next_token_delay(self):
+        if not self.jitter:
+            return self.token_delay
+        return max(0.0, self.token_delay * (1 + self.random.uniform(-self.jitter, self.jitter)))
+
+    def next_spike_delay(self):
+        """
+        spike_rate の割合で spike_delay を、それ以外は 0 を返します。
+        """
+        if not self.spike_rate or self.random.random() >= self.spike_rate:
+            return 0.0
+        with self._stats_lock:
+            self.spike_count += 1
+        return self.spike_delay
+
+    def maybe_fail(self, handler):
+        """
+        error_rate の割合でエラー応答を返します。エラー応答を返した場合は True。
+        """
+        if not self.error_rate or self.random.random() >= self.error_rate:
+            return False
+        with self._stats_lock:
+            self.error_count += 1
+        headers = {}
+        if self.error_status == 429:
+            code = "TooManyRequests"
+            if self.retry_after is not None:
+                headers["retry-after"] = f"{self.retry_after:g}"
+        else:
+            code = "InternalServerError"
+        handler.send_json(self.error_status, {"code": code, "message": "injected by mock server"}, headers)
+        return True
+
+    def handle_error(self, request, client_address):
+        # クライアントが切断した接続（取り消したストリームなど）のエラーは表示しない
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-genai-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCI Generative AI 推論 API のローカルモックサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--guardrails-delay", type=float, default=0.05)
+    parser.add_argument("--embed-delay", type=float, default=0.05)
+    parser.add_argument("--embed-dimensions", type=int, default=256)
+    parser.add_argument("--trace", help="再生する記録済みの SSE 応答のファイル")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--retry-after", type=float)
+    parser.add_argument("--spike-rate", type=float, default=0.0)
+    parser.add_argument("--spike-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = MockGenAiServer(args.host, args.port, first_token_delay=args.first_token_delay,
+                             token_delay=args.token_delay, guardrails_delay=args.guardrails_delay,
+                             embed_delay=args.embed_delay, embed_dimensions=args.embed_dimensions,
+                             trace=args.trace, jitter=args.jitter, error_rate=args.error_rate,
+                             error_status=args.error_status, retry_after=args.retry_after,
+                             spike_rate=args.spike_rate, spike_delay=args.spike_delay, seed=args.seed)
+    print(f"mock OCI Generative AI endpoint: {server.endpoint}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
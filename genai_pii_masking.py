@@ -0,0 +1,198 @@
+"""
+AI Guardrails API の PII 検出結果によるマスキング処理
+
+AI Guardrails API のノートブックの mask_personal_information は検出ごとに文字列全体をスライスして作り直すため、
+テキストの長さ n と検出数 k に対して O(n·k) のコピーが発生します。このモジュールは検出結果を offset 順に 1 回走査し、
+変更のない部分とマスク文字列をリストに積んで最後に 1 回だけ連結します（O(n + k log k)）。
+
+- ラベル → マスク文字列の対応表（MASKS）
+- 重なり合う・入れ子になったスパンの統合
+- スコアのしきい値
+- マスク後の位置と元の位置を相互に変換し、元のテキストを復元できるオフセットマップ
+
+使い方:
+    masked_text = mask_personal_information(INPUT_TEXT, apply_guardrails_response)
+    masked_text, offset_map = mask_personal_information(INPUT_TEXT, apply_guardrails_response, min_score=0.5,
+                                                        return_offset_map=True)
+    original_text = offset_map.restore(masked_text)
+"""
+import bisect
+from dataclasses import dataclass
+
+MASKS = {
+    "PERSON": "### [PERSON] ###",
+    "ADDRESS": "### [ADDRESS] ###",
+    "EMAIL": "### [EMAIL] ###",
+    "TELEPHONE_NUMBER": "### [PHONE] ###",
+}
+DEFAULT_MASK = "### [PII] ###"
+
+
+@dataclass
+class Span:
+    """
+    マスクする範囲 [start, end)
+    """
+    start: int
+    end: int
+    label: str
+    score: float = 1.0
+
+
+@dataclass
+class MaskedSpan:
+    """
+    オフセットマップの 1 件（元のテキストの範囲とマスク後のテキストの範囲の対応）
+    """
+    original_start: int
+    original_end: int
+    masked_start: int
+    masked_end: int
+    label: str
+    original_text: str
+
+
+class OffsetMap:
+    """
+    マスク後のテキストと元のテキストの位置の対応表
+    """
+
+    def __init__(self, spans):
+        self.spans = spans
+        self._masked_starts = [span.masked_start for span in spans]
+        self._original_starts = [span.original_start for span in spans]
+
+    def __len__(self):
+        return len(self.spans)
+
+    def to_original(self, masked_position):
+        """
+        マスク後のテキストの位置を元のテキストの位置に変換します（マスク文字列の内部はそのスパンの先頭に対応させます）。
+        """
+        index = bisect.bisect_right(self._masked_starts, masked_position) - 1
+        if index < 0:
+            return masked_position
+        span = self.spans[index]
+        if masked_position < span.masked_end:
+            return span.original_start
+        return span.original_end + (masked_position - span.masked_end)
+
+    def to_masked(self, original_position):
+        """
+        元のテキストの位置をマスク後のテキストの位置に変換します（マスクした範囲の内部はマスク文字列の先頭に対応させます）。
+        """
+        index = bisect.bisect_right(self._original_starts, original_position) - 1
+        if index < 0:
+            return original_position
+        span = self.spans[index]
+        if original_position < span.original_end:
+            return span.masked_start
+        return span.masked_end + (original_position - span.original_end)
+
+    def restore(self, masked_text):
+        """
+        マスク後のテキストから元のテキストを復元します。
+        """
+        parts = []
+        position = 0
+        for span in self.spans:
+            parts.append(masked_text[position:span.masked_start])
+            parts.append(span.original_text)
+            position = span.masked_end
+        parts.append(masked_text[position:])
+        return "".join(parts)
+
+
+def pii_items(guardrails_result):
+    """
+    apply_guardrails のレスポンス、その data、または検出結果のリストから PII の検出結果のリストを取り出します。
+    """
+    if isinstance(guardrails_result, (list, tuple)):
+        return guardrails_result
+    data = getattr(guardrails_result, "data", guardrails_result)
+    return data.results.personally_identifiable_information or []
+
+
+def resolve_spans(items, min_score=0.0):
+    """
+    検出結果をスコアのしきい値で絞り込み、offset 順に並べて重なりを統合した Span のリストを返します。
+
+    重なり合うスパンは 1 つにまとめます。ラベルは先に始まる（同じ位置なら長い）スパンのもの、スコアは最大値を使います。
+    入れ子になったスパンは外側のスパンに含めます。
+
+    Args:
+        items: offset, length, label, score の属性を持つ検出結果のイテラブル
+        min_score (float): これ未満のスコアの検出結果は無視します
+
+    Returns:
+        list: Span のリスト（互いに重ならない、offset 順）
+    """
+    candidates = sorted(
+        ((item.offset, item.offset + item.length, item.label, item.score if item.score is not None else 1.0)
+         for item in items if item.length > 0 and (item.score is None or item.score >= min_score)),
+        key=lambda candidate: (candidate[0], -candidate[1]))
+    spans = []
+    for start, end, label, score in candidates:
+        if spans and start < spans[-1].end:
+            previous = spans[-1]
+            if end > previous.end:
+                previous.end = end
+            if score > previous.score:
+                previous.score = score
+            continue
+        spans.append(Span(start, end, label, score))
+    return spans
+
+
+def mask_spans(text, spans, masks=MASKS, default_mask=DEFAULT_MASK, return_offset_map=False):
+    """
+    互いに重ならない offset 順の Span をマスク文字列に置き換えます（1 回の走査と 1 回の連結）。
+
+    Returns:
+        str: マスクしたテキスト（return_offset_map=True の場合は (テキスト, OffsetMap)）
+    """
+    parts = []
+    append = parts.append
+    position = 0
+    masked_position = 0
+    mapping = [] if return_offset_map else None
+    for span in spans:
+        mask = masks.get(span.label, default_mask)
+        append(text[position:span.start])
+        append(mask)
+        if mapping is not None:
+            masked_start = masked_position + (span.start - position)
+            masked_position = masked_start + len(mask)
+            mapping.append(MaskedSpan(span.start, span.end, masked_start, masked_position, span.label,
+                                      text[span.start:span.end]))
+        position = span.end
+    append(text[position:])
+    masked_text = "".join(parts)
+    if mapping is not None:
+        return masked_text, OffsetMap(mapping)
+    return masked_text
+
+
+def mask_personal_information(original_text, guardrails_result, min_score=0.0, masks=MASKS,
+                              return_offset_map=False, verbose=False):
+    """
+    AI Guardrails API の個人識別情報検出結果を使用して、元のテキストの個人識別情報をマスクします。
+
+    Args:
+        original_text (str): 元のテキスト
+        guardrails_result: apply_guardrails の結果（レスポンス、data、または検出結果のリスト）
+        min_score (float): マスクする検出結果のスコアの下限
+        masks (dict): ラベル → マスク文字列の対応表（ない場合は DEFAULT_MASK）
+        return_offset_map (bool): True の場合はオフセットマップも返します
+        verbose (bool): True の場合はマスクした PII を表示します
+
+    Returns:
+        str: 個人識別情報がマスクされたテキスト（return_offset_map=True の場合は (テキスト, OffsetMap)）
+    """
+    items = pii_items(guardrails_result)
+    if verbose:
+        for pii_item in items:
+            if pii_item.score is not None and pii_item.score < min_score:
+                continue
+            print(f"マスクした PII: タイプ={pii_item.label}, テキスト=\"{pii_item.text}\", スコア={pii_item.score:.4f}")
+    return mask_spans(original_text, resolve_spans(items, min_score), masks, return_offset_map=return_offset_map)
@@ -0,0 +1,331 @@
+"""
+レイテンシを考慮したマルチリージョンのルーター
+
+サンプルはスクリプトごとにリージョンを固定しています（チャットのサンプルは us-chicago-1、AI Guardrails API のノートブックは ap-osaka-1）。
+そのため、同じ model_id を提供する近いリージョンがあっても、東京からのトラフィックが太平洋を渡ります。
+このモジュールは候補のリージョンごとにクライアントを持ち、次のように ChatDetails の送信先を選びます。
+
+- リージョンごとに TTFT（ストリーミングは最初のイベントまで、非ストリーミングは応答まで）と TCP の接続時間の
+  指数移動平均（EWMA）を記録し、モデルを提供している正常なリージョンのうち最も速いリージョンに送信
+- 5xx・429・接続エラーのときは次に速いリージョンにフェイルオーバー（ストリーミングは応答ヘッダーを受け取るまで）
+- 失敗が続いたリージョンはサーキットブレーカーで一定時間候補から外し、その後少数のリクエストで回復を確認
+- 一部のリクエスト（explore_rate）を最速以外のリージョンに送り、EWMA が古くならないようにする
+
+使い方:
+    router = RegionRouter.from_profile({
+        "ap-tokyo-1": None,                                   # None はすべてのモデルを提供
+        "ap-osaka-1": ["cohere.command-a-03-2025"],
+        "us-chicago-1": None,
+    }, profile="DEFAULT")
+    router.probe_all()                                        # 接続時間の初期値（省略可）
+    chat_response = router.chat(chat_detail)
+    print(router.snapshot())
+
+    python genai_region_router.py   # 遅延の異なる 3 つのモックサーバーで計測
+"""
+import argparse
+import random
+import socket
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+
+from genai_http_client import GenAiServiceError
+from genai_resilience import CircuitBreaker, is_connection_error, serving_model
+
+# 別のリージョンに送り直すエラー（429 は他のリージョンに余裕がある可能性があるため）
+FAILOVER_STATUS = frozenset((429, 500, 502, 503, 504))
+
+
+class Ewma:
+    """
+    指数移動平均（最初の値はそのまま平均にします）
+
+    Args:
+        alpha (float): 新しい値の重み（0〜1）
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.value = None
+        self.count = 0
+
+    def update(self, value):
+        self.value = value if self.value is None else self.value + self.alpha * (value - self.value)
+        self.count += 1
+
+
+@dataclass
+class RegionRoute:
+    """
+    ルーティング先のリージョン
+
+    Attributes:
+        region (str): リージョン名
+        client: そのリージョンの GenerativeAiInferenceClient または GenAiHttpClient
+        models (set): 提供しているモデルの model_id（DedicatedServingMode の場合は endpoint_id）。None はすべて
+        connect (Ewma): TCP の接続時間（probe() で計測）
+        ttft (Ewma): chat の TTFT
+        guardrails (Ewma): apply_guardrails の応答時間
+        breaker (CircuitBreaker): サーキットブレーカー
+        requests (int): 送信したリクエスト数
+        failures (int): 失敗したリクエスト数
+    """
+    region: str
+    client: object
+    models: set = None
+    connect: Ewma = None
+    ttft: Ewma = None
+    guardrails: Ewma = None
+    breaker: CircuitBreaker = None
+    requests: int = 0
+    failures: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def offers(self, model):
+        return self.models is None or model is None or model in self.models
+
+    def score(self, operation):
+        """
+        送信先を選ぶときの推定時間（秒）。計測値がない場合は 0（優先して試す）。
+        """
+        ewma = self.ttft if operation == "chat" else self.guardrails
+        if ewma.value is not None:
+            return ewma.value
+        return self.connect.value or 0.0
+
+    def record(self, ewma, value):
+        with self._lock:
+            ewma.update(value)
+
+
+def endpoint_address(client):
+    """
+    クライアントのエンドポイントの (ホスト, ポート)
+    """
+    endpoint = getattr(client, "service_endpoint", None) or client.base_client.endpoint
+    url = urllib.parse.urlsplit(endpoint)
+    return url.hostname, url.port or (443 if url.scheme == "https" else 80)
+
+
+class _FirstEventStream:
+    """
+    最初のイベント（チャンク）を受け取った時点で on_first を呼び出すストリームのラッパー
+    """
+
+    def __init__(self, stream, on_first):
+        self._stream = stream
+        self._on_first = on_first
+
+    def _first(self):
+        if self._on_first is not None:
+            self._on_first()
+            self._on_first = None
+
+    def events(self):
+        for event in self._stream.events():
+            self._first()
+            yield event
+
+    def raw(self, *args, **kwargs):
+        for chunk in self._stream.raw(*args, **kwargs):
+            self._first()
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class RegionRouter:
+    """
+    GenerativeAiInferenceClient 互換の chat() / apply_guardrails() を持つマルチリージョンのルーター
+
+    Args:
+        routes (list): RegionRoute のリスト
+        alpha (float): EWMA の新しい値の重み
+        explore_rate (float): 最速以外のリージョンに送るリクエストの割合
+        failure_threshold (int): リージョンを候補から外すまでの連続失敗回数
+        recovery_timeout (float): 候補から外したリージョンを再び試すまでの時間（秒）
+        seed (int): explore_rate の乱数のシード
+    """
+
+    def __init__(self, routes, alpha=0.2, explore_rate=0.05, failure_threshold=3, recovery_timeout=10.0, seed=None):
+        self.routes = list(routes)
+        for route in self.routes:
+            route.connect = route.connect or Ewma(alpha)
+            route.ttft = route.ttft or Ewma(alpha)
+            route.guardrails = route.guardrails or Ewma(alpha)
+            route.breaker = route.breaker or CircuitBreaker(failure_threshold, recovery_timeout)
+        self.explore_rate = explore_rate
+        self.random = random.Random(seed)
+        self.failovers = 0
+
+    @classmethod
+    def from_profile(cls, regions, profile="DEFAULT", **kwargs):
+        """
+        genai_client_factory で各リージョンのクライアントを作り、ルーターを返します。
+
+        Args:
+            regions (dict): リージョン名 → 提供しているモデルのリスト（None はすべて）
+            profile (str): 構成ファイルのプロファイル名
+        """
+        from genai_client_factory import get_client
+        routes = [RegionRoute(region, get_client(profile=profile, region=region),
+                              set(models) if models is not None else None)
+                  for region, models in regions.items()]
+        return cls(routes, **kwargs)
+
+    def probe(self, route, timeout=3.0):
+        """
+        リージョンのエンドポイントへの TCP 接続時間を計測して EWMA に記録します。接続できない場合は失敗として記録します。
+        """
+        start = time.perf_counter()
+        try:
+            socket.create_connection(endpoint_address(route.client), timeout=timeout).close()
+        except OSError:
+            route.breaker.record_failure()
+            return None
+        elapsed = time.perf_counter() - start
+        route.record(route.connect, elapsed)
+        return elapsed
+
+    def probe_all(self, timeout=3.0):
+        return {route.region: self.probe(route, timeout) for route in self.routes}
+
+    def candidates(self, operation, model):
+        """
+        モデルを提供しているリージョンを推定時間の短い順に返します。explore_rate の割合で 2 番目以降の 1 つを先頭にします。
+        """
+        routes = sorted((route for route in self.routes if route.offers(model)),
+                        key=lambda route: route.score(operation))
+        if len(routes) > 1 and self.explore_rate and self.random.random() < self.explore_rate:
+            routes.insert(0, routes.pop(self.random.randrange(1, len(routes))))
+        return routes
+
+    def chat(self, chat_details, **kwargs):
+        return self.call("chat", chat_details, serving_model(chat_details), **kwargs)
+
+    def apply_guardrails(self, apply_guardrails_details, **kwargs):
+        return self.call("apply_guardrails", apply_guardrails_details, None, **kwargs)
+
+    def call(self, operation, details, model, **kwargs):
+        """
+        推定時間の短い正常なリージョンから順に送信し、5xx・429・接続エラーのときは次のリージョンにフェイルオーバーします。
+        """
+        routes = self.candidates(operation, model)
+        if not routes:
+            raise GenAiServiceError(404, "NotAuthorizedOrNotFound", f"no candidate region offers {model}")
+        error = None
+        for route in routes:
+            if not route.breaker.allow():
+                continue
+            if error is not None:
+                self.failovers += 1
+            with route._lock:
+                route.requests += 1
+            start = time.perf_counter()
+            try:
+                response = getattr(route.client, operation)(details, **kwargs)
+            except Exception as exc:
+                status = getattr(exc, "status", None)
+                with route._lock:
+                    route.failures += 1
+                if (status is not None and status >= 500) or (status is None and is_connection_error(exc)):
+                    route.breaker.record_failure()
+                else:
+                    route.breaker.record_success()
+                if status not in FAILOVER_STATUS and not (status is None and is_connection_error(exc)):
+                    raise
+                error = exc
+                continue
+            route.breaker.record_success()
+            ewma = route.ttft if operation == "chat" else route.guardrails
+            if callable(getattr(response.data, "events", None)):
+                response.data = _FirstEventStream(
+                    response.data, lambda route=route, ewma=ewma: route.record(ewma, time.perf_counter() - start))
+            else:
+                route.record(ewma, time.perf_counter() - start)
+            return response
+        if error is None:
+            raise GenAiServiceError(503, "NoHealthyRegion", f"all regions offering {model} are unavailable")
+        raise error
+
+    def snapshot(self):
+        """
+        リージョンごとの EWMA・送信数・失敗数・ブレーカーの状態
+        """
+        return [{
+            "region": route.region,
+            "connect_ms": route.connect.value * 1000 if route.connect.value is not None else None,
+            "ttft_ms": route.ttft.value * 1000 if route.ttft.value is not None else None,
+            "guardrails_ms": route.guardrails.value * 1000 if route.guardrails.value is not None else None,
+            "requests": route.requests,
+            "failures": route.failures,
+            "breaker": route.breaker.state,
+        } for route in self.routes]
+
+    def close(self):
+        for route in self.routes:
+            close = getattr(route.client, "close", None)
+            if close is not None:
+                close()
+
+
+def main():
+    from genai_async_engine import AsyncChatEngine, build_chat_details
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+
+    parser = argparse.ArgumentParser(description="遅延の異なる複数のモックサーバーに対するルーティングとフェイルオーバーの確認")
+    parser.add_argument("--requests", type=int, default=200, help="各フェーズのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--recovery-timeout", type=float, default=1.0)
+    args = parser.parse_args()
+
+    model_id = "cohere.command-a-03-2025"
+    # リージョン名, 最初のトークンまでの遅延, 提供しているモデル（None はすべて）
+    regions = [
+        ("ap-tokyo-1", 0.01, {"cohere.command-r-plus-08-2024"}),
+        ("ap-osaka-1", 0.03, None),
+        ("us-chicago-1", 0.15, None),
+    ]
+    servers = {name: MockGenAiServer(first_token_delay=delay, token_delay=0.001).start()
+               for name, delay, _ in regions}
+    router = RegionRouter([RegionRoute(name, GenAiHttpClient(servers[name].endpoint, pool_maxsize=args.concurrency),
+                                       models) for name, _, models in regions],
+                          recovery_timeout=args.recovery_timeout, seed=0)
+    router.probe_all()
+
+    def run_phase(label):
+        before = {item["region"]: item for item in router.snapshot()}
+        jobs = (build_chat_details(f"質問 {i}", model_id=model_id, is_stream=True) for i in range(args.requests))
+        with AsyncChatEngine(router, max_concurrency=args.concurrency) as engine:
+            engine.run_sync(jobs)
+            summary = engine.stats.summary()
+        sent = ", ".join(f"{item['region']}={item['requests'] - before[item['region']]['requests']}"
+                         for item in router.snapshot())
+        print(f"{label:<28} errors={summary['errors']:<3} ttft p50={summary['ttft_p50'] * 1000:6.1f} ms "
+              f"p95={summary['ttft_p95'] * 1000:6.1f} ms  sent: {sent}")
+
+    try:
+        run_phase("all regions healthy")
+        servers["ap-osaka-1"].error_rate = 1.0
+        servers["ap-osaka-1"].error_status = 503
+        run_phase("ap-osaka-1 returning 503")
+        servers["ap-osaka-1"].error_rate = 0.0
+        time.sleep(args.recovery_timeout)
+        run_phase("ap-osaka-1 recovered")
+        print(f"\nfailovers: {router.failovers}")
+        for item in router.snapshot():
+            ttft = f"{item['ttft_ms']:.1f}" if item["ttft_ms"] is not None else "-"
+            print(f"{item['region']:<14} connect={item['connect_ms']:.2f} ms ttft={ttft} ms "
+                  f"requests={item['requests']} failures={item['failures']} breaker={item['breaker']}")
+    finally:
+        router.close()
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+同時に実行中の同じ chat / apply_guardrails のリクエストを 1 回の呼び出しにまとめる（single-flight）ラッパー
+
+多数のワーカーが同じプロンプト（oci_genai_cohere_chat_example.py と同じ message + documents など）や
+同じテキストの apply_guardrails を同時に実行すると、ワーカーごとに上流を呼び出すため負荷が何倍にもなり、スロットリングされます。
+CoalescingClient は正規化したリクエストのボディ（キーをソートした JSON）の SHA-256 をキーとして、
+実行中の呼び出しと同じリクエストが来たらその呼び出しの結果を待って共有します。
+
+- 非ストリーミング: 最初の呼び出しの応答（またはエラー）を、完了までに来た同じリクエストすべてに返す
+  （応答の data は呼び出し側ごとの deepcopy）
+- ストリーミング: 上流のストリームのイベントをバッファに残し、後から来た呼び出しにはバッファ済みのイベントを
+  先に返してから続きをライブで返す（上流を読み進めるのは、その時点で最も先に進んでいる呼び出し側のスレッド）
+- すべての呼び出し側がストリームを閉じたら上流のストリームも閉じる
+
+完了した呼び出しの結果は保持しません（保持する場合は genai_response_cache.py の CachingChatClient と組み合わせてください）。
+また、temperature > 0 のリクエストをまとめると、呼び出しごとに異なるはずの応答が同じになる点に注意してください。
+まとめた呼び出しには最初の呼び出しの kwargs（opc_request_id など）が使われます。
+
+使い方:
+    client = CoalescingClient(generative_ai_inference_client)
+    chat_response = client.chat(chat_detail)   # 他のスレッドで同じ chat_detail を実行中なら、その結果を共有する
+    print(client.stats.summary())              # coalescing_ratio, saved_calls など
+
+    python genai_request_coalescing.py --workers 64 --distinct 4   # ローカルのモックサーバーで計測
+"""
+import argparse
+import copy
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+from genai_http_client import to_wire
+
+
+def request_key(operation, details):
+    """
+    操作名と正規化したリクエストのボディ（SDK モデル・dict・JSON のバイト列）からキーを計算します。
+
+    Returns:
+        (キー, ストリーミングのリクエストかどうか)
+    """
+    wire = to_wire(details)
+    canonical = json.dumps([operation, wire], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    stream = bool(wire.get("chatRequest", {}).get("isStream"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), stream
+
+
+@dataclass
+class CoalescingStats:
+    """
+    Attributes:
+        calls (int): 呼び出しの数
+        upstream_calls (int): 実際に上流を呼び出した数
+        coalesced (int): 実行中の呼び出しの結果を共有した（上流を呼び出さなかった）数
+        late_joins (int): coalesced のうち、上流のストリームのイベントをすでに受信していたストリーミングの呼び出しの数
+        shared_errors (int): coalesced のうち、共有した呼び出しがエラーになった数
+        abandoned_streams (int): 最後まで読まれずに閉じた上流のストリームの数
+    """
+    calls: int = 0
+    upstream_calls: int = 0
+    coalesced: int = 0
+    late_joins: int = 0
+    shared_errors: int = 0
+    abandoned_streams: int = 0
+
+    def summary(self):
+        summary = dict(vars(self))
+        summary["coalescing_ratio"] = self.coalesced / self.calls if self.calls else 0.0
+        summary["saved_calls"] = self.coalesced
+        return summary
+
+
+class Flight:
+    """
+    実行中の 1 回の上流の呼び出し。ストリーミングの場合は受信したイベントをバッファに残します。
+
+    Args:
+        key (str): request_key のキー
+        on_done: 新しい呼び出しを受け付けなくなったときに呼ぶ関数（引数は Flight）
+    """
+
+    def __init__(self, key, on_done):
+        self.key = key
+        self.ready = threading.Event()
+        self.response = None
+        self.error = None
+        self._on_done = on_done
+        self._condition = threading.Condition()
+        self._events = []
+        self._iterator = None
+        self._upstream = None
+        self._stream_error = None
+        self._finished = False
+        self._pumping = False
+        self._subscribers = 1
+        self.abandoned = False
+
+    def join(self):
+        """
+        呼び出し側を 1 つ追加します。
+
+        Returns:
+            バッファ済みのイベントの数。すべての呼び出し側が閉じたあとで参加できない場合は None
+        """
+        with self._condition:
+            if self.abandoned:
+                return None
+            self._subscribers += 1
+            return len(self._events)
+
+    def shared(self):
+        """
+        複数の呼び出し側が参加したかどうか（新しい呼び出しを受け付けなくなったあとは変わりません）
+        """
+        with self._condition:
+            return self._subscribers > 1
+
+    def start(self, response, stream):
+        if stream:
+            self._upstream = response.data
+            self._iterator = iter(response.data.events())
+        self.response = response
+        self.ready.set()
+
+    def fail(self, error):
+        self.error = error
+        self.ready.set()
+
+    def event(self, index):
+        """
+        index 番目のイベントを返します（上流の終わりなら None）。まだ受信していない場合は、
+        他のスレッドが受信中ならそれを待ち、そうでなければこのスレッドで上流から 1 件読みます。
+        """
+        while True:
+            with self._condition:
+                while True:
+                    if index < len(self._events):
+                        return self._events[index]
+                    if self._stream_error is not None:
+                        raise self._stream_error
+                    if self._finished:
+                        return None
+                    if not self._pumping:
+                        self._pumping = True
+                        break
+                    self._condition.wait()
+            # 上流の読み込み中はロックを持たない（他の呼び出し側はバッファ済みのイベントを読み進められる）
+            event = error = None
+            try:
+                event = next(self._iterator, None)
+            except Exception as e:
+                error = e
+            with self._condition:
+                self._pumping = False
+                if error is not None:
+                    self._stream_error = error
+                elif event is None:
+                    self._finished = True
+                else:
+                    self._events.append(event)
+                self._condition.notify_all()
+            if error is not None or event is None:
+                self._on_done(self)
+                if error is not None:
+                    self._upstream.close()
+
+    def leave(self):
+        """
+        呼び出し側を 1 つ減らします。最後の呼び出し側が上流のストリームを読み終える前に閉じた場合は上流も閉じます。
+        """
+        with self._condition:
+            self._subscribers -= 1
+            if self._subscribers or self._finished or self._stream_error is not None:
+                return
+            self.abandoned = True
+        self._on_done(self)
+        if self._upstream is not None:
+            self._upstream.close()
+
+
+class SharedStream:
+    """
+    Flight のイベントを先頭から順に返すストリーム（events() / raw() は GenAiHttpClient の SseStream と同じ）
+    """
+
+    def __init__(self, flight):
+        self._flight = flight
+        self._closed = False
+
+    def events(self):
+        index = 0
+        try:
+            while True:
+                event = self._flight.event(index)
+                if event is None:
+                    return
+                index += 1
+                yield event
+        finally:
+            self.close()
+
+    def raw(self):
+        for event in self.events():
+            yield b"data: " + event.data.encode("utf-8") + b"\n\n"
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._flight.leave()
+
+
+class RequestCoalescer:
+    """
+    キーごとに実行中の Flight を管理します（スレッドセーフ）。
+
+    Attributes:
+        stats (CoalescingStats): 呼び出しの数と共有した数
+    """
+
+    def __init__(self):
+        self.stats = CoalescingStats()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, stream, function):
+        """
+        同じキーの呼び出しが実行中ならその結果を、そうでなければ function() の結果を返します。
+        ストリーミングの場合は、data を呼び出し側ごとの SharedStream にしたレスポンスのコピーを返します。
+        非ストリーミングの結果を共有した場合は、呼び出し側が data を変更しても他に影響しないように、
+        data を deepcopy したレスポンスのコピーを呼び出し側ごとに返します（共有しなかった場合は上流のレスポンスそのまま）。
+        """
+        with self._lock:
+            self.stats.calls += 1
+            flight = self._flights.get(key)
+            buffered = flight.join() if flight is not None else None
+            if buffered is None:
+                flight = self._flights[key] = Flight(key, self._forget)
+                self.stats.upstream_calls += 1
+            else:
+                self.stats.coalesced += 1
+                if buffered:
+                    self.stats.late_joins += 1
+        if buffered is None:
+            try:
+                response = function()
+            except BaseException as e:
+                flight.fail(e)
+                self._forget(flight)
+                raise
+            flight.start(response, stream)
+            if not stream:
+                self._forget(flight)
+        else:
+            flight.ready.wait()
+            if flight.error is not None:
+                with self._lock:
+                    self.stats.shared_errors += 1
+                raise flight.error
+        response = copy.copy(flight.response)
+        if stream:
+            response.data = SharedStream(flight)
+        elif flight.shared():
+            response.data = copy.deepcopy(flight.response.data)
+        else:
+            return flight.response
+        return response
+
+    def _forget(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if flight.abandoned:
+                self.stats.abandoned_streams += 1
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+
+class CoalescingClient:
+    """
+    推論クライアントの chat() と apply_guardrails() で、実行中の同じリクエストの呼び出しを共有するラッパー。
+    それ以外のメソッドはそのまま委譲します。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient（ResilientClient などのラッパーも可）
+        coalescer (RequestCoalescer): 複数のクライアントで共有する場合に指定
+
+    Attributes:
+        stats (CoalescingStats): 呼び出しの数と共有した数
+    """
+
+    def __init__(self, client, coalescer=None):
+        self.client = client
+        self.coalescer = coalescer or RequestCoalescer()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    @property
+    def stats(self):
+        return self.coalescer.stats
+
+    def chat(self, chat_details, **kwargs):
+        key, stream = request_key("chat", chat_details)
+        return self.coalescer.call(key, stream, lambda: self.client.chat(chat_details, **kwargs))
+
+    def apply_guardrails(self, apply_guardrails_details, **kwargs):
+        key, _ = request_key("applyGuardrails", apply_guardrails_details)
+        return self.coalescer.call(
+            key, False, lambda: self.client.apply_guardrails(apply_guardrails_details=apply_guardrails_details,
+                                                             **kwargs))
+
+
+def run_workers(workers, function, stagger=0.0):
+    """
+    workers 個のスレッドで function(index) を同時に（stagger 秒ずつずらして）実行し、(結果のリスト, 経過時間) を返します。
+    結果は戻り値、または送出された例外です。
+    """
+    results = [None] * workers
+    barrier = threading.Barrier(workers)
+
+    def worker(index):
+        barrier.wait()
+        time.sleep(stagger * index)
+        try:
+            results[index] = function(index)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def main():
+    from genai_async_engine import build_chat_details
+    from genai_http_client import GenAiHttpClient, GenAiServiceError
+    from genai_mock_server import DEFAULT_RESPONSE_TEXT, MockGenAiServer
+    from genai_sse_parser import CohereStreamDecoder
+
+    parser = argparse.ArgumentParser(description="同時に実行中の同じリクエストをまとめたときの上流の呼び出し数の比較")
+    parser.add_argument("--workers", type=int, default=64, help="同時に呼び出すスレッドの数")
+    parser.add_argument("--distinct", type=int, default=4, help="異なるリクエストの数")
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--guardrails-delay", type=float, default=0.1)
+    parser.add_argument("--stagger", type=float, default=0.005, help="ストリーミングで呼び出しの開始をずらす間隔（秒）")
+    args = parser.parse_args()
+
+    def chat(client, index):
+        response = client.chat(build_chat_details(f"Oracle Database の機能 {index % args.distinct} について"))
+        return response.data.chat_response.text
+
+    def stream(client, index):
+        response = client.chat(build_chat_details(f"Oracle Database の機能 {index % args.distinct} について",
+                                                  is_stream=True))
+        decoder = CohereStreamDecoder()
+        deltas = [decoder.decode_event(event.data) for event in response.data.events()]
+        assert decoder.finished, "最終イベントを受信していません"
+        assert "".join(text for text in deltas if text) == decoder.result.payload["text"]
+        return decoder.result.payload["text"]
+
+    def guardrails(client, index):
+        response = client.apply_guardrails(apply_guardrails_details={
+            "compartmentId": "ocid1.compartment.oc1..mock",
+            "input": {"type": "TEXT", "content": f"Contact {index % args.distinct}: Ethan Hunt, ethan@example.com"},
+            "guardrailConfigs": {"personallyIdentifiableInformationConfig": {"types": ["PERSON", "EMAIL"]}}})
+        return response.data.to_dict()
+
+    scenarios = [
+        ("chat", chat, 0.0, {}),
+        ("chat stream", stream, args.stagger, {}),
+        ("apply_guardrails", guardrails, 0.0, {}),
+        ("chat 503", chat, 0.0, {"error_rate": 1.0, "error_status": 503}),
+    ]
+    print(f"{args.workers} workers, {args.distinct} distinct requests")
+    print(f"{'scenario':<17} {'coalescing':<10} {'ok':>4} {'errors':>6} {'upstream':>8} {'saved':>6} {'ratio':>6} "
+          f"{'late':>5} {'wall ms':>8}")
+    for label, function, stagger, faults in scenarios:
+        for coalescing in (False, True):
+            with MockGenAiServer(first_token_delay=args.first_token_delay, token_delay=args.token_delay,
+                                 guardrails_delay=args.guardrails_delay, **faults) as server:
+                base = GenAiHttpClient(server.endpoint, pool_maxsize=args.workers)
+                client = CoalescingClient(base) if coalescing else base
+                results, wall = run_workers(args.workers, lambda index: function(client, index), stagger)
+                base.close()
+            errors = [result for result in results if isinstance(result, Exception)]
+            unexpected = [error for error in errors if not isinstance(error, GenAiServiceError)]
+            assert not unexpected, f"予期しないエラー: {unexpected[0]!r}"
+            if faults:
+                assert len(errors) == args.workers, "エラーが全員に返っていません"
+            elif label.startswith("chat"):
+                assert not errors and all(result == DEFAULT_RESPONSE_TEXT for result in results)
+            else:
+                # まとめた呼び出しも、まとめない場合と同じ結果を受け取っていること
+                assert not errors and all(result == results[index % args.distinct]
+                                          for index, result in enumerate(results))
+            summary = client.stats.summary() if coalescing else {"saved_calls": 0, "coalescing_ratio": 0.0,
+                                                                  "late_joins": 0}
+            if coalescing:
+                assert summary["upstream_calls"] == server.request_count
+                assert client.coalescer.in_flight() == 0
+            print(f"{label:<17} {'on' if coalescing else 'off':<10} {len(results) - len(errors):>4} "
+                  f"{len(errors):>6} {server.request_count:>8} {summary['saved_calls']:>6} "
+                  f"{summary['coalescing_ratio']:>6.1%} {summary['late_joins']:>5} {wall * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+静的な部分を 1 回だけシリアライズしておくチャットのリクエストのテンプレート
+
+サンプルは呼び出しのたびに CohereChatRequest を作って十数個の属性を設定し、OnDemandServingMode と一緒に ChatDetails に包みます。
+SDK（または GenAiHttpClient の to_wire）はそのたびにモデルオブジェクトをたどり、毎回同じ大きな documents や
+chat_history を JSON にし直します。ChatTemplate はリクエストごとに変わる項目（既定では message だけ）以外を
+あらかじめ JSON のバイト列にしておき、リクエストごとには変わる項目の JSON だけを作って前後のバイト列とつなぎます。
+
+変わる項目は JSON の末尾に置くため、ボディの SHA-256（署名に使う x-content-sha256 ヘッダーの値）も
+静的な部分まで計算した途中の状態を使い回し、リクエストごとには末尾の数バイト〜数 KB だけを計算します。
+ただし、このリポジトリには render_with_digest のダイジェストを使う署名処理はありません（GenAiHttpClient は署名せず、
+OCI SDK の署名はボディから自分で SHA-256 を計算します）。独自にリクエストを署名する場合に x-content-sha256 として渡すための API です。
+
+render の結果（JSON のバイト列）は to_wire・cache_key・job_kind・レート制限のキーなどがそのまま受け付けるため、
+CachingChatClient・instrument・ResilientClient・AsyncChatEngine と組み合わせて使えます（OCI SDK のクライアントには渡せません）。
+
+使い方:
+    template = ChatTemplate(chat_detail)   # message 以外を設定した ChatDetails（SDK モデルまたは同じ構造の dict）
+    body = template.render("オラクルのリレーショナルデータベースについて教えてください。")
+    response = client.chat(body)           # GenAiHttpClient は JSON のバイト列をそのまま送ります
+    body, content_sha256 = template.render_with_digest(message)
+
+    template = ChatTemplate(chat_detail, slots=("message", "chat_history"))   # 会話履歴もリクエストごとに変える
+    body = template.render(message, chat_history=session.chat_history())
+    stream_template = template.variant(is_stream=True)
+
+    python bench_request_template.py   # オブジェクトモデルの経路との比較（1 KB〜1 MB）
+"""
+import base64
+import hashlib
+import json
+import re
+
+from genai_http_client import to_wire
+
+_CAMEL_PATTERN = re.compile(r"_([a-z])")
+_SNAKE_PATTERN = re.compile(r"([A-Z])")
+
+
+def wire_name(name):
+    """
+    chatRequest の項目名（snake_case でも camelCase でも可）を REST API の camelCase の名前にします。
+    """
+    return _CAMEL_PATTERN.sub(lambda match: match.group(1).upper(), name)
+
+
+def snake_name(name):
+    return _SNAKE_PATTERN.sub(lambda match: "_" + match.group(1).lower(), name)
+
+
+def encode_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ChatTemplate:
+    """
+    静的な部分をシリアライズ済みの ChatDetails
+
+    Args:
+        chat_details: ChatDetails（SDK モデルまたは同じ構造の dict）。slots の項目の値は無視します
+        slots (tuple): リクエストごとに変える chatRequest の項目（先頭は message）
+
+    Attributes:
+        static_bytes (int): シリアライズ済みの静的な部分のバイト数
+    """
+
+    def __init__(self, chat_details, slots=("message",)):
+        names = [wire_name(slot) for slot in slots]
+        if not names or names[0] != "message":
+            raise ValueError("slots の先頭は message にしてください")
+        self.slots = tuple(names)
+        self._keywords = tuple(snake_name(name) for name in names[1:])
+        self._wire = to_wire(chat_details)
+        chat_request = {key: value for key, value in self._wire.get("chatRequest", {}).items() if key not in names}
+        details = {key: value for key, value in self._wire.items() if key != "chatRequest"}
+        # 可変の項目を末尾に並べ、静的な部分がボディの先頭にまとまるようにする
+        markers = [f"\0slot{index}\0" for index in range(len(names))]
+        chat_request.update(zip(names, markers))
+        details["chatRequest"] = chat_request
+        encoded = encode_json(details)
+        self._parts = []
+        for marker in markers:
+            head, separator, encoded = encoded.partition(encode_json(marker))
+            if not separator:
+                raise ValueError("テンプレートを作れません")
+            self._parts.append(head)
+        self._parts.append(encoded)
+        self._prefix = self._parts[0]
+        self._suffix = self._parts[-1]
+        self._prefix_digest = hashlib.sha256(self._prefix)
+        self.static_bytes = sum(len(part) for part in self._parts)
+
+    def variant(self, **fields):
+        """
+        chatRequest の静的な項目（is_stream など）を変えたテンプレートを作ります（作り直すため、使い回してください）。
+        """
+        details = dict(self._wire)
+        chat_request = dict(details.get("chatRequest", {}))
+        chat_request.update((wire_name(key), to_wire(value)) for key, value in fields.items())
+        details["chatRequest"] = chat_request
+        return ChatTemplate(details, self.slots)
+
+    def _tail(self, message, values):
+        """
+        静的な先頭部分より後ろのバイト列
+        """
+        message = encode_json(message)
+        if not self._keywords:
+            return message + self._suffix
+        pieces = [message]
+        for keyword, part in zip(self._keywords, self._parts[1:]):
+            pieces.append(part)
+            pieces.append(encode_json(to_wire(values.get(keyword))))
+        pieces.append(self._suffix)
+        return b"".join(pieces)
+
+    def render(self, message, **values):
+        """
+        message（と slots のその他の項目の値）を埋め込んだリクエストのボディ（JSON のバイト列）を返します。
+        slots の項目で値を指定しなかったものは null になります。
+        """
+        if not self._keywords:
+            # 大きな先頭部分のコピーを 1 回にするため + ではなく join でつなぐ
+            return b"".join((self._prefix, encode_json(message), self._suffix))
+        return self._prefix + self._tail(message, values)
+
+    def render_with_digest(self, message, **values):
+        """
+        (ボディ, ボディの SHA-256 の Base64) を返します。ダイジェストは静的な部分まで計算済みの状態から続けて求めます。
+        """
+        tail = self._tail(message, values)
+        digest = self._prefix_digest.copy()
+        digest.update(tail)
+        return self._prefix + tail, base64.b64encode(digest.digest()).decode("ascii")
+
+    def details(self, message, **values):
+        """
+        ChatDetails と同じ構造の dict（テンプレートを使わない経路と結果を比べる場合などに使います）
+        """
+        return json.loads(self.render(message, **values))
@@ -0,0 +1,562 @@
+"""
+リトライ・ヘッジ・レート制限を組み込んだリクエストスケジューラー
+
+各サンプルのクライアントは retry_strategy=oci.retry.NoneRetryStrategy() と固定の timeout=(10,240) で作られるため、
+負荷が高いときに 429 が 1 回返るとジョブが失敗し、応答の遅いレプリカに当たると最大 4 分待たされます。
+このモジュールは chat() と apply_guardrails() の前段に置くラッパーで、次の処理を行います。
+
+- コンパートメント / モデルごとのトークンバケットによる送信レートの制限（429 を受けると同じキーの送信をまとめて止め、レートを下げる）
+- Retry-After を優先する、ジッター付きの指数バックオフによるリトライ（429 / 5xx / 接続エラー）
+- 非ストリーミングの呼び出しで、応答時間が直近の分布から学習したパーセンタイルを超えた場合に同じリクエストを
+  もう 1 本送り、先に返った方を使うヘッジ（送信数の増加は hedge_budget の割合まで）
+- リージョンごとのサーキットブレーカー（5xx や接続エラーが続いたリージョンへの送信を一定時間止める）
+
+ストリーミングの呼び出しは応答ヘッダーを受け取るまで（イベントを 1 件も読んでいない段階）だけをリトライし、ヘッジはしません。
+
+使い方:
+    client = ResilientClient(generative_ai_inference_client, region="us-chicago-1",
+                             rate_limiter=RateLimiter(rate=10), hedge_quantile=95)
+    chat_response = client.chat(chat_detail)
+    print(client.stats.summary())
+
+    python genai_resilience.py --requests 400 --error-rate 0.05 --spike-rate 0.03   # ローカルのモックサーバーで計測
+"""
+import argparse
+import collections
+import email.utils
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from genai_async_engine import percentile
+from genai_http_client import GenAiServiceError
+
+# OCI SDK の既定のリトライ戦略と同じく、スロットリングとサーバー側のエラーをリトライする
+RETRYABLE_STATUS = frozenset((429, 500, 502, 503, 504))
+
+
+def _field(obj, camel, snake):
+    if isinstance(obj, (bytes, bytearray)):
+        obj = json.loads(obj)
+    if isinstance(obj, dict):
+        return obj.get(camel)
+    return getattr(obj, snake, None)
+
+
+def serving_model(details):
+    """
+    ChatDetails（SDK モデルまたは dict）のサービングモードの model_id（DedicatedServingMode の場合は endpoint_id）。
+    サービングモードがない場合（ApplyGuardrailsDetails）は None。
+    """
+    serving_mode = _field(details, "servingMode", "serving_mode")
+    if serving_mode is None:
+        return None
+    return _field(serving_mode, "modelId", "model_id") or _field(serving_mode, "endpointId", "endpoint_id")
+
+
+def rate_limit_key(details):
+    """
+    ChatDetails / ApplyGuardrailsDetails（SDK モデルまたは dict）からレート制限のキー (コンパートメントID, モデル) を返します。
+    """
+    return _field(details, "compartmentId", "compartment_id"), serving_model(details) or "applyGuardrails"
+
+
+def is_stream_request(details):
+    chat_request = _field(details, "chatRequest", "chat_request")
+    return bool(chat_request is not None and _field(chat_request, "isStream", "is_stream"))
+
+
+def retry_after_seconds(error):
+    """
+    エラー応答の Retry-After ヘッダー（秒数または HTTP 日付）を秒数で返します。ない場合は None。
+    """
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_connection_error(error):
+    # oci.exceptions.RequestException（requests の例外）も OSError のサブクラス
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+class BackoffPolicy:
+    """
+    ジッター付きの指数バックオフ（Full Jitter）
+
+    Args:
+        base (float): 1 回目のリトライの待ち時間の上限（秒）
+        cap (float): 待ち時間の上限（秒）
+        max_attempts (int): 最初の試行を含めた最大試行回数
+        retryable_status (frozenset): リトライする HTTP ステータス
+    """
+
+    def __init__(self, base=0.1, cap=10.0, max_attempts=5, retryable_status=RETRYABLE_STATUS, seed=None):
+        self.base = base
+        self.cap = cap
+        self.max_attempts = max_attempts
+        self.retryable_status = retryable_status
+        self.random = random.Random(seed)
+
+    def is_retryable(self, error):
+        status = getattr(error, "status", None)
+        if status is not None:
+            return status in self.retryable_status
+        return is_connection_error(error)
+
+    def delay(self, attempt, error=None):
+        """
+        attempt 回目（0 始まり）の失敗の後の待ち時間。Retry-After があればそれに従います（cap を上限とします）。
+        """
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            return min(self.cap, retry_after)
+        return self.random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    送信レートを制限するトークンバケット（スレッドセーフ）
+
+    トークンが足りない場合も予約として先に消費し（残量は負になり得ます）、予約した順に待ち時間を割り当てるため、
+    待っているスレッドが一斉に再開してバーストになることがありません。
+    429 を受けたら throttle() で送信を一時停止し、レートを半分にします。成功するたびにレートを max_rate まで少しずつ戻します。
+
+    Args:
+        rate (float): 1 秒あたりの送信数
+        burst (float): バケットの容量（連続して送信できる数）
+        min_rate (float): throttle() で下げるレートの下限
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        トークンを 1 つ予約し、送信してよい時刻までの待ち時間（秒）を返します。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait_time, self.paused_until - now)
+
+    def acquire(self):
+        """
+        トークンを 1 つ取得します（必要なら待ちます）。待った時間（秒）を返します。
+        """
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def try_acquire(self):
+        """
+        待たずにトークンを取得できる場合だけ取得して True を返します。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens < 1 or self.paused_until > now:
+                return False
+            self.tokens -= 1
+            return True
+
+    def throttled(self):
+        """
+        429 を受けてから送信の一時停止中、またはレートを下げたまま max_rate に戻っていない間は True。
+        """
+        return self.rate < self.max_rate or self.paused_until > time.monotonic()
+
+    def throttle(self, pause):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 32)
+
+
+class RateLimiter:
+    """
+    レート制限のキー（コンパートメントID, モデル）ごとの TokenBucket
+
+    Args:
+        rate (float): キーごとの 1 秒あたりの送信数
+        burst (float): キーごとのバケットの容量
+        rates (dict): キー → レートの個別設定
+    """
+
+    def __init__(self, rate, burst=None, rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.rates = rates or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(self.rates.get(key, self.rate), self.burst)
+        return bucket
+
+
+class CircuitOpenError(GenAiServiceError):
+    """
+    サーキットブレーカーが開いているため送信しなかったときの例外（status 503、Retry-After 付き）
+    """
+
+    def __init__(self, region, retry_after):
+        super().__init__(503, "CircuitOpen", f"circuit breaker for {region} is open",
+                         {"retry-after": f"{retry_after:.3f}"})
+        self.region = region
+
+
+class CircuitBreaker:
+    """
+    リージョンごとのサーキットブレーカー
+
+    連続 failure_threshold 回の失敗（5xx・接続エラー）で開き、recovery_timeout 秒後に half_open_requests 件だけ
+    試しに送信します（半開）。成功すれば閉じ、失敗すればまた開きます。
+
+    Args:
+        failure_threshold (int): 開くまでの連続失敗回数
+        recovery_timeout (float): 開いてから試しに送信するまでの時間（秒）
+        half_open_requests (int): 半開の状態で送信する件数
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0, half_open_requests=1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_requests = half_open_requests
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() < self.opened_at + self.recovery_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_requests:
+                    return False
+                self._probes += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(region, **kwargs):
+    """
+    リージョンごとにプロセスで共有する CircuitBreaker を返します（kwargs は最初の生成時だけ使われます）。
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(region)
+        if breaker is None:
+            breaker = _breakers[region] = CircuitBreaker(**kwargs)
+        return breaker
+
+
+class LatencyTracker:
+    """
+    直近 window 件の応答時間から学習したパーセンタイル（ヘッジを送るまでの待ち時間）
+
+    Args:
+        quantile (float): パーセンタイル（0〜100）
+        window (int): 保持する直近の応答時間の件数
+        min_samples (int): しきい値を返すのに必要な件数（それまではヘッジしません）
+    """
+
+    def __init__(self, quantile=95, window=512, min_samples=32):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples = collections.deque(maxlen=window)
+        self._threshold = None
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+            self._stale += 1
+
+    def threshold(self):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            # 毎回ソートしないよう、16 件ごとに計算し直す
+            if self._threshold is None or self._stale >= 16:
+                self._threshold = percentile(sorted(self._samples), self.quantile)
+                self._stale = 0
+            return self._threshold
+
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    attempts: int = 0
+    retries: int = 0
+    throttled: int = 0
+    server_errors: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    rejected: int = 0
+    rate_limit_wait: float = 0.0
+
+    def summary(self):
+        return dict(vars(self))
+
+
+class ResilientClient:
+    """
+    推論クライアントの chat() と apply_guardrails() にレート制限・リトライ・ヘッジ・サーキットブレーカーを組み込むラッパー。
+    それ以外のメソッドはそのまま委譲します。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient（リトライは NoneRetryStrategy のままにします）
+        region (str): サーキットブレーカーを共有するリージョン名（省略時はクライアントのエンドポイント）
+        rate_limiter (RateLimiter): レート制限（None の場合は制限しない）
+        backoff (BackoffPolicy): リトライの方針
+        breaker (CircuitBreaker): サーキットブレーカー（省略時は region ごとに共有するもの）
+        hedge_quantile (float): ヘッジを送る応答時間のパーセンタイル（None の場合はヘッジしない）
+        hedge_budget (float): 呼び出し数に対するヘッジの割合の上限
+        deadline (float): リトライを含めた 1 回の呼び出しの制限時間（秒。None の場合は試行回数だけで制限）
+        max_workers (int): ヘッジする呼び出しを実行するワーカースレッドの数（呼び出し側の同時実行数 ×（1 + hedge_budget）より
+            大きくしないと、ヘッジのリクエストが先に投入した呼び出しの完了を待つことになります）
+    """
+
+    def __init__(self, client, region=None, rate_limiter=None, backoff=None, breaker=None, hedge_quantile=None,
+                 hedge_budget=0.1, deadline=None, max_workers=64):
+        self.client = client
+        self.region = region or getattr(client, "service_endpoint", None) or client.base_client.endpoint
+        self.rate_limiter = rate_limiter
+        self.backoff = backoff or BackoffPolicy()
+        self.breaker = breaker or circuit_breaker(self.region)
+        self.hedge_budget = hedge_budget
+        self.deadline = deadline
+        self.latency = {"chat": LatencyTracker(hedge_quantile), "apply_guardrails": LatencyTracker(hedge_quantile)} \
+            if hedge_quantile is not None else None
+        self.stats = ResilienceStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="genai-hedge") \
+            if hedge_quantile is not None else None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def chat(self, chat_details, **kwargs):
+        return self.call("chat", self.client.chat, chat_details, hedge=not is_stream_request(chat_details), **kwargs)
+
+    def apply_guardrails(self, apply_guardrails_details, **kwargs):
+        return self.call("apply_guardrails", self.client.apply_guardrails, apply_guardrails_details, hedge=True,
+                         **kwargs)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def call(self, operation, method, details, hedge=False, **kwargs):
+        """
+        method(details, **kwargs) をレート制限・リトライ・ヘッジ付きで呼び出します。
+        """
+        self._count("calls")
+        bucket = self.rate_limiter.bucket(rate_limit_key(details)) if self.rate_limiter is not None else None
+        deadline = time.monotonic() + self.deadline if self.deadline is not None else None
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(self.region, self.breaker.retry_after)
+            if bucket is not None:
+                self._count("rate_limit_wait", bucket.acquire())
+            self._count("attempts")
+            try:
+                # リトライ中と、429 を受けてレート制限が送信を抑えている間はヘッジしない（送信数を増やさない）
+                if hedge and self.latency is not None and attempt == 0 and \
+                        (bucket is None or not bucket.throttled()):
+                    response = self._hedged(operation, method, details, bucket, kwargs)
+                else:
+                    response = method(details, **kwargs)
+            except Exception as error:
+                status = getattr(error, "status", None)
+                if status == 429:
+                    self._count("throttled")
+                if (status is not None and status >= 500) or (status is None and is_connection_error(error)):
+                    self._count("server_errors")
+                    self.breaker.record_failure()
+                else:
+                    # 429 や 4xx はリージョン自体は応答しているので、ブレーカーにとっては成功として扱う
+                    self.breaker.record_success()
+                if not self.backoff.is_retryable(error) or attempt + 1 >= self.backoff.max_attempts:
+                    raise
+                delay = self.backoff.delay(attempt, error)
+                if status == 429 and bucket is not None:
+                    bucket.throttle(delay)
+                    delay = 0.0  # 待ちは次の bucket.acquire() で行う
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                self._count("retries")
+                if delay:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            if bucket is not None:
+                bucket.on_success()
+            return response
+
+    def _timed(self, operation, method, details, kwargs):
+        start = time.perf_counter()
+        response = method(details, **kwargs)
+        self.latency[operation].record(time.perf_counter() - start)
+        return response
+
+    def _hedged(self, operation, method, details, bucket, kwargs):
+        threshold = self.latency[operation].threshold()
+        if threshold is None:
+            return self._timed(operation, method, details, kwargs)
+        primary = self._executor.submit(self._timed, operation, method, details, kwargs)
+        done, _ = wait([primary], timeout=threshold)
+        if done or self.stats.hedges >= self.hedge_budget * self.stats.calls or \
+                (bucket is not None and not bucket.try_acquire()):
+            return primary.result()
+        self._count("hedges")
+        backup = self._executor.submit(self._timed, operation, method, details, kwargs)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as exc:
+                    error = exc
+                    continue
+                if future is backup:
+                    self._count("hedge_wins")
+                # 遅れた方の応答は読み捨てる（非ストリーミングなので接続はプールに戻ります）
+                return response
+        raise error
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def main():
+    from genai_async_engine import AsyncChatEngine, build_chat_details
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+
+    parser = argparse.ArgumentParser(description="モックサーバーに 429/5xx と遅延スパイクを注入したときのテールレイテンシの比較")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=100, help="ヘッジのしきい値を学習させるための計測前のリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--spike-rate", type=float, default=0.03)
+    parser.add_argument("--spike-delay", type=float, default=1.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.03)
+    parser.add_argument("--hedge-quantile", type=float, default=95)
+    parser.add_argument("--rate", type=float, default=400, help="コンパートメント / モデルごとの 1 秒あたりの送信数")
+    args = parser.parse_args()
+
+    # 429 を受けるとレート制限がレートを下げ、レートが戻るまではヘッジしない（リトライ中の呼び出しもヘッジしない）。
+    # ヘッジの効果は 5xx と遅延スパイクの条件で確認する
+    profiles = [
+        ("429 + Retry-After", dict(error_rate=args.error_rate, error_status=429, retry_after=args.retry_after)),
+        ("5xx + spikes", dict(error_rate=args.error_rate, error_status=503, spike_rate=args.spike_rate,
+                              spike_delay=args.spike_delay)),
+    ]
+    cases = [
+        ("NoneRetryStrategy", None),
+        ("retry", dict(backoff_base=0.02)),
+        ("retry + hedge", dict(backoff_base=0.02, hedge_quantile=args.hedge_quantile)),
+    ]
+    print(f"{'faults':<18} {'case':<18} {'ok':>5} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'retries':>7} {'hedges':>6} {'wins':>5}")
+    for profile, faults in profiles:
+        for label, options in cases:
+            with MockGenAiServer(first_token_delay=args.first_token_delay, seed=1, **faults) as server:
+                client = base = GenAiHttpClient(server.endpoint, pool_maxsize=args.concurrency * 2)
+                if options is not None:
+                    client = ResilientClient(base, region=f"mock {profile} {label}", rate_limiter=RateLimiter(args.rate),
+                                             backoff=BackoffPolicy(base=options["backoff_base"], seed=0),
+                                             hedge_quantile=options.get("hedge_quantile"),
+                                             max_workers=args.concurrency * 2)
+                with AsyncChatEngine(client, max_concurrency=args.concurrency) as engine:
+                    engine.run_sync(build_chat_details(f"準備 {i}") for i in range(args.warmup))
+                stats = ResilienceStats()
+                if options is not None:
+                    client.stats = stats
+                with AsyncChatEngine(client, max_concurrency=args.concurrency) as engine:
+                    engine.run_sync(build_chat_details(f"質問 {i}") for i in range(args.requests))
+                    latencies = sorted(engine.stats.latencies)
+                    summary = engine.stats.summary()
+                if options is not None:
+                    client.close()
+                base.close()
+            print(f"{profile:<18} {label:<18} {summary['completed']:>5} {summary['errors']:>6} "
+                  f"{summary['latency_p50'] * 1000:>8.1f} {summary['latency_p95'] * 1000:>8.1f} "
+                  f"{summary['latency_p99'] * 1000:>8.1f} {(latencies[-1] if latencies else 0) * 1000:>8.1f} "
+                  f"{stats.retries:>7} {stats.hedges:>6} {stats.hedge_wins:>5}")
+
+
+if __name__ == "__main__":
+    main()
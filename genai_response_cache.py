@@ -0,0 +1,319 @@
+"""
+Cohere チャット応答のキャッシュ
+
+リクエストの内容（サービングモード、model_id、message、chat_history、documents、サンプリングパラメータ）の
+正規化した JSON のハッシュをキーとして、chat() の応答をキャッシュします。
+
+- メモリ上の LRU（TTL 付き）と、任意で SQLite による永続化層の 2 段構成
+- ヒット / ミス / 追い出しなどのカウンター
+- temperature > 0 かつ seed 未指定のような非決定的なリクエストは既定でキャッシュしない
+- キャッシュした応答はストリーミングのリクエストに対して SSE イベントとして再生できる
+
+使い方:
+    cache = ResponseCache(maxsize=1024, ttl=3600, path="chat_cache.sqlite3")
+    client = CachingChatClient(generative_ai_inference_client, cache)
+    chat_response = client.chat(chat_detail)
+"""
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from genai_http_client import HttpResponse, SseEvent, WireObject, to_wire
+from genai_sse_parser import CohereStreamDecoder
+
+# 応答の内容に影響しない（キーに含めない）chatRequest の項目
+TRANSPORT_ONLY_FIELDS = ("isStream", "streamOptions")
+
+
+def cache_key(chat_details):
+    """
+    ChatDetails（SDK モデルまたは dict）から正規化したキャッシュキーを計算します。
+
+    chatRequest のうちストリーミングの指定を除いたすべての項目とサービングモードを、キーをソートした JSON にして
+    SHA-256 を取ります。同じ内容であればストリーミング / 非ストリーミングのどちらのリクエストでも同じキーになります。
+    """
+    wire = to_wire(chat_details)
+    chat_request = {key: value for key, value in wire.get("chatRequest", {}).items()
+                    if key not in TRANSPORT_ONLY_FIELDS}
+    canonical = json.dumps({"servingMode": wire.get("servingMode"), "chatRequest": chat_request},
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(chat_details):
+    """
+    同じリクエストに同じ応答が期待できるか（temperature が 0、または seed が指定されている）を判定します。
+    """
+    chat_request = to_wire(chat_details).get("chatRequest", {})
+    return chat_request.get("temperature") == 0 or chat_request.get("seed") is not None
+
+
+def is_stream(chat_details):
+    return bool(to_wire(chat_details).get("chatRequest", {}).get("isStream"))
+
+
+class LruTtlCache:
+    """
+    TTL 付きの LRU キャッシュ（スレッドセーフ）
+
+    Args:
+        maxsize (int): 保持する最大件数
+        ttl (float): 有効期間（秒）。None の場合は期限なし
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCacheStore:
+    """
+    SQLite による永続化層。値は JSON 文字列で保存し、作成時刻から TTL を判定します。
+
+    Args:
+        path (str): データベースファイルのパス
+        ttl (float): 有効期間（秒）。None の場合は期限なし
+    """
+
+    def __init__(self, path, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS chat_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute("SELECT value, created FROM chat_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and row[1] + self.ttl < time.time():
+                self._connection.execute("DELETE FROM chat_cache WHERE key = ?", (key,))
+                self.expirations += 1
+                return None
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO chat_cache (key, value, created) VALUES (?, ?, ?)",
+                                     (key, data, time.time()))
+
+    def close(self):
+        self._connection.close()
+
+
+class ResponseCache:
+    """
+    メモリ（LRU + TTL）と任意の SQLite の 2 段構成のキャッシュ
+
+    保存する値は {"modelId", "modelVersion", "chatResponse", "deltas"} の dict です。
+    deltas はストリーミングで受信した text デルタのリストで、再生時に元のトークン分割を再現します。
+
+    Args:
+        maxsize (int): メモリに保持する最大件数
+        ttl (float): 有効期間（秒）
+        path (str): SQLite のファイルパス（None の場合はメモリのみ）
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, path=None):
+        self.memory = LruTtlCache(maxsize, ttl)
+        self.store = SqliteCacheStore(path, ttl) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.stores += 1
+        self.memory.put(key, value)
+        if self.store is not None:
+            self.store.put(key, value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "skipped": self.skipped,
+            "evictions": self.memory.evictions,
+            "expirations": self.memory.expirations + (self.store.expirations if self.store else 0),
+            "entries": len(self.memory),
+        }
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+class ReplayStream:
+    """
+    キャッシュした応答を SSE のストリームとして再生します（events() / raw() は GenAiHttpClient の SseStream と同じ）。
+
+    Args:
+        entry (dict): ResponseCache に保存した値
+        token_chars (int): deltas がない（非ストリーミングで保存した）場合に text を分割する文字数
+    """
+
+    def __init__(self, entry, token_chars=8):
+        self._entry = entry
+        self._token_chars = token_chars
+
+    def _payloads(self):
+        final = dict(self._entry["chatResponse"])
+        deltas = self._entry.get("deltas")
+        if deltas is None:
+            text = final.get("text", "")
+            deltas = [text[i:i + self._token_chars] for i in range(0, len(text), self._token_chars)]
+        api_format = final.get("apiFormat", "COHERE")
+        for delta in deltas:
+            yield {"apiFormat": api_format, "text": delta}
+        yield final
+
+    def events(self):
+        for payload in self._payloads():
+            yield SseEvent(json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+
+    def raw(self):
+        for event in self.events():
+            yield b"data: " + event.data.encode("utf-8") + b"\n\n"
+
+    def close(self):
+        pass
+
+
+class RecordingStream:
+    """
+    上流のストリームをそのまま読み進めつつ text デルタと最終イベントを記録し、
+    最終イベントまで受信できたら on_complete(entry) を呼びます。
+    """
+
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._decoder = CohereStreamDecoder()
+        self._deltas = []
+
+    def _complete(self):
+        result = self._decoder.result
+        if result is not None:
+            self._on_complete({"chatResponse": result.payload, "deltas": self._deltas})
+
+    def events(self):
+        # 呼び出し側は最終イベントを受け取った時点でループを抜けることが多いので、記録は yield の前に行う
+        for event in self._stream.events():
+            text = self._decoder.decode_event(event.data)
+            if text:
+                self._deltas.append(text)
+            if self._decoder.finished:
+                self._complete()
+                yield event
+                return
+            yield event
+
+    def raw(self):
+        for chunk in self._stream.raw():
+            self._deltas.extend(self._decoder.feed(chunk))
+            if self._decoder.finished:
+                self._complete()
+                yield chunk
+                return
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class CachingChatClient:
+    """
+    推論クライアントの chat() の前段に置くキャッシュ。chat 以外のメソッドはそのまま委譲します。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        cache (ResponseCache): 使用するキャッシュ
+        allow_nondeterministic (bool): temperature > 0 かつ seed 未指定のリクエストもキャッシュする場合は True
+    """
+
+    def __init__(self, client, cache, allow_nondeterministic=False):
+        self.client = client
+        self.cache = cache
+        self.allow_nondeterministic = allow_nondeterministic
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def chat(self, chat_details, **kwargs):
+        if not (self.allow_nondeterministic or is_deterministic(chat_details)):
+            self.cache.skipped += 1
+            return self.client.chat(chat_details, **kwargs)
+        key = cache_key(chat_details)
+        stream = is_stream(chat_details)
+        entry = self.cache.get(key)
+        if entry is not None:
+            headers = {"x-cache": "HIT"}
+            if stream:
+                return HttpResponse(200, dict(headers, **{"content-type": "text/event-stream"}), ReplayStream(entry))
+            return HttpResponse(200, headers, WireObject({"modelId": entry.get("modelId"),
+                                                          "modelVersion": entry.get("modelVersion"),
+                                                          "chatResponse": entry["chatResponse"]}))
+        response = self.client.chat(chat_details, **kwargs)
+        if stream:
+            model_id = to_wire(chat_details).get("servingMode", {}).get("modelId")
+            response.data = RecordingStream(response.data,
+                                            lambda entry: self.cache.put(key, dict(entry, modelId=model_id)))
+        else:
+            data = response.data.to_dict() if isinstance(response.data, WireObject) else to_wire(response.data)
+            self.cache.put(key, {"modelId": data.get("modelId"), "modelVersion": data.get("modelVersion"),
+                                 "chatResponse": data["chatResponse"]})
+        return response
@@ -0,0 +1,286 @@
+"""
+グラウンディングに使うドキュメントを選ぶローカルの検索インデックス
+
+サンプルの chat_request.documents は長い日本語のスニペット 3 件を固定で設定し、関係があるかどうかにかかわらず毎回すべて送っています。
+実運用ではスニペットが数万件あるため、CohereChatRequest の前段に検索の段階を置きます。
+
+- ドキュメントは embed_text でまとめて（1 回の呼び出しで最大 96 件）埋め込みに変換
+- 正規化したベクトルを float32 の行列としてファイル（.npy）に保存し、メモリマップで開く
+- message の埋め込みとのコサイン類似度を NumPy の行列演算で計算し、上位 k 件のスニペットだけを documents に設定
+
+ネットワークなしで動かせるように、文字 bigram と単語の特徴量ハッシュによる決定的なスタブの埋め込み（StubEmbedder）を用意しています。
+NumPy が必要です（pip install numpy）。
+
+使い方:
+    embedder = TextEmbedder(generative_ai_inference_client, compartment_id)   # オフラインでは StubEmbedder()
+    index = VectorIndex.build("docs_index", documents, embedder)           # documents は title / snippet / website の dict
+    index = VectorIndex("docs_index")                                      # 2 回目以降
+    retriever = Retriever(index, embedder, k=3)
+    chat_request.documents = retriever.select(chat_request.message)
+
+    python bench_retrieval.py --documents 100000   # 構築時間・検索の遅延・RSS の計測
+"""
+import json
+import os
+import random
+import threading
+
+import numpy as np
+
+from genai_mock_server import hashed_features
+
+EMBED_BATCH_SIZE = 96
+DEFAULT_EMBED_MODEL_ID = "cohere.embed-multilingual-v3.0"
+
+
+TOPICS = [
+    "Oracle Database", "Autonomous Database", "AI ベクトル検索", "MySQL HeatWave", "Exadata", "GoldenGate",
+    "OCI Generative AI", "Kubernetes", "オブジェクト・ストレージ", "ロード・バランサ", "Data Guard", "RAC",
+    "パーティショニング", "インメモリ", "JSON リレーショナル・デュアリティ", "グラフ", "空間データ", "APEX",
+]
+PHRASES = [
+    "の可用性を高める構成について説明します。", "のパフォーマンス・チューニングの手順をまとめました。",
+    "の料金体系とコスト最適化のポイントです。", "へのデータ移行のベスト・プラクティスを紹介します。",
+    "のセキュリティ機能と監査の設定方法です。", "のバックアップとリカバリの設計指針です。",
+    "を使ったアプリケーション開発の入門です。", "の監視とアラートの設定例を示します。",
+]
+
+
+def synthetic_documents(count, seed=0):
+    """
+    計測やデモ用のドキュメント（title / snippet / website の dict）を決定的に生成します。
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        topics = rng.sample(TOPICS, 2)
+        snippet = "".join(f"{topic}{rng.choice(PHRASES)}" for topic in topics) + f"（文書番号 {index}）"
+        yield {"title": f"{topics[0]} ノート {index}", "snippet": snippet,
+               "website": f"https://example.com/docs/{index}"}
+
+
+def document_text(document):
+    """
+    埋め込みに使うドキュメントのテキスト（タイトルとスニペット）
+    """
+    if isinstance(document, str):
+        return document
+    return f"{document.get('title', '')}\n{document.get('snippet', '')}"
+
+
+def normalize_rows(matrix):
+    """
+    各行を L2 ノルムで正規化します（内積がコサイン類似度になるように）。ゼロベクトルはそのままにします。
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class StubEmbedder:
+    """
+    決定的なスタブの埋め込み（特徴量ハッシュ）。モックサーバーの embedText（genai_mock_server.mock_embedding）と
+    同じ hashed_features を使うため、正規化するとモックサーバーの埋め込みと同じベクトルになります。
+    同じテキストは常に同じベクトルになり、語の重なりが多いほど類似度が高くなります。
+
+    Args:
+        dimensions (int): ベクトルの次元数
+    """
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def embed(self, texts, input_type="SEARCH_DOCUMENT"):
+        rows = []
+        columns = []
+        signs = []
+        for row, text in enumerate(texts):
+            for column, sign in hashed_features(text, self.dimensions):
+                rows.append(row)
+                columns.append(column)
+                signs.append(sign)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+                  np.asarray(signs, dtype=np.float32))
+        return matrix
+
+
+class TextEmbedder:
+    """
+    推論クライアントの embed_text による埋め込み
+
+    Args:
+        client: GenerativeAiInferenceClient（または embed_text を持つ互換クライアント）
+        compartment_id (str): OCI コンパートメントID
+        model_id (str): 埋め込みモデル
+        truncate (str): 入力がモデルの上限を超えた場合の切り詰め（NONE | START | END）
+    """
+
+    def __init__(self, client, compartment_id, model_id=DEFAULT_EMBED_MODEL_ID, truncate="END"):
+        self.client = client
+        self.compartment_id = compartment_id
+        self.model_id = model_id
+        self.truncate = truncate
+
+    def build_details(self, texts, input_type):
+        """
+        EmbedTextDetails と同じ構造の dict（OCI SDK のクライアントにもそのまま渡せます）
+        """
+        return {
+            "inputs": list(texts),
+            "servingMode": {"servingType": "ON_DEMAND", "modelId": self.model_id},
+            "compartmentId": self.compartment_id,
+            "inputType": input_type,
+            "truncate": self.truncate,
+        }
+
+    def embed(self, texts, input_type="SEARCH_DOCUMENT"):
+        response = self.client.embed_text(embed_text_details=self.build_details(texts, input_type))
+        return np.asarray(response.data.embeddings, dtype=np.float32)
+
+
+class VectorIndex:
+    """
+    メモリマップした float32 の行列（正規化済みのベクトル）とドキュメントの JSON Lines によるインデックス
+
+    ファイル:
+        {path}/vectors.npy   ドキュメント数 × 次元数の float32 の行列
+        {path}/documents.jsonl   ドキュメント（1 行 1 件）
+        {path}/offsets.npy   documents.jsonl の各行の開始位置（検索結果の行だけを読むために使います）
+
+    Args:
+        path (str): インデックスのディレクトリ
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self._documents = open(os.path.join(path, "documents.jsonl"), "rb")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, path, documents, embedder, batch_size=EMBED_BATCH_SIZE, count=None):
+        """
+        ドキュメントを batch_size 件ずつ埋め込み、インデックスのファイルを書き出して開きます。
+
+        Args:
+            path (str): インデックスのディレクトリ
+            documents: title / snippet / website の dict（または文字列）のイテラブル
+            embedder: StubEmbedder または TextEmbedder
+            batch_size (int): 1 回の埋め込みの件数（embed_text の上限は 96 件）
+            count (int): ドキュメント数（documents が len() を持たない場合に指定します）
+
+        Returns:
+            VectorIndex
+        """
+        os.makedirs(path, exist_ok=True)
+        if count is None:
+            documents = list(documents)
+            count = len(documents)
+        if not count:
+            raise ValueError("ドキュメントがありません")
+        vectors = None
+        offsets = np.zeros(count, dtype=np.int64)
+        row = 0
+        with open(os.path.join(path, "documents.jsonl"), "wb") as out:
+            batch = []
+            for document in documents:
+                batch.append(document)
+                if len(batch) == batch_size:
+                    vectors = cls._write_batch(path, vectors, count, row, batch, embedder, out, offsets)
+                    row += len(batch)
+                    batch = []
+            if batch:
+                vectors = cls._write_batch(path, vectors, count, row, batch, embedder, out, offsets)
+                row += len(batch)
+        if row != count:
+            raise ValueError(f"ドキュメント数が count と一致しません（{row} != {count}）")
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        return cls(path)
+
+    @staticmethod
+    def _write_batch(path, vectors, count, row, batch, embedder, out, offsets):
+        embeddings = normalize_rows(embedder.embed([document_text(document) for document in batch]))
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32,
+                                                shape=(count, embeddings.shape[1]))
+        vectors[row:row + len(batch)] = embeddings
+        for index, document in enumerate(batch):
+            offsets[row + index] = out.tell()
+            out.write(json.dumps(document, ensure_ascii=False).encode("utf-8") + b"\n")
+        return vectors
+
+    def document(self, index):
+        with self._lock:
+            self._documents.seek(int(self.offsets[index]))
+            line = self._documents.readline()
+        return json.loads(line)
+
+    def search(self, query_vector, k=3):
+        """
+        正規化した query_vector とのコサイン類似度が高い順に (行番号, 類似度) を k 件返します。
+        """
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        # 全件をソートせず、上位 k 件だけを取り出してから並べる
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(index), float(scores[index])) for index in top]
+
+    def close(self):
+        self._documents.close()
+
+
+class Retriever:
+    """
+    message に関連するドキュメントを選んで chat_request.documents に設定するための検索
+
+    Args:
+        index (VectorIndex): 検索するインデックス
+        embedder: インデックスの構築に使ったものと同じ埋め込み
+        k (int): 選ぶドキュメントの件数
+        min_score (float): これ未満の類似度のドキュメントは選びません
+    """
+
+    def __init__(self, index, embedder, k=3, min_score=None):
+        self.index = index
+        self.embedder = embedder
+        self.k = k
+        self.min_score = min_score
+
+    def search(self, message, k=None):
+        """
+        (ドキュメント, 類似度) のリストを類似度の高い順に返します。
+        """
+        query = self.embedder.embed([message], input_type="SEARCH_QUERY")[0]
+        return [(self.index.document(index), score) for index, score in self.index.search(query, k or self.k)
+                if self.min_score is None or score >= self.min_score]
+
+    def select(self, message, k=None):
+        """
+        chat_request.documents に設定するドキュメントのリスト
+        """
+        return [document for document, _ in self.search(message, k)]
+
+    def ground(self, chat_details, k=None):
+        """
+        ChatDetails（SDK モデルまたは dict）の chatRequest.documents を message に関連するドキュメントに置き換えます。
+        """
+        if isinstance(chat_details, dict):
+            chat_request = chat_details["chatRequest"]
+            chat_request["documents"] = self.select(chat_request["message"], k)
+        else:
+            chat_request = chat_details.chat_request
+            chat_request.documents = self.select(chat_request.message, k)
+        return chat_details
@@ -0,0 +1,464 @@
+"""
+トークン / バイト数の上限付きで chat_history を圧縮する会話セッションの管理
+
+サンプルは chat_request.chat_history を CohereSystemMessage / CohereUserMessage / CohereChatBotMessage の
+リストとして作り、毎ターンすべてを送り直しています（ストリーミングのサンプルは res['chatHistory'] の dict もそのまま保持します）。
+長く続く会話ではリクエストの大きさとサーバー側のプロンプト処理が際限なく増えます。このモジュールは次の機能を提供します。
+
+- ロールを 1 バイトのコードに置き換え、メッセージを配列で保持するコンパクトなセッション（__slots__）
+- 任意の SQLite によるディスク上の保存（プロセスをまたいで会話を再開でき、メモリに置くセッション数も制限できます）
+- chat_history の推定トークン数 / バイト数の上限。超えた場合は古いターンから削除し、summarizer があれば要約に置き換えます
+  （システムメッセージは常に先頭に残します）
+- ターンごとの送信サイズと、圧縮しなかった場合のサイズの報告
+
+使い方:
+    store = SessionStore(max_tokens=2000, summarizer=chat_summarizer(client, compartment_id, model_id),
+                         path="sessions.sqlite3")
+    session = store.get("user-123", system="あなたはIT業界に精通した優秀なテクニカルライターです。")
+    chat_history, report = store.prepare(session, message)
+    chat_request.chat_history = chat_history          # sdk=True で CohereMessage のリストにもできます
+    ...
+    store.record(session, message, chatbot_message)
+    print(report.history_bytes, report.uncompacted_bytes)
+"""
+import argparse
+import collections
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+
+ROLES = ("SYSTEM", "USER", "CHATBOT")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+SYSTEM, USER, CHATBOT = 0, 1, 2
+
+SUMMARY_PREFIX = "これまでの会話の要約: "
+# {"role":"","message":""} の区切りとカンマ
+_MESSAGE_OVERHEAD = len('{"role":"","message":""},')
+
+
+def estimate_tokens(text):
+    """
+    トークン数の簡易的な推定（ASCII は 4 文字で 1 トークン、それ以外は 1 文字で 1 トークン）。
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+
+def message_bytes(role, message):
+    """
+    chat_history の 1 件を JSON にしたときのバイト数
+    """
+    return _MESSAGE_OVERHEAD + len(role) + len(json.dumps(message, ensure_ascii=False).encode("utf-8")) - 2
+
+
+@dataclass
+class TurnReport:
+    """
+    1 ターン分の送信サイズの報告
+
+    Attributes:
+        turn (int): ターン番号（1 始まり）
+        messages (int): 送信した chat_history の件数（システムメッセージと要約を含む）
+        history_bytes (int): 送信した chat_history と message のバイト数
+        history_tokens (int): 送信した chat_history と message の推定トークン数
+        uncompacted_bytes (int): 圧縮しなかった場合のバイト数
+        uncompacted_tokens (int): 圧縮しなかった場合の推定トークン数
+        dropped (int): このターンで削除したメッセージ数
+        summarized (bool): このターンで要約を更新したかどうか
+    """
+    turn: int
+    messages: int
+    history_bytes: int
+    history_tokens: int
+    uncompacted_bytes: int
+    uncompacted_tokens: int
+    dropped: int = 0
+    summarized: bool = False
+
+    @property
+    def saved_bytes(self):
+        return self.uncompacted_bytes - self.history_bytes
+
+
+class ConversationSession:
+    """
+    1 つの会話。ロールのコード・メッセージ・メッセージごとのバイト数と推定トークン数を並列の配列で保持します。
+
+    Attributes:
+        session_id (str): セッションID
+        system (str): システムメッセージ（圧縮しても常に先頭に残します）
+        summary (str): 削除したターンの要約
+        turns (int): これまでのターン数
+        total_bytes (int): これまでに追加したすべてのメッセージのバイト数（圧縮しなかった場合のサイズの計算に使います）
+        total_tokens (int): これまでに追加したすべてのメッセージの推定トークン数
+        first_seq (int): 保持している最初のメッセージの通し番号（ディスク上の保存で使います）
+    """
+    __slots__ = ("session_id", "system", "summary", "turns", "total_bytes", "total_tokens", "first_seq",
+                 "last_report", "_roles", "_messages", "_bytes", "_tokens")
+
+    def __init__(self, session_id, system=None, summary=None):
+        self.session_id = session_id
+        self.system = system
+        self.summary = summary
+        self.turns = 0
+        self.total_bytes = 0
+        self.total_tokens = 0
+        self.first_seq = 0
+        self.last_report = None
+        self._roles = array("B")
+        self._messages = []
+        self._bytes = array("I")
+        self._tokens = array("I")
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, role, message):
+        """
+        メッセージを 1 件追加し、その通し番号を返します。
+        """
+        size = message_bytes(role, message)
+        tokens = estimate_tokens(message)
+        self._roles.append(_ROLE_CODES[role])
+        self._messages.append(message)
+        self._bytes.append(size)
+        self._tokens.append(tokens)
+        self.total_bytes += size
+        self.total_tokens += tokens
+        return self.first_seq + len(self._messages) - 1
+
+    def messages(self):
+        """
+        (ロール, メッセージ) を古い順に返します（システムメッセージと要約は含みません）。
+        """
+        return ((ROLES[code], message) for code, message in zip(self._roles, self._messages))
+
+    def pinned(self):
+        """
+        先頭に固定するメッセージ（システムメッセージと要約）の (ロール, メッセージ) のリスト
+        """
+        pinned = []
+        if self.system:
+            pinned.append(("SYSTEM", self.system))
+        if self.summary:
+            pinned.append(("SYSTEM", SUMMARY_PREFIX + self.summary))
+        return pinned
+
+    def history_size(self):
+        """
+        現在の chat_history の (バイト数, 推定トークン数)
+        """
+        size = sum(self._bytes)
+        tokens = sum(self._tokens)
+        for role, message in self.pinned():
+            size += message_bytes(role, message)
+            tokens += estimate_tokens(message)
+        return size, tokens
+
+    def drop_oldest(self, count):
+        """
+        古いメッセージを count 件削除し、削除した (ロール, メッセージ) のリストを返します。
+        """
+        dropped = list(zip((ROLES[code] for code in self._roles[:count]), self._messages[:count]))
+        del self._roles[:count]
+        del self._messages[:count]
+        del self._bytes[:count]
+        del self._tokens[:count]
+        self.first_seq += count
+        return dropped
+
+    def oldest_turn_length(self):
+        """
+        先頭の 1 ターン（USER から次の USER の直前まで）のメッセージ数
+        """
+        roles = self._roles
+        for index in range(1, len(roles)):
+            if roles[index] == USER:
+                return index
+        return len(roles)
+
+    def chat_history(self, sdk=False):
+        """
+        chat_history に設定するリスト（システムメッセージ・要約・保持しているメッセージの順）。
+
+        Args:
+            sdk (bool): True の場合は CohereSystemMessage などの SDK モデル、False の場合は dict のリストを返します
+        """
+        items = self.pinned() + list(self.messages())
+        if not sdk:
+            return [{"role": role, "message": message} for role, message in items]
+        from genai_client_factory import inference_models
+        models = inference_models()
+        classes = {"SYSTEM": models.CohereSystemMessage, "USER": models.CohereUserMessage,
+                   "CHATBOT": models.CohereChatBotMessage}
+        return [classes[role](role=role, message=message) for role, message in items]
+
+
+class SqliteSessionBackend:
+    """
+    SQLite によるセッションの保存先。メッセージは追記し、圧縮で削除したメッセージの行は消します。
+
+    Args:
+        path (str): データベースファイルのパス
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, system TEXT, summary TEXT, "
+            "turns INTEGER NOT NULL, total_bytes INTEGER NOT NULL, total_tokens INTEGER NOT NULL, "
+            "first_seq INTEGER NOT NULL, updated REAL NOT NULL)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages (session_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+            "role INTEGER NOT NULL, message TEXT NOT NULL, PRIMARY KEY (session_id, seq))")
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT system, summary, turns, total_bytes, total_tokens, first_seq FROM sessions "
+                "WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            messages = self._connection.execute(
+                "SELECT role, message FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                (session_id, row[5])).fetchall()
+        session = ConversationSession(session_id, row[0], row[1])
+        session.first_seq = row[5]
+        for code, message in messages:
+            session.add(ROLES[code], message)
+        session.turns, session.total_bytes, session.total_tokens = row[2], row[3], row[4]
+        return session
+
+    def save(self, session, new_messages=()):
+        """
+        セッションの属性と追加したメッセージ（(通し番号, ロール, メッセージ) のリスト）を保存し、削除したメッセージの行を消します。
+        """
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, system, summary, turns, total_bytes, total_tokens, "
+                    "first_seq, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session.session_id, session.system, session.summary, session.turns, session.total_bytes,
+                     session.total_tokens, session.first_seq, time.time()))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO messages (session_id, seq, role, message) VALUES (?, ?, ?, ?)",
+                    [(session.session_id, seq, _ROLE_CODES[role], message) for seq, role, message in new_messages])
+                connection.execute("DELETE FROM messages WHERE session_id = ? AND seq < ?",
+                                   (session.session_id, session.first_seq))
+            except BaseException:
+                # 途中で失敗したときにトランザクションを開いたままにすると、次の BEGIN が失敗する
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self):
+        self._connection.close()
+
+
+def truncating_summarizer(max_chars=600, excerpt_chars=60):
+    """
+    LLM を呼び出さない要約（削除したメッセージの先頭 excerpt_chars 文字を並べ、全体を max_chars 文字に収めます）。
+    """
+    def summarize(previous, dropped):
+        lines = [previous] if previous else []
+        for role, message in dropped:
+            excerpt = message[:excerpt_chars] + ("…" if len(message) > excerpt_chars else "")
+            lines.append(f"{role}: {excerpt}")
+        return "\n".join(lines)[-max_chars:]
+    return summarize
+
+
+def chat_summarizer(client, compartment_id, model_id="cohere.command-a-03-2025", max_tokens=300):
+    """
+    chat（非ストリーミング）で削除したターンを要約する summarizer を返します。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        compartment_id (str): OCI コンパートメントID
+        model_id (str): 要約に使うモデル
+        max_tokens (int): 要約の最大トークン数
+    """
+    def summarize(previous, dropped):
+        conversation = "\n".join(f"{role}: {message}" for role, message in dropped)
+        message = ("次の会話を、後の質問に答えるために必要な事実と決定事項を残して簡潔に要約してください。\n"
+                   + (f"これまでの要約:\n{previous}\n" if previous else "") + f"会話:\n{conversation}")
+        response = client.chat({
+            "compartmentId": compartment_id,
+            "servingMode": {"servingType": "ON_DEMAND", "modelId": model_id},
+            "chatRequest": {"apiFormat": "COHERE", "message": message, "maxTokens": max_tokens, "temperature": 0},
+        })
+        return response.data.chat_response.text
+    return summarize
+
+
+class SessionStore:
+    """
+    会話セッションの管理と chat_history の圧縮
+
+    Args:
+        max_tokens (int): chat_history と message の推定トークン数の上限（None の場合は制限しない）
+        max_bytes (int): chat_history と message のバイト数の上限（None の場合は制限しない）
+        summarizer: summarizer(前回の要約, 削除した (ロール, メッセージ) のリスト) → 新しい要約。None の場合は削除するだけ
+        path (str): SQLite のファイルパス（None の場合はメモリのみ）
+        max_sessions (int): path を指定した場合にメモリに置くセッション数の上限（古いものから追い出します）
+    """
+
+    def __init__(self, max_tokens=None, max_bytes=None, summarizer=None, path=None, max_sessions=1024):
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.summarizer = summarizer
+        self.backend = SqliteSessionBackend(path) if path else None
+        self.max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id, system=None):
+        """
+        セッションを返します。メモリにもディスクにもない場合は system をシステムメッセージにして作ります。
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                return session
+        session = self.backend.load(session_id) if self.backend is not None else None
+        if session is None:
+            session = ConversationSession(session_id, system)
+        with self._lock:
+            session = self._sessions.setdefault(session_id, session)
+            if self.backend is not None:
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        return session
+
+    def _over_budget(self, size, tokens):
+        return (self.max_bytes is not None and size > self.max_bytes) or \
+            (self.max_tokens is not None and tokens > self.max_tokens)
+
+    def _fit_summary(self, session, message_size, message_tokens):
+        """
+        上限に収まるまで要約の先頭（古い側）を削り、(バイト数, 推定トークン数) を返します。
+        """
+        while True:
+            size, tokens = session.history_size()
+            size += message_size
+            tokens += message_tokens
+            if not session.summary or not self._over_budget(size, tokens):
+                return size, tokens
+            summary = session.summary[len(session.summary) // 4 + 1:]
+            session.summary = summary or None
+
+    def prepare(self, session, message, sdk=False):
+        """
+        message を送る前に上限に収まるまで古いターンを削除（summarizer があれば要約）し、(chat_history, TurnReport) を返します。
+        """
+        message_size = len(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+        message_tokens = estimate_tokens(message)
+        dropped = []
+        summarized = False
+        previous_summary = session.summary
+        while True:
+            # 要約も chat_history の一部として上限に含める（history_size は要約を含む）
+            size, tokens = session.history_size()
+            size += message_size
+            tokens += message_tokens
+            if not len(session) or not self._over_budget(size, tokens):
+                break
+            evicted = []
+            while len(session) and self._over_budget(size, tokens):
+                count = session.oldest_turn_length()
+                size -= sum(session._bytes[:count])
+                tokens -= sum(session._tokens[:count])
+                evicted.extend(session.drop_oldest(count))
+            dropped.extend(evicted)
+            if self.summarizer is not None:
+                # 新しい要約で上限を超えた場合は次の周回でさらに削除し、そのターンも要約に含める
+                session.summary = self.summarizer(session.summary, evicted)
+                summarized = True
+        if session.summary and self._over_budget(size, tokens):
+            # 保持しているターンがなくなっても要約だけで上限を超える場合は、要約の古い側を切り詰める
+            size, tokens = self._fit_summary(session, message_size, message_tokens)
+        if (dropped or session.summary != previous_summary) and self.backend is not None:
+            self.backend.save(session)
+        uncompacted_bytes = message_size + session.total_bytes
+        uncompacted_tokens = message_tokens + session.total_tokens
+        if session.system:
+            uncompacted_bytes += message_bytes("SYSTEM", session.system)
+            uncompacted_tokens += estimate_tokens(session.system)
+        chat_history = session.chat_history(sdk)
+        report = TurnReport(turn=session.turns + 1, messages=len(chat_history), history_bytes=size,
+                            history_tokens=tokens, uncompacted_bytes=uncompacted_bytes,
+                            uncompacted_tokens=uncompacted_tokens, dropped=len(dropped), summarized=summarized)
+        session.last_report = report
+        return chat_history, report
+
+    def record(self, session, user_message, chatbot_message):
+        """
+        1 ターン分（ユーザーのメッセージとモデルの応答）を追加します。
+        """
+        new_messages = [(session.add("USER", user_message), "USER", user_message),
+                        (session.add("CHATBOT", chatbot_message), "CHATBOT", chatbot_message)]
+        session.turns += 1
+        if self.backend is not None:
+            self.backend.save(session, new_messages)
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+
+def main():
+    from genai_async_engine import build_chat_details
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+
+    parser = argparse.ArgumentParser(description="長い会話での chat_history の圧縮によるリクエストサイズと遅延の比較")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--max-tokens", type=int, default=3000)
+    parser.add_argument("--report-every", type=int, default=10)
+    args = parser.parse_args()
+
+    response_text = "Oracle Database は多くの企業の基幹システムで利用されているリレーショナルデータベースです。" * 8
+    system = "あなたはIT業界に精通した優秀なテクニカルライターです。"
+    with MockGenAiServer(response_text=response_text) as server:
+        client = GenAiHttpClient(server.endpoint)
+        results = {}
+        for label, store in (("full history", SessionStore()),
+                             ("compacted", SessionStore(max_tokens=args.max_tokens,
+                                                        summarizer=truncating_summarizer()))):
+            session = store.get("demo", system=system)
+            rows = []
+            for turn in range(args.turns):
+                message = f"Oracle Database の機能 {turn} について詳しく教えてください。"
+                chat_history, report = store.prepare(session, message)
+                details = build_chat_details(message)
+                details["chatRequest"]["chatHistory"] = chat_history
+                start = time.perf_counter()
+                response = client.chat(details)
+                latency = time.perf_counter() - start
+                store.record(session, message, response.data.chat_response.text)
+                rows.append((report, latency))
+            results[label] = rows
+        client.close()
+
+    print(f"{'turn':>4} {'full bytes':>10} {'full ms':>8} {'compact bytes':>13} {'compact ms':>10} {'msgs':>5} "
+          f"{'tokens':>6}")
+    for index in range(args.report_every - 1, args.turns, args.report_every):
+        full, full_latency = results["full history"][index]
+        compact, compact_latency = results["compacted"][index]
+        print(f"{compact.turn:>4} {full.history_bytes:>10} {full_latency * 1000:>8.2f} {compact.history_bytes:>13} "
+              f"{compact_latency * 1000:>10.2f} {compact.messages:>5} {compact.history_tokens:>6}")
+    sent = sum(report.history_bytes for report, _ in results["compacted"])
+    uncompacted = sum(report.uncompacted_bytes for report, _ in results["compacted"])
+    print(f"\nchat_history bytes sent: {sent} (uncompacted {uncompacted}, saved {1 - sent / uncompacted:.1%})")
+
+
+if __name__ == "__main__":
+    main()
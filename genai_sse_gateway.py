@@ -0,0 +1,565 @@
+"""
+チャットのストリーミング応答を server-sent events でブラウザなどのクライアントに中継する asyncio の HTTP ゲートウェイ
+
+サンプルのストリーミングは print(res['text'], end="", flush=True) で標準出力に書くだけで、
+接続ごとにブロッキングするスレッドを 1 つ占有します。このゲートウェイは 1 つのイベントループで多数のストリームを扱います。
+
+- POST /chat で chat のリクエストを受け付け、上流のストリームを開いて text のデルタを SSE で中継
+- 最後に citations / finishReason を含む最終イベント（既定では chatHistory を除く）を中継
+- 接続ごとに上限付きのバッファ（buffer_events 件と送信バッファ）を持ち、上流からの読み込みはバッファが空くまで待つ
+- slow_consumer_timeout 秒以上バッファが空かない（受信が遅い）クライアントは切断し、上流のストリームも閉じる
+- クライアントが切断したら上流の読み込みを取り消し、上流の接続を閉じる
+- GET /stats で同時ストリーム数・切断数・プロセスの CPU 時間などを JSON で返す
+
+上流には、署名の不要なエンドポイント（ローカルのモックサーバーなど）へ asyncio で直接接続する AsyncUpstream と、
+OCI SDK の GenerativeAiInferenceClient（署名付き）をスレッドプールで呼び出す ThreadedUpstream を使えます。
+
+使い方:
+    python genai_sse_gateway.py --port 8000 --upstream http://127.0.0.1:8080   # モックサーバーへ中継
+    curl -N -d '{"message": "Oracle Database とは？"}' http://127.0.0.1:8000/chat
+
+    gateway = SseGateway(ThreadedUpstream(generative_ai_inference_client), compartment_id)
+    await gateway.start("0.0.0.0", 8000)
+    await gateway.serve_forever()
+
+    python bench_sse_gateway.py --streams 100,250,500,1000   # 1 コアあたりの同時ストリーム数の計測
+"""
+import argparse
+import asyncio
+import functools
+import json
+import socket
+import ssl
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from genai_async_engine import build_chat_details
+from genai_http_client import CHAT_PATH, GenAiServiceError, dumps_wire
+from genai_sse_parser import CohereStreamDecoder
+
+# リクエストの本文で message と一緒に指定できる chatRequest の項目
+CHAT_REQUEST_FIELDS = (
+    "chatHistory", "documents", "preambleOverride", "maxTokens", "temperature", "topP", "topK",
+    "frequencyPenalty", "presencePenalty", "seed", "stopSequences", "citationQuality",
+)
+_END = object()
+
+
+class AsyncSseStream:
+    """
+    AsyncUpstream が開いた上流のストリーム。async for で受信したバイト列を到着した単位で返します。
+    """
+
+    def __init__(self, reader, writer, chunked, read_timeout):
+        self._reader = reader
+        self._writer = writer
+        self._chunked = chunked
+        self._read_timeout = read_timeout
+        self._finished = False
+        self._closed = False
+
+    def __aiter__(self):
+        return self.chunks()
+
+    async def chunks(self):
+        reader = self._reader
+        try:
+            while True:
+                if self._chunked:
+                    line = await asyncio.wait_for(reader.readline(), self._read_timeout)
+                    size = int(line.split(b";", 1)[0], 16)
+                    if size == 0:
+                        self._finished = True
+                        break
+                    chunk = await asyncio.wait_for(reader.readexactly(size + 2), self._read_timeout)
+                    yield chunk[:-2]
+                else:
+                    chunk = await asyncio.wait_for(reader.read(65536), self._read_timeout)
+                    if not chunk:
+                        self._finished = True
+                        break
+                    yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            if self._finished:
+                self._writer.close()
+            else:
+                # 読み終える前に閉じる場合は RST で切断し、上流にすぐ生成をやめさせる
+                self._writer.transport.abort()
+
+
+class AsyncUpstream:
+    """
+    署名の不要なエンドポイント（ローカルのモックサーバーなど）に asyncio で接続する上流。
+    ストリームは長時間続くため接続はプールせず、ストリームごとに開いて閉じます。
+
+    Args:
+        service_endpoint (str): サービスエンドポイント（例: http://127.0.0.1:8080）
+        connect_timeout (float): 接続タイムアウト（秒）
+        read_timeout (float): 読み取りタイムアウト（秒）
+    """
+
+    def __init__(self, service_endpoint, connect_timeout=10, read_timeout=240):
+        parsed = urllib.parse.urlsplit(service_endpoint)
+        self.host = parsed.hostname
+        self.ssl = ssl.create_default_context() if parsed.scheme == "https" else None
+        self.port = parsed.port or (443 if self.ssl else 80)
+        self.path = parsed.path.rstrip("/") + CHAT_PATH
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    async def open(self, chat_details, opc_request_id=None):
+        """
+        chat のストリーミングのリクエストを送り、AsyncSseStream を返します（エラー応答は GenAiServiceError）。
+        """
+        body = dumps_wire(chat_details)
+        opc_request_id = opc_request_id or uuid.uuid4().hex.upper()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+                                                self.connect_timeout)
+        try:
+            writer.write(f"POST {self.path} HTTP/1.1\r\nhost: {self.host}:{self.port}\r\n"
+                         f"content-type: application/json\r\naccept: text/event-stream\r\n"
+                         f"opc-request-id: {opc_request_id}\r\ncontent-length: {len(body)}\r\n\r\n".encode("ascii")
+                         + body)
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+            status_line, *header_lines = head[:-4].decode("latin-1").split("\r\n")
+            status = int(status_line.split(" ", 2)[1])
+            headers = {}
+            for line in header_lines:
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            request_id = headers.get("opc-request-id", opc_request_id)
+            chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+            if status >= 400:
+                payload = await asyncio.wait_for(reader.readexactly(int(headers.get("content-length", 0))),
+                                                 self.read_timeout)
+                try:
+                    error = json.loads(payload)
+                except ValueError:
+                    error = {}
+                raise GenAiServiceError(status, error.get("code", "Unknown"),
+                                        error.get("message", payload.decode("utf-8", "replace")), headers, request_id)
+            return AsyncSseStream(reader, writer, chunked, self.read_timeout)
+        except BaseException:
+            writer.transport.abort()
+            raise
+
+    def close(self):
+        pass
+
+
+class ThreadedSseStream:
+    """
+    ThreadedUpstream が開いた上流のストリーム。SDK の events() をスレッドプールで読み、SSE のバイト列として返します。
+    """
+
+    def __init__(self, stream, executor):
+        self._stream = stream
+        self._executor = executor
+
+    def __aiter__(self):
+        return self.chunks()
+
+    async def chunks(self):
+        loop = asyncio.get_running_loop()
+        events = iter(self._stream.events())
+        try:
+            while True:
+                event = await loop.run_in_executor(self._executor, next, events, None)
+                if event is None:
+                    break
+                data = event.data
+                yield b"data: " + (data.encode("utf-8") if isinstance(data, str) else data) + b"\n\n"
+        finally:
+            self.close()
+
+    def close(self):
+        # 読み込み中のスレッドは接続が閉じられた時点で例外になって戻る
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+
+class ThreadedUpstream:
+    """
+    OCI SDK の GenerativeAiInferenceClient（または GenAiHttpClient）を使う上流。
+    署名付きのリクエストを送れる代わりに、受信中のストリームごとにスレッドプールのスレッドを使います。
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        max_workers (int): 同時に受信できるストリーム数
+    """
+
+    def __init__(self, client, max_workers=256):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sse-upstream")
+
+    async def open(self, chat_details, opc_request_id=None):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.client.chat, chat_details, opc_request_id=opc_request_id)
+        response = await loop.run_in_executor(self._executor, call)
+        return ThreadedSseStream(response.data, self._executor)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@dataclass
+class GatewayStats:
+    """
+    ゲートウェイの集計
+
+    Attributes:
+        active_streams (int): 中継中のストリーム数
+        peak_streams (int): 同時ストリーム数の最大値
+        completed (int): 最終イベントまで中継したストリーム数
+        client_disconnects (int): 途中でクライアントが切断したストリーム数
+        slow_consumers (int): 受信が遅いために切断したストリーム数
+        upstream_errors (int): 上流のエラーで終わったストリーム数
+        rejected (int): 同時ストリーム数の上限で断ったリクエスト数
+        events (int): クライアントに送ったイベント数
+        bytes (int): クライアントに送ったバイト数
+    """
+    active_streams: int = 0
+    peak_streams: int = 0
+    completed: int = 0
+    client_disconnects: int = 0
+    slow_consumers: int = 0
+    upstream_errors: int = 0
+    rejected: int = 0
+    events: int = 0
+    bytes: int = 0
+
+    def summary(self):
+        summary = dict(self.__dict__)
+        # ゲートウェイのプロセスの CPU 時間（負荷試験で 1 コアあたりの同時ストリーム数を求めるのに使います）
+        summary["cpu_seconds"] = time.process_time()
+        return summary
+
+
+class SlowConsumerError(Exception):
+    pass
+
+
+def sse_frame(payload, event=None):
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return (b"event: " + event.encode("ascii") + b"\n" if event else b"") + b"data: " + data + b"\n\n"
+
+
+class SseGateway:
+    """
+    チャットのストリームを SSE でクライアントに中継するゲートウェイ
+
+    Args:
+        upstream: AsyncUpstream または ThreadedUpstream
+        compartment_id (str): OCI コンパートメントID
+        model_id (str): リクエストで servingMode を指定しなかった場合のモデル
+        buffer_events (int): 接続ごとにクライアントへの送信待ちにできるイベント数
+        write_buffer (int): 接続ごとの送信バッファの上限（バイト）
+        socket_buffer (int): 接続ごとのソケットの送信バッファ（SO_SNDBUF。None の場合は OS の既定）
+        slow_consumer_timeout (float): バッファが空くのを待つ最大時間（秒）。超えたら切断します
+        max_streams (int): 同時ストリーム数の上限（超えたら 503。None の場合は上限なし）
+        include_chat_history (bool): 最終イベントに chatHistory を含めるかどうか
+        max_body (int): リクエストの本文の上限（バイト）
+        request_timeout (float): リクエストを受信し終えるまでの最大時間（秒）
+    """
+
+    def __init__(self, upstream, compartment_id, model_id="cohere.command-a-03-2025", buffer_events=64,
+                 write_buffer=64 * 1024, socket_buffer=None, slow_consumer_timeout=5.0, max_streams=None,
+                 include_chat_history=False, max_body=1024 * 1024, request_timeout=10.0):
+        self.upstream = upstream
+        self.compartment_id = compartment_id
+        self.model_id = model_id
+        self.buffer_events = buffer_events
+        self.write_buffer = write_buffer
+        self.socket_buffer = socket_buffer
+        self.slow_consumer_timeout = slow_consumer_timeout
+        self.max_streams = max_streams
+        self.include_chat_history = include_chat_history
+        self.max_body = max_body
+        self.request_timeout = request_timeout
+        self.stats = GatewayStats()
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=0, backlog=1024):
+        self.server = await asyncio.start_server(self.handle, host, port, backlog=backlog)
+        return self
+
+    @property
+    def endpoint(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def serve_forever(self):
+        await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.upstream.close()
+
+    def build_details(self, request):
+        """
+        クライアントのリクエスト（message と CHAT_REQUEST_FIELDS の項目、または ChatDetails と同じ構造の dict）から
+        ストリーミングの ChatDetails と同じ構造の dict を作ります。
+        """
+        if "chatRequest" in request:
+            details = dict(request)
+            details["chatRequest"] = dict(request["chatRequest"])
+            details.setdefault("compartmentId", self.compartment_id)
+            details.setdefault("servingMode", {"servingType": "ON_DEMAND", "modelId": self.model_id})
+        else:
+            message = request.get("message")
+            if not isinstance(message, str):
+                raise ValueError("message (string) is required")
+            details = build_chat_details(message, self.model_id, self.compartment_id)
+            details["chatRequest"].update((key, request[key]) for key in CHAT_REQUEST_FIELDS if key in request)
+        details["chatRequest"]["isStream"] = True
+        return details
+
+    async def handle(self, reader, writer):
+        try:
+            try:
+                method, path, body = await asyncio.wait_for(self.read_request(reader), self.request_timeout)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError,
+                    ConnectionError):
+                return
+            if path == "/stats" and method == "GET":
+                await self.send_json(writer, 200, self.stats.summary())
+            elif path != "/chat":
+                await self.send_json(writer, 404, {"code": "NotFound", "message": f"Unknown path {path}"})
+            elif method != "POST":
+                await self.send_json(writer, 405, {"code": "MethodNotAllowed", "message": "use POST"})
+            else:
+                try:
+                    details = self.build_details(json.loads(body))
+                except (ValueError, TypeError, AttributeError) as e:
+                    await self.send_json(writer, 400, {"code": "InvalidParameter", "message": str(e)})
+                    return
+                if self.max_streams is not None and self.stats.active_streams >= self.max_streams:
+                    self.stats.rejected += 1
+                    await self.send_json(writer, 503, {"code": "TooManyStreams", "message": "gateway is at capacity"},
+                                         {"retry-after": "1"})
+                    return
+                await self.relay(reader, writer, details)
+        except (ConnectionError, asyncio.CancelledError):
+            # CancelledError はサーバーの停止時（接続ごとのタスクの結果を待つ呼び出し元はない）
+            pass
+        finally:
+            writer.transport.close()
+
+    async def read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head[:-4].decode("latin-1").split("\r\n")
+        method, target, _ = request_line.split(" ", 2)
+        length = 0
+        for line in header_lines:
+            key, _, value = line.partition(":")
+            if key.strip().lower() == "content-length":
+                length = int(value)
+        if length > self.max_body:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, urllib.parse.urlsplit(target).path, body
+
+    async def send_json(self, writer, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}", "content-type: application/json",
+                 f"content-length: {len(data)}", "connection: close"]
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def relay(self, reader, writer, details):
+        """
+        上流のストリームを開き、クライアントへの書き込みとクライアントの切断の監視を並行に行います。
+        """
+        stats = self.stats
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        if self.socket_buffer is not None:
+            # OS の自動調整に任せると受信しないクライアントのためにカーネル側で数 MB まで溜まる
+            writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_buffer)
+        try:
+            stream = await self.upstream.open(details)
+        except Exception as e:
+            # GenAiServiceError と SDK の oci.exceptions.ServiceError は status / code / message / request_id を持つ。
+            # 接続エラーやタイムアウトなど、ステータスのないエラーは 502 にする
+            stats.upstream_errors += 1
+            status = getattr(e, "status", None)
+            if not isinstance(status, int) or status < 400:
+                status = 502
+            request_id = getattr(e, "request_id", None)
+            await self.send_json(writer, status, {"code": getattr(e, "code", None) or "BadGateway",
+                                                  "message": getattr(e, "message", None) or str(e) or type(e).__name__},
+                                 {"opc-request-id": request_id} if request_id else None)
+            return
+        stats.active_streams += 1
+        stats.peak_streams = max(stats.peak_streams, stats.active_streams)
+        queue = asyncio.Queue(self.buffer_events)
+        pump = asyncio.create_task(self.pump(stream, queue, writer))
+        # SSE のクライアントはリクエストの後に何も送らないため、読み込みが EOF になったら切断とみなす
+        watcher = asyncio.create_task(reader.read(1))
+
+        def on_client_eof(_):
+            if not pump.done():
+                writer.transport.abort()
+                pump.cancel()
+
+        watcher.add_done_callback(on_client_eof)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ncache-control: no-cache\r\n"
+                         b"x-accel-buffering: no\r\nconnection: close\r\n\r\n")
+            while True:
+                # 最後のフレームでキューが満杯になると pump は終了の印を入れられないため、pump の終了でも抜ける
+                if queue.empty() and pump.done():
+                    break
+                frames = [await queue.get()]
+                # 溜まっているイベントはまとめて 1 回で書き込む
+                while frames[-1] is not _END and not queue.empty():
+                    frames.append(queue.get_nowait())
+                done = frames[-1] is _END
+                if done:
+                    frames.pop()
+                if frames:
+                    data = b"".join(frames)
+                    writer.write(data)
+                    stats.events += len(frames)
+                    stats.bytes += len(data)
+                await writer.drain()
+                if done:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            watcher.remove_done_callback(on_client_eof)
+            watcher.cancel()
+            pump.cancel()
+            await asyncio.wait((pump,))
+            stream.close()
+            stats.active_streams -= 1
+        outcome = "disconnected" if pump.cancelled() else pump.result()
+        if outcome == "completed":
+            stats.completed += 1
+        elif outcome == "error":
+            stats.upstream_errors += 1
+        elif outcome == "slow":
+            stats.slow_consumers += 1
+        else:
+            stats.client_disconnects += 1
+
+    async def pump(self, stream, queue, writer):
+        """
+        上流のストリームを読み、SSE のイベントをキューに入れます。
+        キューが満杯のときは上流の読み込みを止めて待ち、slow_consumer_timeout を超えたらクライアントを切断します。
+
+        Returns:
+            str: "completed"（最終イベントまで中継）・"error"（上流のエラー）・"slow"（受信が遅いクライアントを切断）
+        """
+        decoder = CohereStreamDecoder()
+        outcome = "completed"
+        try:
+            try:
+                async for text in decoder.aiter_bytes(stream):
+                    await self.put(queue, sse_frame({"text": text}))
+                result = decoder.result
+                if result is None:
+                    outcome = "error"
+                    await self.put(queue, sse_frame({"code": "IncompleteStream",
+                                                     "message": "upstream closed before the final event"}, "error"))
+                else:
+                    payload = result.payload
+                    if not self.include_chat_history:
+                        payload = {key: value for key, value in payload.items() if key != "chatHistory"}
+                    await self.put(queue, sse_frame(payload))
+            except SlowConsumerError:
+                raise
+            except Exception as e:
+                outcome = "error"
+                await self.put(queue, sse_frame({"code": getattr(e, "code", "UpstreamError"),
+                                                 "message": str(e) or type(e).__name__}, "error"))
+        except SlowConsumerError:
+            writer.transport.abort()
+            return "slow"
+        finally:
+            stream.close()
+            # 取り消された場合もキューを待っている書き込み側を起こす（満杯のときは relay が pump の終了を確認する）
+            if not queue.full():
+                queue.put_nowait(_END)
+        return outcome
+
+    async def put(self, queue, frame):
+        if not queue.full():
+            queue.put_nowait(frame)
+            return
+        try:
+            await asyncio.wait_for(queue.put(frame), self.slow_consumer_timeout)
+        except asyncio.TimeoutError:
+            raise SlowConsumerError() from None
+
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 429: "Too Many Requests",
+                500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable"}
+
+
+def raise_open_file_limit():
+    """
+    多数の同時接続を受け付けられるように、開けるファイル数のソフトリミットをハードリミットまで上げます。
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else max(soft, 65536),
+                                                    hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャットのストリーミング応答を SSE で中継する asyncio のゲートウェイ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--upstream", help="署名の不要な上流のエンドポイント（省略時は OCI SDK のクライアント）")
+    parser.add_argument("--profile", default="DEFAULT", help="OCI SDK の設定ファイルのプロファイル")
+    parser.add_argument("--compartment-id", default="ocid1.compartment.oc1..mock")
+    parser.add_argument("--model-id", default="cohere.command-a-03-2025")
+    parser.add_argument("--buffer-events", type=int, default=64)
+    parser.add_argument("--slow-consumer-timeout", type=float, default=5.0)
+    parser.add_argument("--socket-buffer", type=int, help="接続ごとのソケットの送信バッファ（バイト）")
+    parser.add_argument("--max-streams", type=int)
+    args = parser.parse_args()
+
+    if args.upstream:
+        upstream = AsyncUpstream(args.upstream)
+    else:
+        from genai_client_factory import get_client
+        upstream = ThreadedUpstream(get_client(args.profile))
+    raise_open_file_limit()
+
+    async def serve():
+        gateway = SseGateway(upstream, args.compartment_id, args.model_id, buffer_events=args.buffer_events,
+                             socket_buffer=args.socket_buffer, slow_consumer_timeout=args.slow_consumer_timeout,
+                             max_streams=args.max_streams)
+        await gateway.start(args.host, args.port)
+        print(f"SSE gateway: {gateway.endpoint}", flush=True)
+        try:
+            await gateway.serve_forever()
+        finally:
+            await gateway.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Cohere チャットのストリーミング応答（server-sent events）用のインクリメンタルなデコーダー
+
+トークンごとのイベント {"apiFormat":"COHERE","text":"..."} は json.loads を使わずに text の値だけを切り出し（ファストパス）、
+finishReason を含む最終イベント（chatHistory, citations, prompt）だけを完全に JSON としてパースします。
+
+使い方:
+    decoder = CohereStreamDecoder()
+    for text in decoder.iter_events(chat_response.data.events()):   # OCI SDK の SSE イベント
+        print(text, end="", flush=True)
+    result = decoder.result   # StreamResult（finish_reason, chat_history, citations, prompt, text）
+
+    for text in decoder.iter_bytes(chat_response.data.raw()):        # GenAiHttpClient の生のバイト列
+        ...
+"""
+import json
+from dataclasses import dataclass, field
+
+_TEXT_KEY = '"text":"'
+_TEXT_KEY_BYTES = b'"text":"'
+_FINISH_KEY = '"finishReason"'
+_FINISH_KEY_BYTES = b'"finishReason"'
+
+
+@dataclass
+class StreamResult:
+    """
+    最終イベント（finishReason を含むイベント）の内容
+
+    Attributes:
+        text (str): 生成された応答全体
+        finish_reason (str): 終了理由（COMPLETE / MAX_TOKENS など）
+        chat_history (list): 会話履歴（dict のリスト）
+        citations (list): 引用（dict のリスト）
+        prompt (str): is_echo=True の場合にモデルに送信されたプロンプト
+        payload (dict): 最終イベントの JSON 全体
+    """
+    text: str = ""
+    finish_reason: str = ""
+    chat_history: list = field(default_factory=list)
+    citations: list = field(default_factory=list)
+    prompt: str = ""
+    payload: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_payload(cls, payload):
+        return cls(text=payload.get("text", ""), finish_reason=payload.get("finishReason", ""),
+                   chat_history=payload.get("chatHistory", []), citations=payload.get("citations", []),
+                   prompt=payload.get("prompt", ""), payload=payload)
+
+
+def fast_text(data):
+    """
+    トークンイベントの data から text の値を取り出します。
+
+    text が最後のキーである通常のイベントでは JSON 全体をパースせずに文字列を切り出し、
+    エスケープを含む場合は文字列リテラル部分だけを json.loads します。
+    想定外の形（finishReason を含む、text がない、text の後ろに別のキーがある等）の場合は None を返します。
+
+    Args:
+        data (str | bytes): 1 イベント分の data
+
+    Returns:
+        str: text の値、ファストパスで扱えない場合は None
+    """
+    if isinstance(data, bytes):
+        return _fast_text_bytes(data)
+    start = data.find(_TEXT_KEY)
+    if start < 0 or data[-2:] != '"}' or _FINISH_KEY in data:
+        return None
+    raw = data[start + 8:-2]
+    if "\\" not in raw:
+        return None if '"' in raw else raw
+    try:
+        return json.loads('"' + raw + '"')
+    except ValueError:
+        return None
+
+
+def _fast_text_bytes(data):
+    start = data.find(_TEXT_KEY_BYTES)
+    if start < 0 or data[-2:] != b'"}' or _FINISH_KEY_BYTES in data:
+        return None
+    raw = data[start + 8:-2]
+    if b"\\" not in raw:
+        return None if b'"' in raw else raw.decode("utf-8")
+    try:
+        return json.loads(b'"' + raw + b'"')
+    except ValueError:
+        return None
+
+
+class CohereStreamDecoder:
+    """
+    SSE のバイト列（またはイベント）を受け取り、text のデルタを順に返すデコーダー。
+    最終イベントを受け取ると result に StreamResult を設定し、以降の入力は無視します。
+    """
+
+    def __init__(self):
+        self._buffer = b""
+        self.result = None
+        self.event_count = 0
+
+    @property
+    def finished(self):
+        return self.result is not None
+
+    def decode_event(self, data):
+        """
+        1 イベント分の data を処理します。
+
+        Returns:
+            str: text のデルタ（デルタがないイベント・最終イベントは None）
+        """
+        self.event_count += 1
+        text = fast_text(data)
+        if text is not None:
+            return text
+        payload = json.loads(data)
+        if "finishReason" in payload:
+            self.result = StreamResult.from_payload(payload)
+            return None
+        return payload.get("text")
+
+    def feed(self, chunk):
+        """
+        受信したバイト列を投入し、完成したイベントの text デルタのリストを返します。
+        チャンクの境界がイベントや UTF-8 の文字の途中にあっても構いません。
+        """
+        deltas = []
+        if self.result is not None:
+            return deltas
+        buffer = self._buffer + chunk if self._buffer else chunk
+        if b"\r" in buffer:
+            buffer = buffer.replace(b"\r\n", b"\n")
+        # 完成したイベントの部分だけをまとめて 1 回でデコードし、C 実装の split でイベント単位に分割する
+        # （イベントの区切りは ASCII なので、UTF-8 の文字の途中で切れることはない）
+        end = buffer.rfind(b"\n\n")
+        if end < 0:
+            self._buffer = buffer
+            return deltas
+        self._buffer = buffer[end + 2:]
+        append = deltas.append
+        for block in buffer[:end].decode("utf-8").split("\n\n"):
+            if block[:6] == "data: " and "\n" not in block:
+                data = block[6:]
+                start = data.find(_TEXT_KEY)
+                if start >= 0 and data[-2:] == '"}' and _FINISH_KEY not in data:
+                    raw = data[start + 8:-2]
+                    if "\\" not in raw and '"' not in raw:
+                        self.event_count += 1
+                        if raw:
+                            append(raw)
+                        continue
+            else:
+                data = "\n".join(line[6:] if line[:6] == "data: " else line[5:]
+                                 for line in block.split("\n") if line[:5] == "data:")
+                if not data:
+                    continue
+            text = self.decode_event(data)
+            if text:
+                append(text)
+            if self.result is not None:
+                break
+        return deltas
+
+    def iter_bytes(self, chunks):
+        """
+        バイト列のイテラブル（GenAiHttpClient の response.data.raw() など）から text デルタを順に返すジェネレーター
+        """
+        for chunk in chunks:
+            yield from self.feed(chunk)
+            if self.result is not None:
+                return
+        if self._buffer.strip():
+            yield from self.feed(b"\n\n")
+
+    async def aiter_bytes(self, chunks):
+        """
+        iter_bytes の非同期イテレーター版（非同期にバイト列を返すストリームに対して使います）
+        """
+        async for chunk in chunks:
+            for text in self.feed(chunk):
+                yield text
+            if self.result is not None:
+                return
+        if self._buffer.strip():
+            for text in self.feed(b"\n\n"):
+                yield text
+
+    def iter_events(self, events):
+        """
+        SSE イベント（event.data が文字列のオブジェクト。OCI SDK の chat_response.data.events() など）から
+        text デルタを順に返すジェネレーター
+        """
+        for event in events:
+            text = self.decode_event(event.data)
+            if text:
+                yield text
+            if self.result is not None:
+                return
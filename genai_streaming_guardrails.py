@@ -0,0 +1,234 @@
+"""
+ストリーミング中のチャット出力に対する逐次的な PII マスキング
+
+AI Guardrails API のノートブックでは、finishReason のイベントまで生成結果を chatbot_message にためてから
+apply_guardrails を呼び出すため、生成とチェックの両方が終わるまで利用者には何も表示されません。
+このモジュールは chat_response.data.events() から届く text デルタをローリングウィンドウにため、
+ウィンドウが埋まるたびにバックグラウンドで apply_guardrails を呼び出し、安全と確認できた先頭部分をマスクしてから順次返します。
+利用者に最初の文字が届くまでの時間はおおよそ TTFT + 1 ウィンドウ分になります。
+
+ウィンドウの末尾 holdback 文字は、チェックした範囲の境界をまたいで途中までしか見えていない個人識別情報があり得るため
+次のチェックまで保留します。holdback は検出したい個人識別情報の最大の長さ（住所など）より大きくしてください。
+
+使い方:
+    decoder = CohereStreamDecoder()
+    guard = StreamingGuardrails(generative_ai_inference_client, compartment_id, window=400, holdback=80)
+    for text in guard.mask(decoder.iter_events(chat_response.data.events())):
+        print(text, end="", flush=True)
+    chatbot_message = guard.masked_text
+"""
+import argparse
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from genai_guardrails_pipeline import PII_TYPES, pii_item_to_detection
+from genai_pii_masking import MASKS, Span, mask_spans, resolve_spans
+
+
+@dataclass
+class StreamingGuardrailsStats:
+    checks: int = 0
+    detections: int = 0
+    first_release: float = None
+    finished: float = None
+
+
+class StreamingGuardrails:
+    """
+    text デルタのストリームを受け取り、PII をマスクした text を順に返すフィルター
+
+    Args:
+        client: GenerativeAiInferenceClient または GenAiHttpClient
+        compartment_id (str): OCI コンパートメントID
+        window (int): 未チェックの文字がこの数たまったらチェックを開始します
+        holdback (int): チェックした範囲の末尾で次のチェックまで保留する文字数
+        context (int): チェック時に前に付ける、すでに出力済みの文字数（文脈による検出漏れを減らします）
+        pii_types (list): 検出する PII のタイプ
+        language_code (str): 出力テキストの言語コード
+        masks (dict): ラベル → マスク文字列の対応表
+    """
+
+    def __init__(self, client, compartment_id, window=400, holdback=80, context=80, pii_types=PII_TYPES,
+                 language_code="en", masks=MASKS):
+        if holdback >= window:
+            raise ValueError("holdback は window より小さくしてください")
+        self.client = client
+        self.compartment_id = compartment_id
+        self.window = window
+        self.holdback = holdback
+        self.context = context
+        self.pii_types = list(pii_types)
+        self.language_code = language_code
+        self.masks = masks
+        self.stats = StreamingGuardrailsStats()
+        self._parts = []
+
+    @property
+    def masked_text(self):
+        """
+        これまでに返したマスク済みのテキスト全体
+        """
+        return "".join(self._parts)
+
+    def check(self, text, start, end):
+        """
+        text[start:end] に対して apply_guardrails を呼び出し、テキスト全体での位置に変換した検出結果を返します。
+        """
+        response = self.client.apply_guardrails(apply_guardrails_details={
+            "input": {"type": "TEXT", "content": text[start:end], "languageCode": self.language_code},
+            "guardrailConfigs": {"personallyIdentifiableInformationConfig": {"types": self.pii_types}},
+            "compartmentId": self.compartment_id,
+        })
+        items = response.data.results.personally_identifiable_information or []
+        return [pii_item_to_detection(item, start) for item in items]
+
+    def mask(self, deltas):
+        """
+        text デルタのイテラブルを受け取り、マスク済みの text を順に返すジェネレーター。
+
+        上流の読み取りは別スレッドで行い、デルタの到着とチェックの完了を 1 つのキューで待つため、
+        チェックが終わった部分は次のデルタを待たずにすぐ返します。
+        """
+        events = queue.Queue()
+        self.stats = StreamingGuardrailsStats()
+        self._parts = []
+        stop = threading.Event()
+
+        def read():
+            try:
+                for delta in deltas:
+                    if stop.is_set():
+                        break
+                    events.put(("delta", delta))
+                events.put(("end", None))
+            except BaseException as error:
+                events.put(("error", error))
+
+        reader = threading.Thread(target=read, name="guardrails-stream-reader", daemon=True)
+        reader.start()
+        buffer = []
+        text = ""
+        released = 0
+        in_flight = None
+        ended = False
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="guardrails-check") as executor:
+            try:
+                while True:
+                    kind, value = events.get()
+                    if kind == "delta":
+                        buffer.append(value)
+                    elif kind == "end":
+                        ended = True
+                    elif kind == "checked":
+                        in_flight = None
+                        start, end, future = value
+                        # 重なり合う検出結果（EMAIL の中の PERSON など）は先に 1 つのスパンにまとめる
+                        spans = resolve_spans(future.result())
+                        self.stats.checks += 1
+                        # ストリームの終わりまでチェックした場合は保留せずにすべて返す
+                        final = ended and end == len(text) + sum(len(part) for part in buffer)
+                        safe = end if final else self.safe_end(spans, released, end - self.holdback)
+                        if safe > released:
+                            yield self.release(text, released, safe, spans)
+                            released = safe
+                        if final:
+                            break
+                    elif kind == "error":
+                        raise value
+                    if buffer:
+                        text += "".join(buffer)
+                        buffer = []
+                    if in_flight is None and (len(text) - released >= self.window or (ended and len(text) > released)):
+                        start = max(0, released - self.context)
+                        end = len(text)
+                        future = executor.submit(self.check, text, start, end)
+                        in_flight = future
+                        future.add_done_callback(lambda f, s=start, e=end: events.put(("checked", (s, e, f))))
+                    elif ended and in_flight is None and len(text) <= released:
+                        break
+            finally:
+                stop.set()
+        self.stats.finished = time.perf_counter()
+
+    def safe_end(self, spans, released, limit):
+        """
+        出力してよい位置を返します。limit（チェックした範囲の末尾から holdback 文字手前）をまたぐスパンがあれば、その先頭まで戻します。
+
+        Args:
+            spans (list): resolve_spans で重なりを統合した offset 順の Span のリスト
+        """
+        safe = max(released, limit)
+        for span in spans:
+            if span.start < safe < span.end:
+                # スパンは互いに重ならないため、戻した位置が別のスパンの途中になることはない
+                return max(released, span.start)
+        return safe
+
+    def release(self, text, start, end, spans):
+        """
+        text[start:end] をマスクして返します。spans は resolve_spans で重なりを統合した Span のリストです。
+        """
+        clipped = []
+        for span in spans:
+            # すでに出力した部分と重なるスパンは、出力していない部分だけをマスクする
+            if span.end <= start or span.start >= end:
+                continue
+            clipped.append(Span(max(span.start, start) - start, min(span.end, end) - start, span.label, span.score))
+        self.stats.detections += len(clipped)
+        masked = mask_spans(text[start:end], clipped, self.masks)
+        if self.stats.first_release is None:
+            self.stats.first_release = time.perf_counter()
+        self._parts.append(masked)
+        return masked
+
+
+def main():
+    from genai_async_engine import build_chat_details
+    from genai_http_client import GenAiHttpClient
+    from genai_mock_server import MockGenAiServer
+    from genai_sse_parser import CohereStreamDecoder
+
+    parser = argparse.ArgumentParser(description="モックサーバーに対するストリーミング PII マスキングの遅延計測")
+    parser.add_argument("--window", type=int, default=400)
+    parser.add_argument("--holdback", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--guardrails-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    response_text = ("Here is the summary of the stream. The streamer Ethan Hunt welcomed viewers and played stealth games. "
+                     "Fan mail goes to 456 Oak Avenue, Los Angeles, CA 90210, business inquiries to 123-456-7890, "
+                     "and collaboration proposals to ethan.hunt.vtuber@streammail.net. ") * args.repeat
+    with MockGenAiServer(response_text=response_text, first_token_delay=0.2, token_delay=args.token_delay,
+                         guardrails_delay=args.guardrails_delay) as server:
+        client = GenAiHttpClient(server.endpoint)
+        compartment_id = "ocid1.compartment.oc1..mock"
+
+        # 従来の方法: 生成結果をすべてためてから apply_guardrails を呼び出す
+        start = time.perf_counter()
+        response = client.chat(build_chat_details("要約してください", is_stream=True))
+        decoder = CohereStreamDecoder()
+        chatbot_message = "".join(decoder.iter_events(response.data.events()))
+        guard = StreamingGuardrails(client, compartment_id, window=args.window, holdback=args.holdback)
+        buffered = mask_spans(chatbot_message, resolve_spans(guard.check(chatbot_message, 0, len(chatbot_message))))
+        buffered_first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.chat(build_chat_details("要約してください", is_stream=True))
+        decoder = CohereStreamDecoder()
+        streamed = "".join(guard.mask(decoder.iter_events(response.data.events())))
+        streamed_first = guard.stats.first_release - start
+        streamed_total = guard.stats.finished - start
+        client.close()
+
+    assert streamed == buffered, "ストリーミングと一括チェックでマスク結果が一致しません"
+    print(f"chars: {len(chatbot_message)}, checks: {guard.stats.checks}, masked spans: {guard.stats.detections}")
+    print(f"buffered  : first output after {buffered_first:.3f} sec")
+    print(f"streaming : first output after {streamed_first:.3f} sec, last output after {streamed_total:.3f} sec")
+
+
+if __name__ == "__main__":
+    main()
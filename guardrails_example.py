@@ -1,18 +1,18 @@
-import oci
 import os
-from dotenv import load_dotenv, find_dotenv
 import uuid
 
-_ = load_dotenv(find_dotenv())
+from genai_client_factory import get_client, inference_models, load_environment
+
+load_environment()
 
 CONFIG_PROFILE = "DEFAULT"
-config = oci.config.from_file(file_location='~/.oci/config', profile_name=CONFIG_PROFILE)
-config["region"] = "us-chicago-1"
 
 compartment_id = os.getenv("OCI_COMPARTMENT_ID") 
 model_id = "cohere.command-a-03-2025"
 
-generative_ai_inference_client = oci.generative_ai_inference.GenerativeAiInferenceClient(config=config, retry_strategy=oci.retry.NoneRetryStrategy(), timeout=(10,240))
+# 構成ファイル・署名オブジェクト・クライアントはプロファイルとリージョンごとにキャッシュされます
+generative_ai_inference_client = get_client(profile=CONFIG_PROFILE, region="us-chicago-1")
+models = inference_models()
 
 INPUT_TEXT = "yuji.arakawa@oracle.com"
 PII_TYPES = ["EMAIL"]
@@ -21,13 +21,13 @@ opc_request_id = str(uuid.uuid4())
 print(f"opc_request_id: {opc_request_id}")
 
 apply_guardrails_response = generative_ai_inference_client.apply_guardrails(
-    apply_guardrails_details=oci.generative_ai_inference.models.ApplyGuardrailsDetails(
-        input=oci.generative_ai_inference.models.GuardrailsTextInput(
+    apply_guardrails_details=models.ApplyGuardrailsDetails(
+        input=models.GuardrailsTextInput(
             type="TEXT",
             content=INPUT_TEXT,
             language_code="en"), # en | es | en-US | zh-CN
-        guardrail_configs=oci.generative_ai_inference.models.GuardrailConfigs(
-            personally_identifiable_information_config=oci.generative_ai_inference.models.PersonallyIdentifiableInformationConfiguration(
+        guardrail_configs=models.GuardrailConfigs(
+            personally_identifiable_information_config=models.PersonallyIdentifiableInformationConfiguration(
                 types=PII_TYPES)),
         compartment_id=compartment_id),
     opc_request_id=opc_request_id)
@@ -8,14 +8,14 @@
 # - os ：オペレーティングシステムへのアクセスを提供するライブラリ（標準ライブラリ : https://docs.python.org/ja/3/library/os.html ）
 # - time : 時刻データへのアクセスと変換（標準ライブラリ : https://docs.python.org/ja/3/library/time.html ）
 # - dotenv : 環境変数を管理するためのライブラリ（python-dotenv : https://pypi.org/project/python-dotenv/ ）
-# - json ：JSON エンコーダーとデコーダー（標準ライブラリ : https://docs.python.org/ja/3/library/json.html ）
+# - genai_sse_parser ：ストリーミング応答（server-sent events）のデコーダー（このリポジトリの genai_sse_parser.py）
 
 # %%
 import oci
 import os
 import time
 from dotenv import load_dotenv, find_dotenv
-import json
+from genai_sse_parser import CohereStreamDecoder, StreamResult
 
 # %% [markdown]
 # ## 環境変数設定
@@ -173,34 +173,26 @@ chat_response = generative_ai_inference_client.chat(chat_detail)
 
 # %% [markdown]
 # ## チャット応答を表示
+# CohereStreamDecoder : トークンごとのイベントは text の値だけを切り出し、finishReason を含む最終イベントだけを JSON としてパースします。
+# - iter_events : text のデルタを順に返すジェネレーター
+# - result : 最終イベントの内容（text, finish_reason, chat_history, citations, prompt）
 
 # %%
 #print("**************************Chat Response*********************************")
 #print(f"chat_response:\n{vars(chat_response)}")
 
 print("**************************Streaming Chat Response**************************")
-chat_history = []
-chatbot_message = ""
-citations = []
-finish_reason = ""
-prompt = ""
-for event in chat_response.data.events():
-    res = json.loads(event.data)
+decoder = CohereStreamDecoder()
+for text in decoder.iter_events(chat_response.data.events()):
     if first_token_time is None:
         first_token_time = time.perf_counter()
-    if 'finishReason' in res.keys():
-        finish_reason = res['finishReason']
-        if 'chatHistory' in res:
-            chat_history = res['chatHistory']
-        if 'text' in res:
-            chatbot_message = res['text']
-        if 'citations' in res:
-            citations = res['citations']
-        if 'prompt' in res:
-            prompt = res['prompt']
-        break
-    if 'text' in res:
-        print(res['text'], end="", flush=True)
+    print(text, end="", flush=True)
+result = decoder.result or StreamResult()
+chat_history = result.chat_history
+chatbot_message = result.text
+citations = result.citations
+finish_reason = result.finish_reason
+prompt = result.prompt
 print("\n")
 end_time = time.perf_counter() 
 elapsed_time = end_time - start_time
@@ -0,0 +1,74 @@
+import json
+
+from genai_batch_runner import BatchJob, Checkpoint
+from genai_http_client import GenAiHttpClient
+from genai_mock_server import DEFAULT_RESPONSE_TEXT, MockGenAiServer
+
+COMPARTMENT_ID = "ocid1.compartment.oc1..mock"
+
+
+def write_input(path, rows, blank_every=None):
+    with open(path, "w", encoding="utf-8") as f:
+        for index, row in enumerate(rows):
+            f.write((row if isinstance(row, str) else json.dumps(row, ensure_ascii=False)) + "\n")
+            if blank_every and index % blank_every == blank_every - 1:
+                f.write("\n")
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_max_rows_does_not_count_blank_lines(tmp_path):
+    input_path, output_path = str(tmp_path / "input.jsonl"), str(tmp_path / "output.jsonl")
+    write_input(input_path, [{"id": f"q-{index}", "message": f"質問 {index}"} for index in range(40)], blank_every=1)
+    with MockGenAiServer(first_token_delay=0.05) as server:
+        client = GenAiHttpClient(server.endpoint, pool_maxsize=8)
+        job = BatchJob(client, COMPARTMENT_ID, input_path, output_path, max_concurrency=8, progress=None)
+        progress = job.run(max_rows=10)
+        client.close()
+    assert progress.rows == 10
+    assert [result["id"] for result in read_output(output_path)] == [f"q-{index}" for index in range(10)]
+
+
+def test_resume_after_interruption_writes_each_row_once_in_order(tmp_path):
+    input_path, output_path = str(tmp_path / "input.jsonl"), str(tmp_path / "output.jsonl")
+    rows = [{"id": f"q-{index}", "message": f"Oracle Database の機能 {index} について"} for index in range(60)]
+    rows[25] = "{not json"
+    write_input(input_path, rows, blank_every=7)
+    with MockGenAiServer(first_token_delay=0.01) as server:
+        client = GenAiHttpClient(server.endpoint, pool_maxsize=4)
+        job = BatchJob(client, COMPARTMENT_ID, input_path, output_path, max_concurrency=4, checkpoint_every=8,
+                       progress=None)
+        job.run(max_rows=30)
+        assert not Checkpoint.load(job.checkpoint_path).completed
+        # チェックポイントの後に書きかけた結果は、再開時に切り詰められる
+        with open(output_path, "ab") as f:
+            f.write(b'{"line":')
+        summary = job.run().summary()
+        client.close()
+    results = read_output(output_path)
+    assert [result["line"] for result in results] == list(range(60))
+    assert summary["resumed_rows"] == 30
+    assert results[25]["error"]["code"] == "InvalidJson"
+    assert summary["errors"] == 1
+    assert all(result["text"] == DEFAULT_RESPONSE_TEXT for result in results if "error" not in result)
+    assert server.request_count == 59
+    assert Checkpoint.load(job.checkpoint_path).completed
+    # 完了したジョブをもう一度実行しても何もしない
+    assert job.run().rows == 60
+
+
+def test_guardrails_mode(tmp_path):
+    input_path, output_path = str(tmp_path / "input.jsonl"), str(tmp_path / "output.jsonl")
+    write_input(input_path, [{"id": f"t-{index}", "text": f"Contact {index}: Ethan Hunt, ethan{index}@example.com"}
+                             for index in range(10)])
+    with MockGenAiServer() as server:
+        client = GenAiHttpClient(server.endpoint)
+        BatchJob(client, COMPARTMENT_ID, input_path, output_path, mode="guardrails", progress=None).run()
+        client.close()
+    results = read_output(output_path)
+    assert [result["id"] for result in results] == [f"t-{index}" for index in range(10)]
+    labels = {item["label"] for result in results for item in result["results"]["personallyIdentifiableInformation"]}
+    assert {"PERSON", "EMAIL"} <= labels
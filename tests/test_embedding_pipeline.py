@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+from genai_embedding_pipeline import EmbeddingPipeline, VectorStore
+from genai_http_client import GenAiHttpClient
+from genai_mock_server import MockGenAiServer, mock_embedding
+from genai_retrieval import StubEmbedder, document_text, normalize_rows, synthetic_documents
+
+COMPARTMENT_ID = "ocid1.compartment.oc1..mock"
+
+
+def test_stub_embedder_matches_mock_server_embedding():
+    texts = [document_text(document) for document in synthetic_documents(20)] + ["東京 abc-12 x", ""]
+    expected = np.array([mock_embedding(text, 64) for text in texts], dtype=np.float32)
+    assert np.allclose(normalize_rows(StubEmbedder(64).embed(texts)), expected, atol=1e-5)
+
+
+def test_synthetic_documents_are_deterministic():
+    assert list(synthetic_documents(5, seed=3)) == list(synthetic_documents(5, seed=3))
+    assert list(synthetic_documents(5, seed=3)) != list(synthetic_documents(5, seed=4))
+
+
+def test_pipeline_reuses_the_persisted_cache(tmp_path):
+    texts = [document_text(document) for document in synthetic_documents(150)]
+    items = [(f"doc-{index}", text) for index, text in enumerate(texts + texts[:10])]
+    with MockGenAiServer() as server:
+        client = GenAiHttpClient(server.endpoint)
+        store = VectorStore(str(tmp_path))
+        pipeline = EmbeddingPipeline(client, COMPARTMENT_ID, store, max_concurrency=2)
+        stats = pipeline.run(items).summary()
+        assert stats["embedded"] == server.embed_input_count == 150
+        store.close()
+
+        # 書き込みの途中で止まった ids.jsonl の末尾の行は、開き直したときに切り捨てる
+        with open(os.path.join(str(tmp_path), "ids.jsonl"), "ab") as f:
+            f.write(b'{"id": "doc-torn", "ke')
+        store = VectorStore(str(tmp_path))
+        pipeline.store = store
+        changed = items[:-1] + [(items[-1][0], "新しいドキュメントの本文です。")]
+        stats = pipeline.run(changed).summary()
+        assert stats["embedded"] == 1
+        assert server.embed_input_count == 151
+        assert "doc-torn" not in store.ids
+        expected = np.asarray(mock_embedding("新しいドキュメントの本文です。", server.embed_dimensions), dtype=np.float32)
+        assert np.allclose(pipeline.vector(items[-1][0]), expected, atol=1e-6)
+        assert np.allclose(pipeline.vector("doc-0"), mock_embedding(texts[0], server.embed_dimensions), atol=1e-6)
+        store.close()
+        client.close()
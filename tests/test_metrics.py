@@ -0,0 +1,37 @@
+import pytest
+
+from genai_async_engine import build_chat_details, percentile
+from genai_http_client import GenAiHttpClient
+from genai_metrics import HdrHistogram, MetricsRegistry, instrument
+from genai_mock_server import MockGenAiServer
+
+
+@pytest.mark.parametrize("count", [1, 2, 7, 20, 31, 100, 101])
+def test_histogram_percentile_is_nearest_rank(count):
+    values = list(range(1, count + 1))
+    histogram = HdrHistogram()
+    for value in values:
+        histogram.record(value)
+    for q in (0, 1, 5, 25, 50, 90, 95, 99, 99.9, 100):
+        assert histogram.percentile(q) == percentile(values, q), (count, q)
+
+
+def test_histogram_p95_of_31_samples():
+    histogram = HdrHistogram()
+    for value in range(1, 32):
+        histogram.record(value)
+    # 順位は ceil(0.95 * 31) = 30
+    assert histogram.percentile(95) == 30
+
+
+def test_instrumented_stream_records_ttft_and_tokens():
+    registry = MetricsRegistry()
+    with MockGenAiServer(first_token_delay=0.05) as server:
+        client = GenAiHttpClient(server.endpoint)
+        with instrument(client, registry, region="mock"):
+            response = client.chat(build_chat_details("質問", is_stream=True))
+            events = list(response.data.events())
+        client.close()
+    assert events
+    ttft = registry.histogram("genai_time_to_first_token_seconds", "chat", "cohere.command-a-03-2025", "mock")
+    assert ttft.count == 1 and ttft.percentile(50) >= 0.05
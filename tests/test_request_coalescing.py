@@ -0,0 +1,64 @@
+from genai_async_engine import build_chat_details
+from genai_http_client import GenAiHttpClient
+from genai_mock_server import DEFAULT_RESPONSE_TEXT, MockGenAiServer
+from genai_request_coalescing import CoalescingClient, run_workers
+from genai_sse_parser import CohereStreamDecoder
+
+WORKERS = 16
+DISTINCT = 2
+
+
+def test_non_stream_callers_share_one_call_but_not_the_response_object():
+    with MockGenAiServer(first_token_delay=0.2) as server:
+        base = GenAiHttpClient(server.endpoint, pool_maxsize=WORKERS)
+        client = CoalescingClient(base)
+        results, _ = run_workers(WORKERS, lambda index: client.chat(
+            build_chat_details(f"Oracle Database の機能 {index % DISTINCT} について")))
+        base.close()
+    assert not [result for result in results if isinstance(result, Exception)]
+    assert server.request_count == client.stats.upstream_calls == DISTINCT
+    assert client.stats.coalesced == WORKERS - DISTINCT
+    assert client.coalescer.in_flight() == 0
+    # 呼び出し側ごとに別の data を受け取るため、1 つを変更しても他の呼び出し側には影響しない
+    assert len({id(result.data) for result in results}) == WORKERS
+    results[0].data.to_dict()["chatResponse"]["text"] = "changed"
+    assert all(result.data.chat_response.text == DEFAULT_RESPONSE_TEXT for result in results[1:])
+
+
+def test_late_joiners_receive_the_whole_stream():
+    def stream(index):
+        response = client.chat(build_chat_details("Oracle Database の機能について", is_stream=True))
+        decoder = CohereStreamDecoder()
+        deltas = [decoder.decode_event(event.data) for event in response.data.events()]
+        assert decoder.finished
+        return "".join(text for text in deltas if text)
+
+    with MockGenAiServer(first_token_delay=0.05, token_delay=0.01) as server:
+        base = GenAiHttpClient(server.endpoint, pool_maxsize=WORKERS)
+        client = CoalescingClient(base)
+        results, _ = run_workers(WORKERS, stream, stagger=0.01)
+        base.close()
+    assert results == [DEFAULT_RESPONSE_TEXT] * WORKERS
+    assert server.request_count == client.stats.upstream_calls
+    assert client.stats.late_joins > 0
+    assert client.coalescer.in_flight() == 0
+
+
+def test_abandoned_stream_closes_upstream_and_is_not_reused():
+    with MockGenAiServer(token_delay=0.01) as server:
+        base = GenAiHttpClient(server.endpoint)
+        client = CoalescingClient(base)
+        details = build_chat_details("Oracle Database の機能について", is_stream=True)
+        response = client.chat(details)
+        events = response.data.events()
+        next(events)
+        events.close()
+        assert client.stats.abandoned_streams == 1
+        assert client.coalescer.in_flight() == 0
+        # 閉じた上流のストリームには参加せず、新しく上流を呼び出す
+        decoder = CohereStreamDecoder()
+        for event in client.chat(details).data.events():
+            decoder.decode_event(event.data)
+        base.close()
+    assert decoder.result.payload["text"] == DEFAULT_RESPONSE_TEXT
+    assert client.stats.upstream_calls == 2
@@ -0,0 +1,44 @@
+from genai_async_engine import AsyncChatEngine, build_chat_details, job_kind
+from genai_http_client import GenAiHttpClient
+from genai_metrics import MetricsRegistry, instrument
+from genai_mock_server import DEFAULT_RESPONSE_TEXT, MockGenAiServer
+from genai_request_template import ChatTemplate
+from genai_resilience import is_stream_request, rate_limit_key
+from genai_response_cache import CachingChatClient, ResponseCache, cache_key, is_deterministic
+
+
+def deterministic_details(message):
+    details = build_chat_details(message)
+    details["chatRequest"]["temperature"] = 0
+    return details
+
+
+def test_rendered_body_matches_dict_for_helpers():
+    template = ChatTemplate(deterministic_details(""))
+    body = template.render("こんにちは")
+    details = deterministic_details("こんにちは")
+    assert cache_key(body) == cache_key(details)
+    assert is_deterministic(body)
+    assert job_kind(body) == "chat"
+    assert rate_limit_key(body) == rate_limit_key(details)
+    assert is_stream_request(template.variant(is_stream=True).render("x"))
+
+
+def test_rendered_body_through_cache_metrics_and_engine():
+    template = ChatTemplate(deterministic_details(""))
+    registry = MetricsRegistry()
+    with MockGenAiServer() as server:
+        base = GenAiHttpClient(server.endpoint)
+        client = CachingChatClient(base, ResponseCache())
+        with instrument(base, registry, region="mock"):
+            first = client.chat(template.render("質問"))
+            second = client.chat(template.render("質問"))
+        with AsyncChatEngine(client, max_concurrency=2) as engine:
+            results = engine.run_sync([template.render("質問"), template.render("別の質問")])
+        base.close()
+    assert first.data.chat_response.text == DEFAULT_RESPONSE_TEXT
+    assert second.headers.get("x-cache") == "HIT"
+    assert [result.kind for result in results] == ["chat", "chat"]
+    assert all(result.error is None for result in results)
+    assert server.request_count == 2
+    assert "genai_request_latency_seconds" in registry.to_prometheus()
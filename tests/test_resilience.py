@@ -0,0 +1,53 @@
+from genai_async_engine import build_chat_details, percentile
+from genai_http_client import GenAiHttpClient
+from genai_mock_server import MockGenAiServer
+from genai_resilience import BackoffPolicy, RateLimiter, ResilientClient, rate_limit_key
+
+
+def slow_calls(throttle):
+    # 遅延スパイクだけのモックサーバーで、学習済みのしきい値を超える呼び出しを作る
+    with MockGenAiServer(first_token_delay=0.01, spike_rate=1.0, spike_delay=0.1) as server:
+        base = GenAiHttpClient(server.endpoint, pool_maxsize=8)
+        limiter = RateLimiter(1000)
+        client = ResilientClient(base, region="mock", rate_limiter=limiter, backoff=BackoffPolicy(base=0.01, seed=0),
+                                 hedge_quantile=50, hedge_budget=1.0)
+        for _ in range(40):
+            client.latency["chat"].record(0.01)
+        details = build_chat_details("質問")
+        bucket = limiter.bucket(rate_limit_key(details))
+        if throttle:
+            bucket.throttle(0.0)
+        for _ in range(5):
+            client.chat(details)
+        client.close()
+        base.close()
+    return client.stats
+
+
+def test_hedges_slow_calls_when_not_throttled():
+    stats = slow_calls(throttle=False)
+    assert stats.hedges > 0
+
+
+def test_no_hedge_while_rate_limiter_is_throttled():
+    stats = slow_calls(throttle=True)
+    assert stats.calls == 5 and stats.hedges == 0
+
+
+def test_retries_429_against_mock_server():
+    with MockGenAiServer(error_rate=0.3, error_status=429, retry_after=0.01, seed=3) as server:
+        base = GenAiHttpClient(server.endpoint)
+        client = ResilientClient(base, region="mock", rate_limiter=RateLimiter(1000),
+                                 backoff=BackoffPolicy(base=0.01, max_attempts=10, seed=0))
+        for index in range(20):
+            client.chat(build_chat_details(f"質問 {index}"))
+        base.close()
+    assert client.stats.throttled == server.error_count > 0
+    assert client.stats.retries == client.stats.throttled
+
+
+def test_percentile_nearest_rank():
+    values = list(range(100))
+    assert percentile(values, 95) == 94
+    assert percentile(values, 100) == 99
+    assert percentile([], 50) == 0.0
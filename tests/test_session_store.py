@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from genai_async_engine import build_chat_details
+from genai_http_client import GenAiHttpClient
+from genai_mock_server import MockGenAiServer
+from genai_session_store import SessionStore, SqliteSessionBackend, estimate_tokens
+
+
+def recording_summarizer(calls, summary_chars=None):
+    def summarize(previous, dropped):
+        calls.append(list(dropped))
+        text = "\n".join(filter(None, [previous] + [message for _, message in dropped]))
+        return text if summary_chars is None else text[-summary_chars:]
+    return summarize
+
+
+def test_every_evicted_turn_is_summarized_and_summary_is_budgeted():
+    calls = []
+    store = SessionStore(max_tokens=120, summarizer=recording_summarizer(calls))
+    session = store.get("s1", system="system")
+    for turn in range(30):
+        store.record(session, f"question {turn} " * 5, f"answer {turn} " * 5)
+    chat_history, report = store.prepare(session, "next question")
+    evicted = [message for batch in calls for _, message in batch]
+    kept = [item["message"] for item in chat_history if item["role"] != "SYSTEM"]
+    # 削除したメッセージはすべて要約に渡され、保持しているメッセージと合わせると元の会話になる
+    assert len(evicted) == report.dropped
+    assert len(evicted) + len(kept) == 60
+    assert report.summarized
+    assert report.history_tokens <= 120
+    assert sum(estimate_tokens(item["message"]) for item in chat_history) + estimate_tokens("next question") <= 120
+
+
+def test_summary_alone_over_budget_is_trimmed():
+    store = SessionStore(max_tokens=60, summarizer=lambda previous, dropped: "summary " * 200)
+    session = store.get("s2")
+    for turn in range(5):
+        store.record(session, f"question {turn} " * 5, f"answer {turn} " * 5)
+    _, report = store.prepare(session, "next")
+    assert report.history_tokens <= 60
+    assert session.summary is None or len(session.summary) < len("summary " * 200)
+
+
+def test_failed_save_rolls_back_and_backend_stays_usable(tmp_path):
+    backend = SqliteSessionBackend(str(tmp_path / "sessions.sqlite3"))
+    store = SessionStore(path=None)
+    session = store.get("s3")
+    store.record(session, "hello", "hi")
+    with pytest.raises(sqlite3.Error):
+        # message が NOT NULL の列に None を入れて途中で失敗させる
+        backend.save(session, [(0, "USER", None)])
+    backend.save(session, [(0, "USER", "hello"), (1, "CHATBOT", "hi")])
+    loaded = backend.load("s3")
+    assert list(loaded.messages()) == [("USER", "hello"), ("CHATBOT", "hi")]
+    backend.close()
+
+
+def test_persistent_session_against_mock_server(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    with MockGenAiServer() as server:
+        client = GenAiHttpClient(server.endpoint)
+        store = SessionStore(max_tokens=400, summarizer=recording_summarizer([], 200), path=path)
+        session = store.get("s4", system="system")
+        for turn in range(10):
+            message = f"質問 {turn}"
+            chat_history, report = store.prepare(session, message)
+            details = build_chat_details(message)
+            details["chatRequest"]["chatHistory"] = chat_history
+            response = client.chat(details)
+            store.record(session, message, response.data.chat_response.text)
+            assert report.history_tokens <= 400
+        store.close()
+        client.close()
+    reopened = SessionStore(max_tokens=400, path=path)
+    loaded = reopened.get("s4")
+    assert loaded.turns == 10 and loaded.summary == session.summary
+    assert list(loaded.messages()) == list(session.messages())
+    reopened.close()
@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+from genai_mock_server import MockGenAiServer
+from genai_sse_gateway import AsyncUpstream, SseGateway
+
+
+async def read_stream(host, port, message):
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps({"message": message}).encode("utf-8")
+    writer.write(b"POST /chat HTTP/1.1\r\nhost: gateway\r\ncontent-length: %d\r\n\r\n" % len(body) + body)
+    data = await reader.read()
+    writer.close()
+    return data
+
+
+def run_clients(buffer_events, clients):
+    async def main():
+        with MockGenAiServer(response_text="Oracle Database " * 20, token_chars=4) as server:
+            gateway = SseGateway(AsyncUpstream(server.endpoint), "ocid1.compartment.oc1..mock",
+                                 buffer_events=buffer_events)
+            await gateway.start()
+            host, port = gateway.server.sockets[0].getsockname()[:2]
+            try:
+                responses = await asyncio.wait_for(
+                    asyncio.gather(*[read_stream(host, port, f"q{index}") for index in range(clients)]), 10)
+            finally:
+                await gateway.close()
+            return responses, gateway.stats
+
+    return asyncio.run(main())
+
+
+def test_stream_ends_when_last_frame_fills_the_queue():
+    # buffer_events=1 では最後のフレームで必ずキューが満杯になり、終了の印が入らない
+    responses, stats = run_clients(buffer_events=1, clients=3)
+    for response in responses:
+        assert response.startswith(b"HTTP/1.1 200")
+        assert b'"finishReason"' in response
+    assert stats.completed == 3
+    assert stats.active_streams == 0
+
+
+def test_stream_relays_all_tokens():
+    responses, stats = run_clients(buffer_events=64, clients=2)
+    for response in responses:
+        events = [block for block in response.split(b"\r\n\r\n", 1)[1].split(b"\n\n") if block]
+        text = "".join(json.loads(event[len(b"data: "):]).get("text", "") for event in events[:-1])
+        assert text == "Oracle Database " * 20
+    assert stats.active_streams == 0
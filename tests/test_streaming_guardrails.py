@@ -0,0 +1,58 @@
+import pytest
+
+from genai_async_engine import build_chat_details
+from genai_guardrails_pipeline import Detection
+from genai_http_client import GenAiHttpClient, HttpResponse, WireObject
+from genai_mock_server import MockGenAiServer
+from genai_pii_masking import mask_spans, resolve_spans
+from genai_sse_parser import CohereStreamDecoder
+from genai_streaming_guardrails import StreamingGuardrails
+
+RESPONSE_TEXT = ("The streamer Ethan Hunt welcomed viewers. Fan mail goes to 456 Oak Avenue, "
+                 "and collaboration proposals to ethan.hunt.vtuber@streammail.net. ") * 6
+
+
+class OverlappingClient:
+    """
+    EMAIL の検出結果の中に PERSON、EMAIL の末尾をまたぐ ADDRESS を追加して返すクライアント
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def apply_guardrails(self, apply_guardrails_details, **kwargs):
+        response = self.client.apply_guardrails(apply_guardrails_details=apply_guardrails_details, **kwargs)
+        data = response.data.to_dict()
+        items = data["results"]["personallyIdentifiableInformation"]
+        for item in list(items):
+            if item["label"] == "EMAIL":
+                items.append(dict(item, label="PERSON", length=10, text=item["text"][:10]))
+                items.append(dict(item, label="ADDRESS", offset=item["offset"] + 20, length=item["length"],
+                                  text=""))
+        return HttpResponse(response.status, response.headers, WireObject(data))
+
+
+@pytest.mark.parametrize("window,holdback", [(60, 20), (120, 40), (400, 80)])
+def test_overlapping_detections_are_masked_once(window, holdback):
+    with MockGenAiServer(response_text=RESPONSE_TEXT, token_chars=5) as server:
+        base = GenAiHttpClient(server.endpoint)
+        client = OverlappingClient(base)
+        guard = StreamingGuardrails(client, "ocid1.compartment.oc1..mock", window=window, holdback=holdback,
+                                    context=40)
+        expected = mask_spans(RESPONSE_TEXT, resolve_spans(guard.check(RESPONSE_TEXT, 0, len(RESPONSE_TEXT))))
+        response = base.chat(build_chat_details("要約してください", is_stream=True))
+        decoder = CohereStreamDecoder()
+        streamed = "".join(guard.mask(decoder.iter_events(response.data.events())))
+        base.close()
+    assert "ethan.hunt" not in streamed and "streammail" not in streamed
+    assert streamed == expected
+
+
+def test_safe_end_uses_merged_spans():
+    guard = StreamingGuardrails(None, "ocid1.compartment.oc1..mock")
+    spans = resolve_spans([Detection(0, 15, "PERSON", 0.9, ""), Detection(10, 20, "EMAIL", 0.9, "")])
+    assert len(spans) == 1
+    assert guard.safe_end(spans, 0, 20) == 0